@@ -2,6 +2,10 @@
 ASGI config for parcial1 project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with e.g. ``WEB_CONCURRENCY=4 uvicorn parcial1.asgi:application`` so that async
+views such as ``iniciar_pago_async`` do not block a worker while waiting on Stripe.
+Set the worker count through WEB_CONCURRENCY (not ``--workers``) so settings can check
+that the ``auth`` cache is shared between them.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +16,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'parcial1.settings')
+# Cambia defaults de settings que dependen del servidor (DB_CONN_MAX_AGE)
+os.environ.setdefault('SERVIDOR_ASGI', 'True')
 
 application = get_asgi_application()
@@ -13,6 +13,7 @@ import os
 from pathlib import Path
 from datetime import timedelta
 from decouple import config, Csv
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'quickstart',
     'rest_framework_simplejwt.token_blacklist',
@@ -46,6 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primero, para medir la request completa (ver /metrics)
+    'quickstart.metricas.MetricasMiddleware',
+    # Elige primario o replica para la request (ver DB_REPLICAS)
+    'quickstart.replicas.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -81,21 +87,68 @@ WSGI_APPLICATION = 'parcial1.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Conexiones: con DB_POOL un pool de psycopg 3 por proceso (requiere psycopg[pool]); si no,
+# conexiones persistentes de DB_CONN_MAX_AGE segundos. En ambos casos se verifican antes de usarlas.
+# Bajo ASGI (parcial1/asgi.py define SERVIDOR_ASGI) cada request async puede correr en otro
+# hilo y las conexiones persistentes por hilo no se reutilizan ni se cierran a tiempo: ahi
+# DB_CONN_MAX_AGE vale 0 por defecto y conviene DB_POOL.
+DB_POOL = config('DB_POOL', default=False, cast=bool)
+SERVIDOR_ASGI = config('SERVIDOR_ASGI', default=False, cast=bool)
+
+
+def _base_de_datos(host, port):
+    base = {
         'ENGINE': 'django.db.backends.postgresql',
         'USER': config('DB_USER'),
         'PASSWORD': config('DB_PASSWORD'),
         'NAME': config('DB_NAME'),
-        'HOST': config('DB_HOST', default='localhost'),
-        'PORT': config('DB_PORT', default='5432'),
+        'HOST': host,
+        'PORT': port,
     }
+    if DB_POOL:
+        # requirements.txt instala psycopg2, que no soporta OPTIONS['pool']
+        try:
+            import psycopg  # noqa: F401
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            raise ImproperlyConfigured('DB_POOL requiere psycopg 3 con pool: pip install "psycopg[binary,pool]".')
+
+        base['CONN_MAX_AGE'] = 0  # Django exige 0 con pool: el pool decide cuanto vive cada conexion
+        base['OPTIONS'] = {'pool': {
+            'min_size': config('DB_POOL_MIN', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+            'check': ConnectionPool.check_connection,
+        }}
+    else:
+        base['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=0 if SERVIDOR_ASGI else 60, cast=int)
+        base['CONN_HEALTH_CHECKS'] = True
+    return base
+
+
+DATABASES = {
+    'default': _base_de_datos(config('DB_HOST', default='localhost'), config('DB_PORT', default='5432')),
 }
+# Replicas de lectura 'host[:puerto]' separadas por coma, como alias replica1, replica2...
+# (quickstart.replicas). Para probar en local alcanza con apuntar una al mismo servidor.
+for _numero, _replica in enumerate(config('DB_REPLICAS', default='', cast=Csv()), 1):
+    _host, _, _port = _replica.partition(':')
+    DATABASES[f'replica{_numero}'] = _base_de_datos(_host, _port or config('DB_PORT', default='5432'))
+    DATABASES[f'replica{_numero}']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['quickstart.replicas.ReplicaRouter']
+# Lecturas (GET/HEAD/OPTIONS) que pueden ir a una replica, por prefijo de ruta, y segundos
+# que un usuario sigue leyendo del primario despues de escribir (lee sus propias escrituras)
+DB_REPLICA_RUTAS = ['/api/productos/', '/api/categorias/', '/api/sucursales/', '/api/pedidos/', '/api/analitica/', '/api/exportar/']
+DB_REPLICA_STICKY_SEGUNDOS = config('DB_REPLICA_STICKY_SEGUNDOS', default=10, cast=int)
 
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+# Hilos para hashear passwords en login/registro async (quickstart.hashing); uno por nucleo
+HASH_WORKERS = config('HASH_WORKERS', default=os.cpu_count() or 1, cast=int)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -136,15 +189,62 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'quickstart.pagination.OptionalCountPageNumberPagination',
     'PAGE_SIZE': 20,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'quickstart.autenticacion.CachedJWTAuthentication',
+    ),
+    # Los mismos de DRF, midiendo el tiempo de render para /metrics (drf_render_seconds)
+    'DEFAULT_RENDERER_CLASSES': (
+        'quickstart.metricas.JSONRendererMedido',
+        'quickstart.metricas.BrowsableAPIRendererMedido',
+    ),
+}
+
+# Cache de lecturas del catalogo (productos, categorias, sucursales).
+# Por defecto LRU en memoria del proceso; con varios workers usar un servidor compartido, ej.
+# CATALOGO_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CATALOGO_CACHE_LOCATION=redis://127.0.0.1:6379/1
+CATALOGO_CACHE_BACKEND = config('CATALOGO_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogo': {
+        'BACKEND': CATALOGO_CACHE_BACKEND,
+        'LOCATION': config('CATALOGO_CACHE_LOCATION', default='catalogo'),
+        'OPTIONS': {'MAX_ENTRIES': 10000} if CATALOGO_CACHE_BACKEND.endswith('LocMemCache') else {},
+    },
+    # Usuarios resueltos por quickstart.autenticacion y JTIs revocados. Con varios workers
+    # tiene que ser compartido (Redis), si no un logout solo se ve en el proceso que lo atendio
+    'auth': {
+        'BACKEND': config('AUTH_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('AUTH_CACHE_LOCATION', default='auth'),
+    },
 }
+# Procesos del servidor (gunicorn y uvicorn toman WEB_CONCURRENCY como cantidad de workers).
+# Con mas de uno un cache 'auth' en memoria dejaria revocaciones y desactivaciones en un solo proceso
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+if WEB_CONCURRENCY > 1 and CACHES['auth']['BACKEND'].endswith(('LocMemCache', 'DummyCache')):
+    raise ImproperlyConfigured('Con WEB_CONCURRENCY > 1 el cache auth debe ser compartido: configure AUTH_CACHE_BACKEND (p. ej. Redis).')
+CATALOGO_CACHE_TTL = config('CATALOGO_CACHE_TTL', default=300, cast=int)
+# Segundos que se reutiliza un usuario autenticado sin volver a leerlo de la base
+AUTH_USUARIO_TTL = config('AUTH_USUARIO_TTL', default=60, cast=int)
+
+# Limites de los tramos de precio para las facetas de /api/productos/buscar/
+BUSQUEDA_RANGOS_PRECIO = [0, 50, 100, 500, 1000]
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+# Delegar el envio de /media/ al servidor web: '' (FileResponse), 'x-sendfile' (Apache
+# mod_xsendfile) o 'x-accel-redirect' (nginx, con un location internal en MEDIA_ACCEL_PREFIX)
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default='')
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/media-interna/')
+
+# Miniaturas de Producto.foto (quickstart.imagenes): anchos en px, formatos y procesos del pool
+IMAGENES_ANCHOS = [160, 320, 640]
+IMAGENES_FORMATOS = ['webp', 'avif']
+IMAGENES_WORKERS = config('IMAGENES_WORKERS', default=2, cast=int)
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=300),
@@ -154,3 +254,31 @@ SIMPLE_JWT = {
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = config('STRIPE_WEBHOOK_SECRET')
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY')
+# Cliente HTTP de Stripe (quickstart.pagos). Para pruebas de carga sin red:
+# STRIPE_API_BASE=http://127.0.0.1:12111 y manage.py stub_pagos
+STRIPE_API_BASE = config('STRIPE_API_BASE', default='https://api.stripe.com')
+STRIPE_TIMEOUT = config('STRIPE_TIMEOUT', default=10.0, cast=float)
+STRIPE_MAX_REINTENTOS = config('STRIPE_MAX_REINTENTOS', default=2, cast=int)
+
+# Metricas por ruta en /metrics (quickstart.metricas), solo para usuarios staff o, si se
+# define METRICAS_TOKEN, con 'Authorization: Bearer <token>' (para Prometheus).
+# METRICAS_UMBRAL_LENTO_MS > 0 activa el log de requests
+# lentas (logger quickstart.lentos) con sus METRICAS_SQL_LENTAS sentencias mas costosas.
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+METRICAS_UMBRAL_LENTO_MS = config('METRICAS_UMBRAL_LENTO_MS', default=0, cast=int)
+METRICAS_SQL_LENTAS = config('METRICAS_SQL_LENTAS', default=5, cast=int)
+
+# Minutos que se retiene el stock de un pedido pendiente. Stripe exige que la
+# sesion de checkout expire entre 30 minutos y 24 horas despues de crearla, y la
+# sesion vence con la reserva: 31 deja margen para la latencia hasta crearla.
+RESERVA_TTL_MINUTOS = config('RESERVA_TTL_MINUTOS', default=31, cast=int)
+if not 31 <= RESERVA_TTL_MINUTOS <= 24 * 60:
+    raise ImproperlyConfigured('RESERVA_TTL_MINUTOS debe estar entre 31 y 1440 (limites de Stripe Checkout).')
+# Al vencer la sesion, el evento checkout.session.expired cancela el pedido. liberar_reservas
+# solo barre lo que sigue vencido pasados estos minutos (eventos perdidos): un
+# checkout.session.completed todavia en cola no encuentra el pedido ya cancelado.
+RESERVA_GRACIA_MINUTOS = config('RESERVA_GRACIA_MINUTOS', default=60, cast=int)
+
+# Planificacion de despachos (quickstart.despacho): pedidos por vehiculo y tope de pasadas de 2-opt por ruta
+DESPACHO_CAPACIDAD = config('DESPACHO_CAPACIDAD', default=20, cast=int)
+DESPACHO_MAX_PASADAS_2OPT = config('DESPACHO_MAX_PASADAS_2OPT', default=50, cast=int)
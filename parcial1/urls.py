@@ -14,17 +14,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.urls import include, path
+import re
+
+from django.urls import include, path, re_path
 from rest_framework import routers
 from django.conf import settings
-from django.conf.urls.static import static
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
-    TokenBlacklistView
 )
 
 from quickstart.views import *
+from quickstart.media import servir_media
+from quickstart import metricas
 
 router = routers.DefaultRouter()
 router.register(r'permissions', PermissionViewSet)
@@ -45,19 +47,32 @@ urlpatterns = [
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework'))
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Tambien en produccion: validadores, Range y X-Sendfile/X-Accel-Redirect (quickstart.media)
+urlpatterns += [
+    re_path(r'^%s(?P<nombre>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), servir_media),
+]
 
 urlpatterns += [
     #path('api/token', TokenObtainPairView.as_view(), name='token_obtain_pair'),  # login
     path('api/token', CustomTokenObtainPairView.as_view(), name='custom_token_auth'),  # login
     path('api/token/refresh', TokenRefreshView.as_view(), name='token_refresh'),  # refresh
-    path('api/token/logout', TokenBlacklistView.as_view(), name='token_blacklist'),  # logout
+    path('api/token/logout', LogoutView.as_view(), name='token_blacklist'),  # logout
     path('api/register', RegisterView.as_view(), name='register'),
+    # Variantes async (ASGI) con el hash en un pool acotado
+    path('api/token/async', login_async, name='login_async'),
+    path('api/register/async', registro_async, name='register_async'),
 ]
 
 #vistas personalizadas
 urlpatterns += [ 
     path('api/ultimo_carrito/', ultimo_carrito_usuario),
     path('api/pagar/', iniciar_pago),
+    path('api/pagar/async/', iniciar_pago_async),
     path('api/stripe/webhook/', stripe_webhook),
+    path('api/exportar/pedidos/', exportar_pedidos),
+    path('api/exportar/productos/', exportar_productos),
+    path('api/analitica/ventas/', analitica_ventas),
+    path('api/analitica/pedidos/', analitica_pedidos),
+    path('api/despacho/', planificar_despacho),
+    path('metrics', metricas.exponer, name='metricas'),
 ]
\ No newline at end of file
@@ -0,0 +1,190 @@
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DetallePedido, Pedido, PedidosDiarios, VentaDiaria
+
+AGRUPACIONES = ('dia', 'producto', 'categoria')
+# Estados que cuentan como venta: el pedido sigue vendido cuando se envia o se entrega
+VENDIDOS = ('confirmado', 'enviado', 'entregado')
+FILAS_POR_SENTENCIA = 1000
+
+# Suma los valores a la fila existente, o la crea. Igual en Postgres y en SQLite >= 3.24
+_UPSERT_SQL = (
+    'INSERT INTO {tabla} ({columnas}) VALUES {valores} '
+    'ON CONFLICT ({clave}) DO UPDATE SET {actualizacion}'
+)
+
+
+def _sumar(modelo, clave, sumas, filas):
+    """
+    Aplica `filas` (valores de `clave` seguidos de `sumas`) con upserts de a FILAS_POR_SENTENCIA.
+    Las filas se ordenan por la clave de conflicto: asi dos transacciones que tocan los
+    mismos resumenes bloquean sus filas en el mismo orden y no pueden cruzarse (deadlock).
+    """
+    if not filas:
+        return
+    filas = sorted(filas, key=lambda fila: fila[:len(clave)])
+    campos = [modelo._meta.get_field(nombre) for nombre in clave + sumas]
+    columnas = {campo.name: connection.ops.quote_name(campo.column) for campo in campos}
+    tabla = connection.ops.quote_name(modelo._meta.db_table)
+    marcadores = '(' + ', '.join(['%s'] * len(campos)) + ')'
+    with connection.cursor() as cursor:
+        for inicio in range(0, len(filas), FILAS_POR_SENTENCIA):
+            tramo = filas[inicio:inicio + FILAS_POR_SENTENCIA]
+            sql = _UPSERT_SQL.format(
+                tabla=tabla,
+                columnas=', '.join(columnas[nombre] for nombre in clave + sumas),
+                valores=', '.join([marcadores] * len(tramo)),
+                clave=', '.join(columnas[nombre] for nombre in clave),
+                actualizacion=', '.join(
+                    f'{columnas[nombre]} = {tabla}.{columnas[nombre]} + EXCLUDED.{columnas[nombre]}' for nombre in sumas
+                ),
+            )
+            params = []
+            for fila in tramo:
+                params += [campo.get_db_prep_value(valor, connection) for campo, valor in zip(campos, fila)]
+            cursor.execute(sql, params)
+
+
+def _acumular(diferencias, clave, valores, signo):
+    actual = diferencias.get(clave, (0, 0))
+    diferencias[clave] = tuple(a + signo * v for a, v in zip(actual, valores))
+
+
+def registrar_transicion(movidos, hacia):
+    """
+    Mueve los pedidos de `movidos` ([(id, estado anterior)], None al crearlos) al estado
+    `hacia` en los resumenes. Se llama al final de la transaccion que cambia el estado, para
+    tener bloqueadas las filas de resumen el menor tiempo posible: agrega solo las lineas de
+    esos pedidos, junta las diferencias de todos los estados de origen y las aplica con un
+    unico upsert ordenado por tabla. Sigue dentro de la transaccion para que reconstruir,
+    que bloquea los pedidos, nunca vea un estado sin su diferencia aplicada.
+    """
+    por_estado = {}
+    for id_pedido, desde in movidos:
+        if desde != hacia:
+            por_estado.setdefault(desde, []).append(id_pedido)
+    ventas, diarios = {}, {}
+    for desde, ids in por_estado.items():
+        lineas = list(
+            DetallePedido.objects.filter(id_pedido__in=ids)
+            .annotate(fecha=TruncDate('id_pedido__fecha_creacion'))
+            .values('fecha', 'id_producto')
+            .annotate(unidades=Sum('cantidad'), total=Sum('precio_total'))
+            .order_by()
+        )
+        pedidos = list(
+            Pedido.objects.filter(id__in=ids)
+            .annotate(fecha=TruncDate('fecha_creacion'))
+            .values('fecha')
+            .annotate(cantidad=Count('id'), total=Sum('monto_total'))
+            .order_by()
+        )
+        for estado, signo in ((desde, -1), (hacia, 1)):
+            if estado is None:
+                continue
+            for linea in lineas:
+                _acumular(ventas, (linea['fecha'], linea['id_producto'], estado), (linea['unidades'], linea['total']), signo)
+            for dia in pedidos:
+                _acumular(diarios, (dia['fecha'], estado), (dia['cantidad'], dia['total']), signo)
+
+    _sumar(VentaDiaria, ['fecha', 'producto', 'estado'], ['cantidad', 'monto'], [
+        clave + valores for clave, valores in ventas.items()
+    ])
+    _sumar(PedidosDiarios, ['fecha', 'estado'], ['pedidos', 'monto'], [
+        clave + valores for clave, valores in diarios.items()
+    ])
+
+
+def _limites(desde, hasta):
+    # Rango de fecha_creacion que cubre los dias [desde, hasta] completos, apto para el indice
+    zona = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(desde, time.min), zona),
+        timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min), zona),
+    )
+
+
+def reconstruir(desde, hasta):
+    """
+    Recalcula desde cero los resumenes de los dias [desde, hasta] (backfill o correccion).
+    Bloquea los pedidos del rango, como transicionar, asi ninguna transicion aplica su
+    diferencia entre el borrado y el recalculo; los pedidos nuevos esperan en el upsert
+    de su fila de resumen hasta que termine el tramo.
+    """
+    inicio, fin = _limites(desde, hasta)
+    with transaction.atomic():
+        list(
+            Pedido.objects.select_for_update()
+            .filter(fecha_creacion__gte=inicio, fecha_creacion__lt=fin)
+            .order_by('id').values_list('id', flat=True)
+        )
+        VentaDiaria.objects.filter(fecha__range=(desde, hasta)).delete()
+        PedidosDiarios.objects.filter(fecha__range=(desde, hasta)).delete()
+
+        ventas = (
+            DetallePedido.objects.filter(id_pedido__fecha_creacion__gte=inicio, id_pedido__fecha_creacion__lt=fin)
+            .annotate(fecha=TruncDate('id_pedido__fecha_creacion'))
+            .values('fecha', 'id_producto', 'id_pedido__estado')
+            .annotate(unidades=Sum('cantidad'), total=Sum('precio_total'))
+            .order_by()
+        )
+        VentaDiaria.objects.bulk_create([
+            VentaDiaria(
+                fecha=fila['fecha'], producto_id=fila['id_producto'], estado=fila['id_pedido__estado'],
+                cantidad=fila['unidades'], monto=fila['total'],
+            )
+            for fila in ventas
+        ], batch_size=FILAS_POR_SENTENCIA)
+
+        pedidos = (
+            Pedido.objects.filter(fecha_creacion__gte=inicio, fecha_creacion__lt=fin)
+            .annotate(fecha=TruncDate('fecha_creacion'))
+            .values('fecha', 'estado')
+            .annotate(cantidad=Count('id'), total=Sum('monto_total'))
+            .order_by()
+        )
+        PedidosDiarios.objects.bulk_create([
+            PedidosDiarios(fecha=fila['fecha'], estado=fila['estado'], pedidos=fila['cantidad'], monto=fila['total'])
+            for fila in pedidos
+        ], batch_size=FILAS_POR_SENTENCIA)
+
+
+def ventas(desde, hasta, estados, agrupar):
+    """Unidades y monto de los pedidos en `estados` en [desde, hasta], por dia, producto o categoria."""
+    filas = VentaDiaria.objects.filter(estado__in=estados, fecha__range=(desde, hasta))
+    if agrupar == 'dia':
+        filas = filas.values('fecha').order_by('fecha')
+    elif agrupar == 'producto':
+        filas = filas.values('producto_id', nombre=F('producto__nombre')).order_by()
+    else:
+        filas = filas.values(categoria_id=F('producto__categoria_id'), categoria=F('producto__categoria__nombre')).order_by()
+    filas = filas.annotate(unidades=Sum('cantidad'), total=Sum('monto')).filter(unidades__gt=0)
+    if agrupar != 'dia':
+        filas = filas.order_by('-total')
+    return list(filas)
+
+
+def pedidos_por_dia(desde, hasta, estados):
+    """Pedidos en `estados`, monto y ticket promedio por dia en [desde, hasta], con el total del periodo."""
+    dias = list(
+        PedidosDiarios.objects.filter(estado__in=estados, fecha__range=(desde, hasta))
+        .values('fecha')
+        .annotate(pedidos=Sum('pedidos'), monto=Sum('monto'))
+        .filter(pedidos__gt=0)
+        .order_by('fecha')
+    )
+    for dia in dias:
+        dia['ticket_promedio'] = round(dia['monto'] / dia['pedidos'], 2)
+    cantidad = sum(dia['pedidos'] for dia in dias)
+    total = sum(dia['monto'] for dia in dias)
+    return {
+        'dias': dias,
+        'pedidos': cantidad,
+        'monto': total,
+        'ticket_promedio': round(total / cantidad, 2) if cantidad else None,
+    }
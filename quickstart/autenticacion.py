@@ -0,0 +1,153 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+CACHE_ALIAS = 'auth'
+CLAVE_GRUPOS = 'auth:version:grupos'
+MAX_REVOCADOS_LOCALES = 10000
+
+# JTIs revocados ya vistos por este proceso, {jti: exp}: se rechazan sin ir al cache.
+# La fuente de verdad es el cache compartido; esto solo evita el viaje.
+_revocados = {}
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _clave_usuario(id_usuario):
+    return f'auth:usuario:{id_usuario}'
+
+
+def _clave_version(id_usuario):
+    return f'auth:version:usuario:{id_usuario}'
+
+
+def _clave_jti(jti):
+    return f'auth:jti:{jti}'
+
+
+def _incrementar(clave):
+    try:
+        _cache().incr(clave)
+    except ValueError:
+        _cache().set(clave, time.time_ns(), None)
+
+
+def invalidar_usuario(id_usuario):
+    _incrementar(_clave_version(id_usuario))
+
+
+def invalidar_grupos():
+    _incrementar(CLAVE_GRUPOS)
+
+
+def _campos():
+    return [campo.attname for campo in get_user_model()._meta.concrete_fields if campo.attname != 'password']
+
+
+def _recordar_revocado(jti, exp):
+    if len(_revocados) >= MAX_REVOCADOS_LOCALES:
+        ahora = time.time()
+        for vencido in [clave for clave, valor in _revocados.items() if valor < ahora]:
+            del _revocados[vencido]
+    _revocados[jti] = exp
+
+
+def revocar(token):
+    """Rechaza el token por su jti hasta que expire (p. ej. el access token al hacer logout)."""
+    jti = token.get(api_settings.JTI_CLAIM)
+    exp = token.get('exp')
+    if not jti or not exp:
+        return
+    _recordar_revocado(jti, exp)
+    _cache().set(_clave_jti(jti), True, max(int(exp - time.time()), 1))
+
+
+def _versiones(valores, claves):
+    # Una version ausente (primer uso o desalojada) se inicializa con el reloj, nunca con una ya usada
+    for clave in claves:
+        if clave not in valores:
+            _cache().add(clave, time.time_ns(), None)
+            valores[clave] = _cache().get(clave)
+    return tuple(valores[clave] for clave in claves)
+
+
+def _solo_lectura(*args, **kwargs):
+    raise RuntimeError('El usuario autenticado viene del cache y no tiene password: reléalo de la base antes de guardarlo.')
+
+
+def _cargar(id_usuario):
+    User = get_user_model()
+    try:
+        usuario = User.objects.get(**{api_settings.USER_ID_FIELD: id_usuario})
+    except User.DoesNotExist:
+        return None
+    campos = _campos()
+    return {
+        'valores': tuple(getattr(usuario, campo) for campo in campos),
+        'grupos': tuple(usuario.groups.values_list('name', flat=True)),
+        'huella': get_md5_hash_password(usuario.password) if api_settings.CHECK_REVOKE_TOKEN else None,
+    }
+
+
+def usuario_para_token(token):
+    """
+    Usuario del token desde el cache 'auth' en un solo get_many (usuario, versiones y jti
+    revocado), sin consultas a la base mientras la entrada siga vigente. La entrada se
+    descarta al cambiar la version del usuario o de los grupos, o al vencer AUTH_USUARIO_TTL.
+    El usuario devuelto tiene `password` diferido, los nombres de grupo en `nombres_grupos`
+    y no se puede guardar.
+    """
+    try:
+        id_usuario = token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_('Token contained no recognizable user identification'))
+
+    jti = token.get(api_settings.JTI_CLAIM)
+    exp = _revocados.get(jti)
+    if exp is not None and exp >= time.time():
+        raise AuthenticationFailed(_('Token is blacklisted'), code='token_not_valid')
+
+    claves = [_clave_usuario(id_usuario), _clave_version(id_usuario), CLAVE_GRUPOS]
+    if jti:
+        claves.append(_clave_jti(jti))
+    valores = _cache().get_many(claves)
+    if jti and valores.get(_clave_jti(jti)):
+        _recordar_revocado(jti, token.get('exp', time.time()))
+        raise AuthenticationFailed(_('Token is blacklisted'), code='token_not_valid')
+
+    versiones = _versiones(valores, claves[1:3])
+    entrada = valores.get(claves[0])
+    if entrada is None or entrada['versiones'] != versiones:
+        entrada = _cargar(id_usuario)
+        if entrada is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        entrada['versiones'] = versiones
+        _cache().set(claves[0], entrada, settings.AUTH_USUARIO_TTL)
+
+    campos = _campos()
+    usuario = get_user_model().from_db('default', campos, entrada['valores'])
+    usuario.nombres_grupos = entrada['grupos']
+    # Guardarlo pisaria la fila con datos de hasta AUTH_USUARIO_TTL segundos atras
+    usuario.save = usuario.asave = _solo_lectura
+
+    if api_settings.CHECK_USER_IS_ACTIVE and not usuario.is_active:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    if api_settings.CHECK_REVOKE_TOKEN and token.get(api_settings.REVOKE_TOKEN_CLAIM) != entrada['huella']:
+        raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+    return usuario
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication que resuelve el usuario desde el cache (ver usuario_para_token)."""
+
+    def get_user(self, validated_token):
+        return usuario_para_token(validated_token)
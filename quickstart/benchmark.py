@@ -0,0 +1,232 @@
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections, transaction
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import analitica, busqueda, eventos_stripe
+from .cache import incrementar_version
+from .models import Categoria, EventoStripe, Inventario, Pedido, Producto, Sucursal
+
+PREFIJO = 'bench'
+
+
+def sembrar(productos, usuarios, sucursales):
+    """
+    Crea (o completa) el dataset del benchmark, identificado por el prefijo 'bench'.
+    Es idempotente: volver a correrlo solo agrega lo que falta.
+    """
+    categoria, _ = Categoria.objects.get_or_create(nombre=PREFIJO, defaults={'descripcion': 'Datos de benchmark'})
+
+    existentes = Sucursal.objects.filter(nombre__startswith=f'{PREFIJO}-').count()
+    Sucursal.objects.bulk_create([Sucursal(nombre=f'{PREFIJO}-{i}') for i in range(existentes, sucursales)])
+    ids_sucursales = list(Sucursal.objects.filter(nombre__startswith=f'{PREFIJO}-').values_list('id', flat=True))
+
+    existentes = Producto.objects.filter(categoria=categoria).count()
+    Producto.objects.bulk_create([
+        Producto(categoria=categoria, nombre=f'{PREFIJO} producto {i}', tipo='mesa', precio=Decimal(10 + i % 500))
+        for i in range(existentes, productos)
+    ], batch_size=1000)
+    ids_productos = list(Producto.objects.filter(categoria=categoria).values_list('id', flat=True))
+
+    # Stock de sobra para que las reservas del checkout no fallen durante la corrida
+    Inventario.objects.bulk_create([
+        Inventario(producto_id=id_producto, sucursal_id=id_sucursal, cantidad=1_000_000)
+        for id_producto in ids_productos
+        for id_sucursal in ids_sucursales
+    ], batch_size=1000, ignore_conflicts=True)
+
+    existentes = User.objects.filter(username__startswith=f'{PREFIJO}_').count()
+    sin_password = make_password(None)
+    User.objects.bulk_create([
+        User(username=f'{PREFIJO}_{i}', password=sin_password) for i in range(existentes, usuarios)
+    ], batch_size=1000)
+
+    # bulk_create no dispara signals: indice de busqueda y versiones del cache a mano
+    busqueda.actualizar_categorias([categoria.id])
+    for modelo in (Categoria, Producto, Sucursal, Inventario):
+        incrementar_version(modelo)
+    return list(User.objects.filter(username__startswith=f'{PREFIJO}_').order_by('id')[:usuarios])
+
+
+def limpiar():
+    """
+    Borra (de verdad, no soft delete) todo lo que creo sembrar y la corrida: usuarios 'bench_'
+    con sus pedidos y carritos, eventos de Stripe, categoria, productos y sucursales 'bench'.
+    Los resumenes de analitica de los dias afectados se reconstruyen.
+    """
+    usuarios = User.objects.filter(username__startswith=f'{PREFIJO}_')
+    dias = Pedido.objects.filter(id_usuario__in=usuarios).aggregate(desde=Min('fecha_creacion'), hasta=Max('fecha_creacion'))
+    with transaction.atomic():
+        EventoStripe.objects.filter(id_evento__startswith=f'evt_{PREFIJO}_').delete()
+        usuarios.delete()
+        Categoria.all_objects.filter(nombre=PREFIJO).hard_delete()
+        Sucursal.all_objects.filter(nombre__startswith=f'{PREFIJO}-').hard_delete()
+    if dias['desde'] is not None:
+        analitica.reconstruir(timezone.localdate(dias['desde']), timezone.localdate(dias['hasta']))
+    for modelo in (Categoria, Producto, Sucursal, Inventario):
+        incrementar_version(modelo)
+
+
+def percentil(ordenados, p):
+    if not ordenados:
+        return None
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+class ClienteInProceso:
+    """Llama a la app con el Client de Django, sin red; permite contar las consultas SQL."""
+    cuenta_consultas = True
+
+    def __init__(self, token):
+        self.cliente = Client(HTTP_AUTHORIZATION=f'Bearer {token}', raise_request_exception=False)
+
+    def pedir(self, metodo, ruta, cuerpo=None, headers=None):
+        extra = {f'HTTP_{clave.upper().replace("-", "_")}': valor for clave, valor in (headers or {}).items()}
+        if metodo == 'GET':
+            return self.cliente.get(ruta, **extra)
+        return self.cliente.post(ruta, data=cuerpo or '{}', content_type='application/json', **extra)
+
+    def cerrar(self):
+        connections.close_all()
+
+
+class ClienteHttp:
+    """Llama a la app servida por uvicorn con httpx (keep-alive por usuario virtual)."""
+    cuenta_consultas = False
+
+    def __init__(self, token, base):
+        import httpx
+
+        self.cliente = httpx.Client(base_url=base, headers={'Authorization': f'Bearer {token}'}, timeout=30)
+
+    def pedir(self, metodo, ruta, cuerpo=None, headers=None):
+        if metodo == 'GET':
+            return self.cliente.get(ruta, headers=headers)
+        return self.cliente.post(ruta, content=cuerpo or '{}', headers={'Content-Type': 'application/json', **(headers or {})})
+
+    def cerrar(self):
+        self.cliente.close()
+        connections.close_all()
+
+
+class Corrida:
+    def __init__(self, ids_productos):
+        self.ids_productos = ids_productos
+        self.muestras = defaultdict(list)  # endpoint -> [(segundos, consultas, status)]
+        self.errores = defaultdict(int)
+        self.bloqueo = threading.Lock()
+
+    def medir(self, cliente, endpoint, metodo, ruta, cuerpo=None, headers=None):
+        inicio = time.perf_counter()
+        if cliente.cuenta_consultas:
+            with CaptureQueriesContext(connection) as consultas:
+                respuesta = cliente.pedir(metodo, ruta, cuerpo, headers)
+            cantidad = len(consultas)
+        else:
+            respuesta = cliente.pedir(metodo, ruta, cuerpo, headers)
+            cantidad = None
+        duracion = time.perf_counter() - inicio
+        with self.bloqueo:
+            self.muestras[endpoint].append((duracion, cantidad, respuesta.status_code))
+            if respuesta.status_code >= 400:
+                self.errores[endpoint] += 1
+        return respuesta
+
+    def recorrido(self, cliente, usuario):
+        """Navega el catalogo, arma el carrito, paga contra el stub de Stripe y confirma por webhook."""
+        respuesta = self.medir(cliente, 'GET /api/productos/', 'GET', '/api/productos/?page_size=20&count=false')
+        resultados = respuesta.json().get('results') if respuesta.status_code == 200 else None
+        id_producto = random.choice(resultados)['id'] if resultados else random.choice(self.ids_productos)
+        self.medir(cliente, 'GET /api/productos/{id}/', 'GET', f'/api/productos/{id_producto}/')
+
+        respuesta = self.medir(cliente, 'GET /api/ultimo_carrito/', 'GET', '/api/ultimo_carrito/')
+        if respuesta.status_code != 200:
+            return
+        id_carrito = respuesta.json()['id']
+        for id_producto in random.sample(self.ids_productos, min(2, len(self.ids_productos))):
+            self.medir(
+                cliente, 'POST /api/detalles_carrito/', 'POST', '/api/detalles_carrito/',
+                json.dumps({'id_carrito': id_carrito, 'id_producto': id_producto, 'cantidad': 1}),
+            )
+
+        respuesta = self.medir(
+            cliente, 'POST /api/pagar/', 'POST', '/api/pagar/',
+            json.dumps({'id_carrito': id_carrito, 'direccion': 'Av. Benchmark 1', 'url_front_base': 'http://localhost'}),
+        )
+        if respuesta.status_code != 200:
+            return
+        pedido = Pedido.objects.filter(id_usuario=usuario, estado='pendiente').order_by('-id').values_list('id', flat=True).first()
+        if pedido is None:
+            return
+        cuerpo = json.dumps({
+            'id': f'evt_{PREFIJO}_{pedido}_{time.time_ns()}',
+            'object': 'event',
+            'type': 'checkout.session.completed',
+            'data': {'object': {'object': 'checkout.session', 'metadata': {'pedido_id': str(pedido)}}},
+        })
+        self.medir(cliente, 'POST /api/stripe/webhook/', 'POST', '/api/stripe/webhook/', cuerpo, {'Stripe-Signature': firma_webhook(cuerpo)})
+        # Fuera de la medicion: el worker del outbox confirma el pedido y rota el carrito
+        eventos_stripe.procesar_lote()
+
+    def resumen(self, segundos):
+        endpoints = {}
+        for endpoint, muestras in sorted(self.muestras.items()):
+            tiempos = sorted(muestra[0] for muestra in muestras)
+            consultas = [muestra[1] for muestra in muestras if muestra[1] is not None]
+            endpoints[endpoint] = {
+                'peticiones': len(muestras),
+                'errores': self.errores[endpoint],
+                'por_segundo': round(len(muestras) / segundos, 2),
+                'p50_ms': round(percentil(tiempos, 50) * 1000, 2),
+                'p95_ms': round(percentil(tiempos, 95) * 1000, 2),
+                'p99_ms': round(percentil(tiempos, 99) * 1000, 2),
+                'consultas_promedio': round(sum(consultas) / len(consultas), 2) if consultas else None,
+                'consultas_max': max(consultas) if consultas else None,
+            }
+        total = sum(len(muestras) for muestras in self.muestras.values())
+        return {'segundos': round(segundos, 3), 'peticiones': total, 'por_segundo': round(total / segundos, 2), 'endpoints': endpoints}
+
+
+def firma_webhook(cuerpo):
+    marca = int(time.time())
+    firma = hmac.new(settings.STRIPE_WEBHOOK_SECRET.encode(), f'{marca}.{cuerpo}'.encode(), hashlib.sha256).hexdigest()
+    return f't={marca},v1={firma}'
+
+
+def ejecutar(usuarios, ids_productos, fabricar_cliente, concurrencia, iteraciones):
+    """
+    Corre `concurrencia` usuarios virtuales en hilos, cada uno con `iteraciones` recorridos.
+    `fabricar_cliente(token)` devuelve un ClienteInProceso o ClienteHttp.
+    """
+    corrida = Corrida(ids_productos)
+
+    def usuario_virtual(indice):
+        usuario = usuarios[indice % len(usuarios)]
+        cliente = fabricar_cliente(str(AccessToken.for_user(usuario)))
+        try:
+            for _ in range(iteraciones):
+                corrida.recorrido(cliente, usuario)
+        finally:
+            cliente.cerrar()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        list(pool.map(usuario_virtual, range(concurrencia)))
+    resultado = corrida.resumen(time.perf_counter() - inicio)
+    resultado.update({'fecha': timezone.now().isoformat(), 'concurrencia': concurrencia, 'iteraciones': iteraciones})
+    return resultado
@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection
+from django.db.models import Count, F, FloatField, Max, Min, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Producto
+
+# Indice de busqueda de productos. En Postgres es la columna Producto.busqueda (tsvector
+# con indice GIN) mas un indice trigram sobre nombre; en SQLite (desarrollo local) una
+# tabla virtual FTS5. Ambos se crean en la migracion 0011 y se mantienen desde signals.
+CONFIG = 'spanish'
+TABLA_FTS = 'quickstart_producto_fts'
+
+_ACTUALIZAR_PG = """
+    UPDATE quickstart_producto AS p SET busqueda =
+        setweight(to_tsvector('spanish', coalesce(p.nombre, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(p.tipo, '') || ' ' || coalesce(p.medidas, '')), 'B') ||
+        setweight(to_tsvector('spanish', coalesce(c.nombre, '') || ' ' || coalesce(c.descripcion, '')), 'C')
+    FROM quickstart_categoria AS c
+    WHERE c.id = p.categoria_id AND {filtro}
+"""
+
+_ACTUALIZAR_SQLITE = """
+    INSERT INTO quickstart_producto_fts (rowid, nombre, tipo, medidas, categoria, descripcion)
+    SELECT p.id, p.nombre, coalesce(p.tipo, ''), coalesce(p.medidas, ''), c.nombre, coalesce(c.descripcion, '')
+    FROM quickstart_producto AS p JOIN quickstart_categoria AS c ON c.id = p.categoria_id
+    WHERE {filtro}
+"""
+
+
+def _es_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def _actualizar(columna, ids):
+    ids = list(ids)
+    if not ids:
+        return
+    marcadores = ', '.join(['%s'] * len(ids))
+    filtro = f'p.{columna} IN ({marcadores})'
+    with connection.cursor() as cursor:
+        if _es_postgres():
+            cursor.execute(_ACTUALIZAR_PG.format(filtro=filtro), ids)
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                f'DELETE FROM {TABLA_FTS} WHERE rowid IN (SELECT p.id FROM quickstart_producto AS p WHERE {filtro})', ids
+            )
+            cursor.execute(_ACTUALIZAR_SQLITE.format(filtro=filtro), ids)
+
+
+def actualizar_productos(ids):
+    _actualizar('id', ids)
+
+
+def actualizar_categorias(ids):
+    _actualizar('categoria_id', ids)
+
+
+def _consulta_fts5(texto):
+    # Cada palabra como prefijo ("mesa"*), asi "mes" encuentra "mesa" al escribir
+    palabras = [palabra.replace('"', '""') for palabra in texto.split()]
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def buscar(texto):
+    """
+    Productos activos que coinciden con `texto`, anotados con `rango` (mayor es mejor).
+    Postgres: texto completo (websearch) sobre el tsvector + similitud trigram del nombre,
+    para tolerar errores de tipeo. SQLite: FTS5 con bm25 y prefijos.
+    """
+    productos = Producto.objects.filter(eliminado=False)
+    if _es_postgres():
+        consulta = SearchQuery(texto, config=CONFIG, search_type='websearch')
+        return productos.filter(
+            Q(busqueda=consulta) | Q(nombre__trigram_similar=texto)
+        ).annotate(
+            rango=SearchRank(F('busqueda'), consulta) + TrigramSimilarity('nombre', texto)
+        )
+
+    expresion = _consulta_fts5(texto)
+    coincidencias = RawSQL(f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s', [expresion])
+    rango = RawSQL(
+        f'SELECT -bm25({TABLA_FTS}, 10.0, 5.0, 5.0, 2.0, 1.0) FROM {TABLA_FTS} '
+        f'WHERE {TABLA_FTS} MATCH %s AND rowid = quickstart_producto.id',
+        [expresion],
+        output_field=FloatField(),
+    )
+    return productos.filter(id__in=coincidencias).annotate(rango=rango)
+
+
+def facetas(productos):
+    """Conteo por categoria y por rango de precio (settings.BUSQUEDA_RANGOS_PRECIO), dos consultas."""
+    categorias = list(
+        productos.order_by()
+        .values('categoria_id', 'categoria__nombre')
+        .annotate(cantidad=Count('id'))
+        .order_by('-cantidad', 'categoria_id')
+    )
+
+    limites = settings.BUSQUEDA_RANGOS_PRECIO
+    tramos = list(zip(limites, limites[1:] + [None]))
+    conteos = {
+        f'rango_{i}': Count('id', filter=Q(precio__gte=desde) & (Q(precio__lt=hasta) if hasta is not None else Q()))
+        for i, (desde, hasta) in enumerate(tramos)
+    }
+    agregados = productos.order_by().aggregate(minimo=Min('precio'), maximo=Max('precio'), **conteos)
+    return {
+        'categorias': categorias,
+        'precio': {
+            'min': agregados['minimo'],
+            'max': agregados['maximo'],
+            'rangos': [
+                {'desde': desde, 'hasta': hasta, 'cantidad': agregados[f'rango_{i}']}
+                for i, (desde, hasta) in enumerate(tramos)
+            ],
+        },
+    }
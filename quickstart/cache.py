@@ -0,0 +1,103 @@
+import hashlib
+import time
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import replicas
+
+CACHE_ALIAS = 'catalogo'
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _clave_version(modelo):
+    return 'version:%s' % modelo._meta.label_lower
+
+
+def versiones(modelos):
+    """
+    Devuelve la version actual de cada modelo. Si una version no existe (primer uso
+    o desalojada por el LRU) se inicializa con el reloj, nunca con un valor ya usado.
+    """
+    claves = [_clave_version(modelo) for modelo in modelos]
+    actuales = _cache().get_many(claves)
+    for clave in claves:
+        if clave not in actuales:
+            _cache().add(clave, time.time_ns(), None)
+            actuales[clave] = _cache().get(clave)
+    return [actuales[clave] for clave in claves]
+
+
+def _clave_cambio(modelo):
+    return 'cambio:%s' % modelo._meta.label_lower
+
+
+def incrementar_version(modelo):
+    clave = _clave_version(modelo)
+    try:
+        _cache().incr(clave)
+    except ValueError:
+        _cache().set(clave, time.time_ns(), None)
+    # Mientras una replica atrasada pueda no tener el cambio, las claves nuevas se llenan desde el primario
+    if replicas.replicas():
+        _cache().set(_clave_cambio(modelo), True, settings.DB_REPLICA_STICKY_SEGUNDOS)
+
+
+def cambio_reciente(modelos):
+    """True si alguno de los modelos cambio hace menos de DB_REPLICA_STICKY_SEGUNDOS."""
+    return bool(replicas.replicas() and _cache().get_many([_clave_cambio(modelo) for modelo in modelos]))
+
+
+class CatalogoCacheMixin:
+    """
+    Cache de lecturas (list/retrieve) con ETag fuerte. La clave depende de la version
+    de cada modelo en `cache_modelos` (o en get_cache_modelos si varia por accion), de la
+    URL y del formato; las versiones se incrementan con las señales de quickstart.signals,
+    asi que no hace falta borrar entradas: las viejas quedan huerfanas y el backend las desaloja.
+    """
+    cache_modelos = ()
+
+    def get_cache_modelos(self):
+        return self.cache_modelos
+
+    def list(self, request, *args, **kwargs):
+        return self._respuesta_cacheada(request, lambda: super(CatalogoCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._respuesta_cacheada(request, lambda: super(CatalogoCacheMixin, self).retrieve(request, *args, **kwargs))
+
+    def _clave_cache(self, request):
+        partes = [self.__class__.__name__, self.action, request.accepted_renderer.format, request.get_full_path()]
+        partes += [str(version) for version in versiones(self.get_cache_modelos())]
+        return hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()
+
+    def _respuesta_cacheada(self, request, generar):
+        # La API navegable depende del usuario, no se cachea
+        if request.accepted_renderer.format == 'api':
+            return generar()
+
+        clave = self._clave_cache(request)
+        etag = '"%s"' % clave
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = _cache().get(clave)
+        if data is None:
+            with replicas.primario() if cambio_reciente(self.get_cache_modelos()) else nullcontext():
+                response = generar()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            _cache().set(clave, response.data, settings.CATALOGO_CACHE_TTL)
+        else:
+            response = Response(data)
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
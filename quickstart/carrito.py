@@ -0,0 +1,150 @@
+from collections import OrderedDict, defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Carrito, DetalleCarrito, Producto
+
+# INSERT ... ON CONFLICT sobre el indice unico parcial de lineas activas (uniq_detallecarrito_activo).
+# El WHERE repite el predicado del indice tal como lo genera Django. Funciona igual en
+# Postgres y en SQLite >= 3.35.
+_UPSERT_SQL = (
+    'INSERT INTO {tabla} ({carrito}, {producto}, {cantidad}, {eliminado}) VALUES {valores} '
+    'ON CONFLICT ({carrito}, {producto}) WHERE NOT {eliminado} '
+    'DO UPDATE SET {cantidad} = {actualizacion} '
+    'RETURNING {id}, {producto}, {cantidad}'
+)
+
+
+def _columna(nombre):
+    return connection.ops.quote_name(DetalleCarrito._meta.get_field(nombre).column)
+
+
+def agregar_items(carrito, items, reemplazar=False, precios=None):
+    """
+    Agrega o actualiza lineas del carrito en una sola sentencia. `items` es una lista
+    de (id_producto, cantidad); si la linea activa ya existe se suma la cantidad
+    (o se reemplaza con reemplazar=True). Devuelve las lineas resultantes y ajusta
+    los totales del carrito. `precios` ({id_producto: precio}) evita releer los productos.
+    """
+    cantidades = OrderedDict()
+    for id_producto, cantidad in items:
+        # Un mismo producto no puede aparecer dos veces en un ON CONFLICT DO UPDATE
+        if reemplazar:
+            cantidades[id_producto] = cantidad
+        else:
+            cantidades[id_producto] = cantidades.get(id_producto, 0) + cantidad
+    if not cantidades:
+        return []
+
+    tabla = connection.ops.quote_name(DetalleCarrito._meta.db_table)
+    cantidad = _columna('cantidad')
+    sql = _UPSERT_SQL.format(
+        tabla=tabla,
+        id=_columna('id'),
+        carrito=_columna('id_carrito'),
+        producto=_columna('id_producto'),
+        cantidad=cantidad,
+        eliminado=_columna('eliminado'),
+        valores=', '.join(['(%s, %s, %s, %s)'] * len(cantidades)),
+        actualizacion='EXCLUDED.%s' % cantidad if reemplazar else '%s.%s + EXCLUDED.%s' % (tabla, cantidad, cantidad),
+    )
+    params = []
+    for id_producto, total in cantidades.items():
+        params += [carrito.pk, id_producto, total, False]
+
+    if precios is None:
+        precios = dict(Producto.objects.filter(id__in=cantidades).values_list('id', 'precio'))
+
+    with transaction.atomic():
+        # Primero el carrito: serializa los upserts concurrentes (el FOR UPDATE de las lineas
+        # no cubre las que todavia no existen) y el checkout, que lo bloquea igual
+        list(Carrito.all_objects.select_for_update().filter(pk=carrito.pk).values_list('pk', flat=True))
+        anteriores = {}
+        if reemplazar:
+            # Para reemplazar hace falta la cantidad previa de cada linea para ajustar los totales
+            anteriores = dict(
+                DetalleCarrito.objects.select_for_update()
+                .filter(id_carrito=carrito, id_producto__in=cantidades, eliminado=False)
+                .values_list('id_producto', 'cantidad')
+            )
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            filas = cursor.fetchall()
+
+        delta_cantidad = 0
+        delta_subtotal = Decimal('0')
+        for _, id_producto, total in filas:
+            diferencia = total - anteriores.get(id_producto, 0) if reemplazar else cantidades[id_producto]
+            delta_cantidad += diferencia
+            delta_subtotal += diferencia * precios[id_producto]
+        ajustar_totales(carrito.pk, delta_cantidad, delta_subtotal)
+
+    detalles = {
+        id_producto: DetalleCarrito(id=id_detalle, id_carrito=carrito, id_producto_id=id_producto, cantidad=total)
+        for id_detalle, id_producto, total in filas
+    }
+    for detalle in detalles.values():
+        detalle._estado_original = detalle._estado_totales()
+    return [detalles[id_producto] for id_producto in cantidades]
+
+
+def ajustar_totales(id_carrito, cantidad, subtotal):
+    # UPDATE atomico con F(): no hay lectura previa ni carrera entre requests concurrentes
+    if cantidad or subtotal:
+        Carrito.all_objects.filter(pk=id_carrito).update(
+            cantidad_items=F('cantidad_items') + cantidad,
+            subtotal=F('subtotal') + subtotal,
+        )
+
+
+def ajustar_totales_por_cambio(anterior, nuevo, detalle):
+    """
+    Aplica a los carritos la diferencia entre el estado anterior y el nuevo de una
+    linea, ambos como (id_carrito, id_producto, cantidad, eliminado).
+    """
+    if anterior == nuevo:
+        return
+    aportes = defaultdict(lambda: [0, Decimal('0')])
+    for estado, signo in ((anterior, -1), (nuevo, 1)):
+        if estado is None:
+            continue
+        id_carrito, id_producto, cantidad, eliminado = estado
+        if eliminado or not cantidad:
+            continue
+        if id_producto == detalle.id_producto_id:
+            precio = detalle.id_producto.precio
+        else:
+            precio = Producto.all_objects.values_list('precio', flat=True).get(pk=id_producto)
+        aportes[id_carrito][0] += signo * cantidad
+        aportes[id_carrito][1] += signo * cantidad * precio
+    for id_carrito, (cantidad, subtotal) in aportes.items():
+        ajustar_totales(id_carrito, cantidad, subtotal)
+
+
+def _totales_reales():
+    lineas = DetalleCarrito.objects.filter(id_carrito=OuterRef('pk'), eliminado=False).values('id_carrito')
+    subtotal = lineas.annotate(
+        total=Sum(ExpressionWrapper(F('cantidad') * F('id_producto__precio'), output_field=DecimalField(max_digits=12, decimal_places=2)))
+    ).values('total')
+    cantidad = lineas.annotate(total=Sum('cantidad')).values('total')
+    return {
+        'subtotal': Coalesce(Subquery(subtotal), Value(Decimal('0')), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        'cantidad_items': Coalesce(Subquery(cantidad), Value(0), output_field=IntegerField()),
+    }
+
+
+def recalcular_totales(carritos):
+    # Recalcula desde las lineas con un solo UPDATE ... SET = (SELECT SUM ...)
+    return carritos.update(**_totales_reales())
+
+
+def carritos_con_diferencias(carritos):
+    reales = _totales_reales()
+    return (
+        carritos.annotate(subtotal_real=reales['subtotal'], cantidad_real=reales['cantidad_items'])
+        .exclude(subtotal=F('subtotal_real'), cantidad_items=F('cantidad_real'))
+    )
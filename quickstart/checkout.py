@@ -0,0 +1,85 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db import transaction
+
+from . import geo, reservas, transiciones
+from .models import Carrito, DetalleCarrito, DetallePedido, Pedido
+
+
+class CheckoutError(Exception):
+    def __init__(self, data, status=400):
+        self.data = data
+        self.status = status
+        super().__init__(data)
+
+
+def calcular_total(carrito, items):
+    # El subtotal lo mantienen agregar_items y las señales; se lee con el carrito bloqueado
+    if not items:
+        raise CheckoutError({'error': 'El carrito está vacío, no se puede crear el pedido.'})
+
+    total = carrito.subtotal.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    if total == 0:
+        raise CheckoutError({'error': 'El carrito está vacío o con items que no tienen valor.'})
+    return total
+
+
+def sucursales_para_entrega(datos, lineas):
+    # Con coordenadas de entrega validas, las sucursales mas cercanas con stock; si no, ninguna preferencia
+    try:
+        latitud, longitud = Decimal(str(datos.get('latitud'))), Decimal(str(datos.get('longitud')))
+        if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+            return []
+    except (InvalidOperation, ValueError):
+        return []
+    return [id_sucursal for id_sucursal, _ in geo.asignar_sucursales(latitud, longitud, lineas) or []]
+
+
+def crear_pedido(usuario, carrito, datos):
+    """
+    Crea el pedido pendiente con sus detalles y reserva el stock en una sola transaccion,
+    tomandolo de las sucursales mas cercanas al punto de entrega si viene con coordenadas.
+    El carrito queda bloqueado mientras tanto, asi lineas, subtotal y pedido coinciden.
+    Es sincronico a proposito: las transacciones no cruzan llamadas del ORM async,
+    por eso la vista async lo ejecuta con sync_to_async.
+    Devuelve (pedido, vencimiento de la reserva).
+    """
+    try:
+        with transaction.atomic():
+            carrito = Carrito.objects.select_for_update().get(pk=carrito.pk)
+            items = list(DetalleCarrito.objects.filter(id_carrito=carrito, eliminado=False).select_related('id_producto'))
+            total = calcular_total(carrito, items)
+            lineas = [(item.id_producto_id, item.cantidad) for item in items]
+            sucursales = sucursales_para_entrega(datos, lineas)
+            pedido = Pedido.objects.create(
+                id_usuario=usuario,
+                id_carrito=carrito,
+                monto_total=total,
+                direccion_entrega=datos.get('direccion'),
+                estado="pendiente",
+                latitud=datos.get('latitud'),
+                longitud=datos.get('longitud'),
+                sucursal_id=sucursales[0] if sucursales else None,
+            )
+
+            DetallePedido.objects.bulk_create([
+                DetallePedido(
+                    id_pedido=pedido,
+                    id_producto=item.id_producto,
+                    cantidad=item.cantidad,
+                    precio=item.id_producto.precio,
+                    precio_total=item.id_producto.precio * item.cantidad
+                )
+                for item in items
+            ])
+            reservas_pedido = reservas.reservar_stock(pedido, lineas, sucursales)
+            transiciones.registrar_creacion(pedido, usuario)
+    except reservas.StockInsuficiente as e:
+        raise CheckoutError({'error': 'Stock insuficiente.', 'id_producto': e.id_producto}, status=409)
+    return pedido, reservas_pedido[0].expira
+
+
+def cancelar_pedido(pedido):
+    # Si no se pudo crear la sesion de pago se cancela; la transicion devuelve el stock
+    transiciones.transicionar([pedido.id], 'cancelado', usuario=pedido.id_usuario, desde=('pendiente',))
+    pedido.estado = 'cancelado'
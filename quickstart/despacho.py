@@ -0,0 +1,136 @@
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+
+from . import geo, transiciones
+from .models import Pedido, Sucursal
+
+
+def matriz_distancias(latitudes, longitudes):
+    """Distancias haversine en km entre todos los puntos, calculadas de una vez con NumPy."""
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lon = np.radians(np.asarray(longitudes, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2) ** 2
+    return 2 * geo.RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def agrupar_por_barrido(deposito, latitudes, longitudes, capacidad):
+    """
+    Reparte los puntos en lotes de a lo sumo `capacidad` con el metodo de barrido: se
+    ordenan por angulo alrededor del deposito y se cortan en tramos consecutivos, asi cada
+    vehiculo cubre un sector. Devuelve listas de indices.
+    """
+    lat0, lon0 = deposito
+    y = np.asarray(latitudes, dtype=float) - lat0
+    # La longitud se escala por el coseno de la latitud para no achatar los sectores
+    x = (np.asarray(longitudes, dtype=float) - lon0) * np.cos(np.radians(lat0))
+    orden = np.argsort(np.arctan2(y, x), kind='stable')
+    return [orden[inicio:inicio + capacidad].tolist() for inicio in range(0, len(orden), capacidad)]
+
+
+def _vecino_mas_cercano(distancias):
+    # Recorrido que sale del deposito (indice 0) y siempre va al punto sin visitar mas cercano
+    pendientes = np.ones(len(distancias), dtype=bool)
+    pendientes[0] = False
+    recorrido = [0]
+    for _ in range(len(distancias) - 1):
+        fila = np.where(pendientes, distancias[recorrido[-1]], np.inf)
+        siguiente = int(np.argmin(fila))
+        recorrido.append(siguiente)
+        pendientes[siguiente] = False
+    return np.array(recorrido)
+
+
+def _dos_opt(recorrido, distancias, max_pasadas):
+    """
+    Mejora un recorrido cerrado invirtiendo tramos mientras acorten la ruta. Para cada
+    arista (a, b) se evalua contra todas las siguientes (c, d) con una sola operacion
+    vectorizada y se aplica la mejor inversion.
+    """
+    n = len(recorrido)
+    if n < 4:
+        return recorrido
+    for _ in range(max_pasadas):
+        mejoro = False
+        for i in range(n - 2):
+            a, b = recorrido[i], recorrido[i + 1]
+            c = recorrido[i + 2:]
+            d = np.append(recorrido[i + 3:], recorrido[0])
+            delta = distancias[a, c] + distancias[b, d] - distancias[a, b] - distancias[c, d]
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                recorrido[i + 1:i + j + 3] = recorrido[i + 1:i + j + 3][::-1].copy()
+                mejoro = True
+        if not mejoro:
+            break
+    return recorrido
+
+
+def ordenar_ruta(deposito, latitudes, longitudes, max_pasadas=None):
+    """
+    Orden de visita de los puntos saliendo y volviendo al deposito: vecino mas cercano
+    y luego 2-opt. Devuelve (indices en orden de visita, km del recorrido cerrado).
+    """
+    if max_pasadas is None:
+        max_pasadas = settings.DESPACHO_MAX_PASADAS_2OPT
+    distancias = matriz_distancias([deposito[0], *latitudes], [deposito[1], *longitudes])
+    recorrido = _dos_opt(_vecino_mas_cercano(distancias), distancias, max_pasadas)
+    total = float(distancias[recorrido, np.roll(recorrido, -1)].sum())
+    return (recorrido[1:] - 1).tolist(), total
+
+
+def planificar(id_sucursal=None, capacidad=None):
+    """
+    Lotes de entrega de los pedidos confirmados, por sucursal: barrido por capacidad y
+    ruta de cada lote. Los pedidos sin sucursal asignada se atribuyen a la mas cercana.
+    Devuelve (lotes, ids de pedidos sin ubicacion); cada lote es
+    {'sucursal', 'pedidos' (en orden de visita), 'distancia_km'}.
+    """
+    capacidad = capacidad or settings.DESPACHO_CAPACIDAD
+    pedidos = Pedido.objects.filter(estado='confirmado')
+    if id_sucursal is not None:
+        pedidos = pedidos.filter(sucursal_id=id_sucursal)
+    filas = list(pedidos.order_by('id').values_list('id', 'sucursal_id', 'latitud', 'longitud'))
+
+    depositos = {
+        fila[0]: (float(fila[1]), float(fila[2]))
+        for fila in Sucursal.objects.filter(latitud__isnull=False, longitud__isnull=False).values_list('id', 'latitud', 'longitud')
+    }
+    por_sucursal = defaultdict(list)
+    sin_ubicacion = []
+    indice = None
+    for id_pedido, sucursal, latitud, longitud in filas:
+        if latitud is None or longitud is None:
+            sin_ubicacion.append(id_pedido)
+            continue
+        if sucursal not in depositos:
+            indice = indice or geo.indice()
+            sucursal = next((id_cercana for _, id_cercana in indice.cercanas(latitud, longitud) if id_cercana in depositos), None)
+            if sucursal is None:
+                sin_ubicacion.append(id_pedido)
+                continue
+        por_sucursal[sucursal].append((id_pedido, float(latitud), float(longitud)))
+
+    lotes = []
+    for sucursal in sorted(por_sucursal):
+        ids, latitudes, longitudes = (np.array(columna) for columna in zip(*por_sucursal[sucursal]))
+        for grupo in agrupar_por_barrido(depositos[sucursal], latitudes, longitudes, capacidad):
+            orden, distancia = ordenar_ruta(depositos[sucursal], latitudes[grupo], longitudes[grupo])
+            lotes.append({
+                'sucursal': sucursal,
+                'pedidos': ids[grupo][orden].tolist(),
+                'distancia_km': round(distancia, 3),
+            })
+    return lotes, sin_ubicacion
+
+
+def despachar(ids_pedidos, usuario=None):
+    """
+    Pasa a 'enviado', con un solo UPDATE, los pedidos que sigan confirmados. Devuelve los
+    ids que efectivamente cambiaron (otro proceso pudo haber cancelado alguno).
+    """
+    movidos, _ = transiciones.transicionar(ids_pedidos, 'enviado', usuario)
+    return movidos
@@ -0,0 +1,118 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import transiciones
+from .models import Carrito, EventoStripe, Pedido
+
+TIPOS_PROCESADOS = ('checkout.session.completed', 'checkout.session.expired')
+MAX_INTENTOS = 5
+# Espera antes de reintentar un evento fallido: 2, 4, 8, 16... segundos, hasta el maximo
+BACKOFF_SEGUNDOS = 2
+BACKOFF_MAXIMO_SEGUNDOS = 300
+
+
+class EventoInvalido(Exception):
+    # Errores que no se arreglan reintentando
+    pass
+
+
+def registrar_evento(event):
+    """
+    Guarda el evento en la bandeja (outbox) con un INSERT ... ON CONFLICT DO NOTHING.
+    El id de Stripe es unico, asi que los reintentos de Stripe no generan trabajo duplicado.
+    """
+    EventoStripe.objects.bulk_create(
+        [EventoStripe(id_evento=event['id'], tipo=event['type'], payload=event['data']['object'])],
+        ignore_conflicts=True,
+    )
+
+
+def _pedido_del_evento(evento):
+    try:
+        pedido_id = int(evento.payload['metadata']['pedido_id'])
+    except (KeyError, TypeError, ValueError):
+        raise EventoInvalido('El evento no trae metadata.pedido_id.')
+    pedido = Pedido.objects.filter(id=pedido_id).select_related('id_carrito').first()
+    if pedido is None:
+        raise EventoInvalido(f'Pedido {pedido_id} inexistente.')
+    return pedido
+
+
+def _completar_checkout(pedido, evento):
+    # La transicion condicional hace idempotente el evento: solo el primero confirma
+    movidos, rechazados = transiciones.transicionar([pedido.id], 'confirmado')
+    if not movidos:
+        # Un pago sobre un pedido cancelado no se pierde: queda en error para reembolsarlo
+        if rechazados[0][1] == 'cancelado':
+            raise EventoInvalido(
+                f'Pago recibido para el pedido {pedido.id} cancelado (payment_intent '
+                f'{evento.payload.get("payment_intent")}); requiere reembolso.'
+            )
+        return
+
+    carrito = pedido.id_carrito
+    if carrito and not carrito.eliminado:
+        carrito.delete()
+        Carrito.objects.create(id_usuario_id=pedido.id_usuario_id, fecha_creacion=timezone.now())
+
+
+def _expirar_checkout(pedido):
+    # Solo si sigue pendiente; al cancelarlo la transicion devuelve el stock reservado
+    transiciones.transicionar([pedido.id], 'cancelado', desde=('pendiente',))
+
+
+def procesar_evento(evento):
+    pedido = _pedido_del_evento(evento)
+    if evento.tipo == 'checkout.session.completed':
+        _completar_checkout(pedido, evento)
+    elif evento.tipo == 'checkout.session.expired':
+        _expirar_checkout(pedido)
+
+
+def _proximo_intento(ahora, intentos):
+    return ahora + timedelta(seconds=min(BACKOFF_SEGUNDOS * 2 ** (intentos - 1), BACKOFF_MAXIMO_SEGUNDOS))
+
+
+def procesar_lote(lote=100):
+    """
+    Reclama hasta `lote` eventos pendientes con SELECT ... FOR UPDATE SKIP LOCKED, de modo
+    que varios workers pueden correr en paralelo sin tomar el mismo evento. Un evento que
+    falla vuelve a quedar pendiente con proximo_intento en backoff exponencial, y no se
+    reclama hasta entonces.
+    Devuelve la cantidad de eventos resueltos (procesados o descartados como error): los
+    que se reintentaran no cuentan como avance.
+    """
+    ahora = timezone.now()
+    resueltos = 0
+    with transaction.atomic():
+        eventos = list(
+            EventoStripe.objects.select_for_update(skip_locked=True)
+            .filter(Q(proximo_intento__isnull=True) | Q(proximo_intento__lte=ahora), estado='pendiente')
+            .order_by('id')[:lote]
+        )
+        for evento in eventos:
+            try:
+                with transaction.atomic():
+                    procesar_evento(evento)
+            except EventoInvalido as e:
+                evento.estado = 'error'
+                evento.error = str(e)
+            except Exception as e:
+                # La fila esta bloqueada por este worker, se puede incrementar en Python
+                evento.intentos += 1
+                evento.error = repr(e)
+                if evento.intentos >= MAX_INTENTOS:
+                    evento.estado = 'error'
+                else:
+                    evento.proximo_intento = _proximo_intento(ahora, evento.intentos)
+            else:
+                evento.estado = 'procesado'
+                evento.error = ''
+            if evento.estado != 'pendiente':
+                resueltos += 1
+            evento.fecha_procesado = timezone.now()
+            evento.save(update_fields=['estado', 'intentos', 'error', 'proximo_intento', 'fecha_procesado'])
+    return resueltos
@@ -0,0 +1,172 @@
+import csv
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Pedido, Producto, Inventario
+
+CHUNK_SIZE = 2000
+TAMANO_BLOQUE = 64 * 1024
+FORMATOS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class _Linea:
+    # "Archivo" para csv.writer que devuelve la linea en lugar de guardarla
+    def write(self, valor):
+        return valor
+
+
+def _rango_fechas(params):
+    filtros = {}
+    for param, lookup, dias in (('desde', 'fecha_creacion__gte', 0), ('hasta', 'fecha_creacion__lt', 1)):
+        valor = params.get(param)
+        if not valor:
+            continue
+        fecha = parse_date(valor)
+        if fecha is None:
+            raise ValueError(f'Fecha inválida en "{param}", se espera AAAA-MM-DD.')
+        # Limites como datetime para que el filtro use el indice de fecha_creacion
+        filtros[lookup] = timezone.make_aware(datetime.combine(fecha + timedelta(days=dias), time.min))
+    return filtros
+
+
+def pedidos_para_exportar(params):
+    filtros = _rango_fechas(params)
+    estado = params.get('estado')
+    if estado:
+        if estado not in dict(Pedido.ESTADOS):
+            raise ValueError('Estado inválido.')
+        filtros['estado'] = estado
+    return (
+        Pedido.objects.filter(**filtros)
+        .prefetch_related('detalles')
+        .order_by('id')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def productos_para_exportar(params):
+    filtros = {'eliminado': False}
+    categoria = params.get('categoria')
+    if categoria:
+        if not categoria.isdigit():
+            raise ValueError('Categoría inválida.')
+        filtros['categoria_id'] = int(categoria)
+    return (
+        Producto.objects.filter(**filtros)
+        .select_related('categoria')
+        .prefetch_related(Prefetch(
+            'inventario_set',
+            queryset=Inventario.objects.filter(eliminado=False).order_by('sucursal_id'),
+            to_attr='inventario_activo',
+        ))
+        .order_by('id')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+COLUMNAS_PEDIDO = ['id', 'id_usuario', 'estado', 'monto_total', 'direccion_entrega', 'latitud', 'longitud', 'fecha_creacion']
+COLUMNAS_DETALLE = ['id_producto', 'cantidad', 'precio', 'precio_total']
+
+
+def pedido_a_dict(pedido):
+    datos = {columna: getattr(pedido, columna + '_id' if columna == 'id_usuario' else columna) for columna in COLUMNAS_PEDIDO}
+    datos['detalles'] = [
+        {'id_producto': d.id_producto_id, 'cantidad': d.cantidad, 'precio': d.precio, 'precio_total': d.precio_total}
+        for d in pedido.detalles.all()
+    ]
+    return datos
+
+
+def pedido_a_filas(pedido):
+    # Una fila por detalle, repitiendo los datos del pedido
+    datos = pedido_a_dict(pedido)
+    base = [datos[columna] for columna in COLUMNAS_PEDIDO]
+    for detalle in datos['detalles'] or [dict.fromkeys(COLUMNAS_DETALLE)]:
+        yield base + [detalle[columna] for columna in COLUMNAS_DETALLE]
+
+
+COLUMNAS_PRODUCTO = ['id', 'categoria_id', 'categoria', 'nombre', 'tipo', 'medidas', 'precio']
+COLUMNAS_INVENTARIO = ['sucursal_id', 'cantidad']
+
+
+def producto_a_dict(producto):
+    return {
+        'id': producto.id,
+        'categoria_id': producto.categoria_id,
+        'categoria': producto.categoria.nombre,
+        'nombre': producto.nombre,
+        'tipo': producto.tipo,
+        'medidas': producto.medidas,
+        'precio': producto.precio,
+        'inventario': [
+            {'sucursal_id': i.sucursal_id, 'cantidad': i.cantidad}
+            for i in producto.inventario_activo
+        ],
+    }
+
+
+def producto_a_filas(producto):
+    datos = producto_a_dict(producto)
+    base = [datos[columna] for columna in COLUMNAS_PRODUCTO]
+    for inventario in datos['inventario'] or [dict.fromkeys(COLUMNAS_INVENTARIO)]:
+        yield base + [inventario[columna] for columna in COLUMNAS_INVENTARIO]
+
+
+def lineas_ndjson(objetos, a_dict):
+    for obj in objetos:
+        yield json.dumps(a_dict(obj), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def lineas_csv(objetos, columnas, a_filas):
+    writer = csv.writer(_Linea())
+    yield writer.writerow(columnas)
+    for obj in objetos:
+        for fila in a_filas(obj):
+            yield writer.writerow(fila)
+
+
+def _en_bloques(lineas):
+    # Agrupa lineas para no emitir un chunk HTTP por fila
+    bloque = []
+    tamano = 0
+    for linea in lineas:
+        bloque.append(linea)
+        tamano += len(linea)
+        if tamano >= TAMANO_BLOQUE:
+            yield ''.join(bloque).encode('utf-8')
+            bloque = []
+            tamano = 0
+    if bloque:
+        yield ''.join(bloque).encode('utf-8')
+
+
+def _gzip(bloques):
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for bloque in bloques:
+        comprimido = compresor.compress(bloque)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+def respuesta_exportacion(lineas, nombre, formato, comprimir):
+    contenido = _en_bloques(lineas)
+    content_type = FORMATOS[formato]
+    archivo = f'{nombre}.{formato}'
+    if comprimir:
+        contenido = _gzip(contenido)
+        content_type = 'application/gzip'
+        archivo += '.gz'
+    response = StreamingHttpResponse(contenido, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{archivo}"'
+    return response
@@ -0,0 +1,167 @@
+import heapq
+import math
+import threading
+from collections import defaultdict
+
+from .cache import versiones
+from .models import Inventario, Sucursal
+
+RADIO_TIERRA_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (float(lat1), float(lon1), float(lat2), float(lon2)))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _cartesiano(lat, lon):
+    # Punto sobre la esfera unitaria: la distancia euclidea (cuerda) crece con la de gran circulo,
+    # asi el KD-tree no sufre el corte en +-180 ni la deformacion cerca de los polos
+    lat, lon = math.radians(float(lat)), math.radians(float(lon))
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def _cuerda_a_km(cuadrado):
+    return 2 * RADIO_TIERRA_KM * math.asin(min(1.0, math.sqrt(cuadrado) / 2))
+
+
+class IndiceSucursales:
+    """
+    KD-tree en memoria sobre las sucursales con coordenadas. Los nodos viven en listas
+    paralelas (punto, eje, hijo izquierdo, hijo derecho) para no crear un objeto por nodo.
+    """
+
+    def __init__(self, sucursales):
+        # sucursales: iterable de (id, latitud, longitud)
+        self.ids = []
+        self.puntos = []
+        for id_sucursal, latitud, longitud in sucursales:
+            self.ids.append(id_sucursal)
+            self.puntos.append(_cartesiano(latitud, longitud))
+        self.eje = [0] * len(self.ids)
+        self.izquierdo = [-1] * len(self.ids)
+        self.derecho = [-1] * len(self.ids)
+        self.raiz = self._construir(list(range(len(self.ids))), 0)
+
+    def _construir(self, indices, profundidad):
+        if not indices:
+            return -1
+        eje = profundidad % 3
+        indices.sort(key=lambda i: self.puntos[i][eje])
+        medio = len(indices) // 2
+        nodo = indices[medio]
+        self.eje[nodo] = eje
+        self.izquierdo[nodo] = self._construir(indices[:medio], profundidad + 1)
+        self.derecho[nodo] = self._construir(indices[medio + 1:], profundidad + 1)
+        return nodo
+
+    def __len__(self):
+        return len(self.ids)
+
+    def cercanas(self, latitud, longitud):
+        """
+        Genera (distancia_km, id_sucursal) de la mas cercana a la mas lejana, de a una y
+        bajo demanda: busqueda best-first con una cola de prioridad de nodos y puntos, asi
+        quien solo necesita las primeras k no recorre el arbol entero.
+        """
+        objetivo = _cartesiano(latitud, longitud)
+        cola = [(0.0, 1, self.raiz)] if self.raiz >= 0 else []
+        while cola:
+            cota, es_nodo, nodo = heapq.heappop(cola)
+            if not es_nodo:
+                yield _cuerda_a_km(cota), self.ids[nodo]
+                continue
+            punto = self.puntos[nodo]
+            heapq.heappush(cola, (sum((a - b) ** 2 for a, b in zip(punto, objetivo)), 0, nodo))
+            diferencia = objetivo[self.eje[nodo]] - punto[self.eje[nodo]]
+            cerca, lejos = (self.izquierdo[nodo], self.derecho[nodo]) if diferencia < 0 else (self.derecho[nodo], self.izquierdo[nodo])
+            if cerca >= 0:
+                heapq.heappush(cola, (cota, 1, cerca))
+            if lejos >= 0:
+                heapq.heappush(cola, (max(cota, diferencia * diferencia), 1, lejos))
+
+
+_bloqueo = threading.Lock()
+_indice = None  # (version de Sucursal, IndiceSucursales)
+
+
+def indice():
+    """Indice del proceso; se reconstruye cuando cambia la version de Sucursal en el cache."""
+    global _indice
+    version = versiones([Sucursal])[0]
+    actual = _indice
+    if actual is not None and actual[0] == version:
+        return actual[1]
+    with _bloqueo:
+        if _indice is None or _indice[0] != version:
+            filas = Sucursal.objects.filter(latitud__isnull=False, longitud__isnull=False).values_list('id', 'latitud', 'longitud')
+            _indice = (version, IndiceSucursales(filas))
+        return _indice[1]
+
+
+def _cubre(disponible, pendientes):
+    return all(disponible.get(id_producto, 0) >= cantidad for id_producto, cantidad in pendientes.items())
+
+
+def asignar_sucursales(latitud, longitud, lineas):
+    """
+    Sucursales para entregar `lineas` ((id_producto, cantidad)) en el punto dado, con una
+    sola consulta de Inventario (ver elegir_sucursales). Devuelve [(id_sucursal, distancia_km)]
+    en orden de preferencia, o None si entre todas las sucursales con coordenadas no alcanza.
+    """
+    pendientes = defaultdict(int)
+    for id_producto, cantidad in lineas:
+        pendientes[id_producto] += cantidad
+    if not pendientes:
+        return []
+
+    # Solo las sucursales que estan en el indice: si no, elegir_sucursales nunca completa
+    # las candidatas y recorre el arbol entero
+    stock = defaultdict(dict)
+    for id_sucursal, id_producto, cantidad in Inventario.objects.filter(
+        producto_id__in=list(pendientes), sucursal__eliminado=False, cantidad__gt=0,
+        sucursal__latitud__isnull=False, sucursal__longitud__isnull=False,
+    ).values_list('sucursal_id', 'producto_id', 'cantidad'):
+        stock[id_sucursal][id_producto] = cantidad
+    return elegir_sucursales(indice(), stock, pendientes, latitud, longitud)
+
+
+def elegir_sucursales(indice_sucursales, stock, pendientes, latitud, longitud):
+    """
+    La sucursal mas cercana que tenga todo el stock o, si ninguna alcanza sola, un conjunto
+    chico elegido en forma voraz (la que mas unidades faltantes cubre y, a igualdad, la mas
+    cercana). `stock` es {id_sucursal: {id_producto: cantidad}} y `pendientes`
+    {id_producto: cantidad}; no toca la base.
+    """
+    if not stock:
+        return None
+    # Recorrido por distancia: se corta en la primera que cubre todo
+    candidatas = []
+    for distancia, id_sucursal in indice_sucursales.cercanas(latitud, longitud):
+        if id_sucursal not in stock:
+            continue
+        if _cubre(stock[id_sucursal], pendientes):
+            return [(id_sucursal, distancia)]
+        candidatas.append((id_sucursal, distancia))
+        if len(candidatas) == len(stock):
+            break
+
+    pendientes = dict(pendientes)
+    elegidas = []
+    while pendientes:
+        def aporte(candidata):
+            disponible = stock[candidata[0]]
+            return sum(min(disponible.get(id_producto, 0), cantidad) for id_producto, cantidad in pendientes.items())
+
+        # max() se queda con la primera de las empatadas, que es la mas cercana
+        mejor = max(candidatas, key=aporte, default=None)
+        if mejor is None or aporte(mejor) == 0:
+            return None
+        elegidas.append(mejor)
+        candidatas.remove(mejor)
+        for id_producto in list(pendientes):
+            pendientes[id_producto] -= min(stock[mejor[0]].get(id_producto, 0), pendientes[id_producto])
+            if pendientes[id_producto] == 0:
+                del pendientes[id_producto]
+    return elegidas
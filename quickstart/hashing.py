@@ -0,0 +1,35 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+_pool = None
+
+
+def _executor():
+    # Hilos y no procesos: pbkdf2_hmac (hashlib), bcrypt y argon2 liberan el GIL mientras calculan.
+    # El tope (HASH_WORKERS, un hilo por nucleo) evita que una ola de logins sature la CPU
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=settings.HASH_WORKERS, thread_name_prefix='hash')
+    return _pool
+
+
+async def _en_pool(funcion, *args):
+    return await asyncio.wrap_future(_executor().submit(funcion, *args))
+
+
+async def hashear(password):
+    return await _en_pool(make_password, password)
+
+
+def _verificar(password, codificado):
+    actualizar = []
+    valida = check_password(password, codificado, setter=actualizar.append)
+    return valida, bool(actualizar)
+
+
+async def verificar(password, codificado):
+    """Devuelve (valida, necesita_rehash) sin bloquear el event loop."""
+    return await _en_pool(_verificar, password, codificado)
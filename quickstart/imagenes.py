@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from PIL import features
+
+from .cache import incrementar_version
+from .miniaturas import generar_variantes
+from .models import Producto
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_hilos = None
+
+
+def _executor():
+    # Pool de procesos compartido: Pillow libera poco el GIL al codificar, los hilos no alcanzan.
+    # 'spawn' explicito: no depende del metodo por defecto de la plataforma ni hace fork de un
+    # servidor con hilos; los procesos solo importan quickstart.miniaturas (y el modulo
+    # principal, que por eso necesita su if __name__ == '__main__', como manage.py)
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.IMAGENES_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _hilos_executor():
+    # Lectura del original, espera del pool y guardado, fuera del hilo del request
+    global _hilos
+    if _hilos is None:
+        _hilos = ThreadPoolExecutor(max_workers=settings.IMAGENES_WORKERS, thread_name_prefix='imagenes')
+    return _hilos
+
+
+def formatos_disponibles():
+    return [formato for formato in settings.IMAGENES_FORMATOS if features.check(formato)]
+
+
+def nombre_variante(nombre, ancho, formato, contenido):
+    # Con hash del contenido: el nombre nunca se reutiliza y se puede cachear como inmutable
+    carpeta, archivo = os.path.split(nombre)
+    base = os.path.splitext(archivo)[0]
+    huella = hashlib.sha256(contenido).hexdigest()[:12]
+    return os.path.join(carpeta, 'variantes', f'{base}_{ancho}.{huella}.{formato}')
+
+
+def enviar(nombre):
+    # Lee el original en este proceso y encola la generacion; devuelve el Future del pool
+    with default_storage.open(nombre, 'rb') as archivo:
+        contenido = archivo.read()
+    return _executor().submit(generar_variantes, contenido, tuple(settings.IMAGENES_ANCHOS), formatos_disponibles())
+
+
+def guardar_variantes(id_producto, nombre, variantes):
+    """
+    Escribe los archivos y registra sus nombres en Producto.foto_variantes, solo si la foto
+    del producto sigue siendo `nombre` (si se subio otra mientras tanto, se descarta).
+    """
+    registro = {'origen': nombre}
+    for formato, por_ancho in variantes.items():
+        registro[formato] = {}
+        for ancho, contenido in por_ancho.items():
+            destino = nombre_variante(nombre, ancho, formato, contenido)
+            if not default_storage.exists(destino):
+                destino = default_storage.save(destino, ContentFile(contenido))
+            registro[formato][str(ancho)] = destino
+    if Producto.all_objects.filter(pk=id_producto, foto=nombre).update(foto_variantes=registro):
+        incrementar_version(Producto)
+        return True
+    return False
+
+
+def _procesar(id_producto, nombre):
+    try:
+        guardar_variantes(id_producto, nombre, enviar(nombre).result())
+    except Exception:
+        logger.exception('No se pudieron generar las variantes de %s', nombre)
+    finally:
+        # Los hilos del pool no cierran sus conexiones
+        connections.close_all()
+
+
+def programar(id_producto, nombre):
+    """Genera las variantes en segundo plano, fuera del request (tambien la lectura del original)."""
+    try:
+        _hilos_executor().submit(_procesar, id_producto, nombre)
+    except Exception:
+        logger.exception('No se pudo encolar la imagen %s', nombre)
+
+
+def srcset(producto, request=None):
+    """{formato: 'url 160w, url 320w, ...'} de las variantes de la foto actual, o {} si aun no existen."""
+    variantes = producto.foto_variantes or {}
+    if not producto.foto or variantes.get('origen') != producto.foto.name:
+        return {}
+    resultado = {}
+    for formato, por_ancho in variantes.items():
+        if formato == 'origen':
+            continue
+        urls = []
+        for ancho, nombre in sorted(por_ancho.items(), key=lambda item: int(item[0])):
+            url = default_storage.url(nombre)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls.append(f'{url} {ancho}w')
+        resultado[formato] = ', '.join(urls)
+    return resultado
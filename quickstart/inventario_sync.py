@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .cache import incrementar_version
+from .models import Inventario, Producto, Reserva, Sucursal
+
+CHUNK_SIZE = 5000
+MAX_ERRORES = 1000
+COLUMNAS = ('producto', 'sucursal', 'cantidad')
+
+
+def leer_csv(archivo):
+    # archivo binario o de texto; se lee de a una fila para no cargarlo entero
+    if isinstance(archivo.read(0), bytes):
+        archivo = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    return csv.DictReader(archivo)
+
+
+def leer_json(archivo):
+    datos = json.load(archivo)
+    if isinstance(datos, dict):
+        datos = datos.get('filas', [])
+    if not isinstance(datos, list):
+        raise ValueError('Se espera una lista de filas o {"filas": [...]}.')
+    return datos
+
+
+def _en_chunks(filas, tamano):
+    filas = iter(filas)
+    while True:
+        chunk = list(islice(filas, tamano))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _FilaInvalida(Exception):
+    pass
+
+
+def _convertir(fila):
+    if not isinstance(fila, dict):
+        raise _FilaInvalida('fila con formato inválido')
+    try:
+        producto, sucursal, cantidad = (int(fila[columna]) for columna in COLUMNAS)
+    except KeyError as e:
+        raise _FilaInvalida(f'falta la columna {e.args[0]}')
+    except (TypeError, ValueError):
+        raise _FilaInvalida('valor no numérico')
+    if cantidad < 0:
+        raise _FilaInvalida('cantidad negativa')
+    return producto, sucursal, cantidad
+
+
+def _validar_chunk(chunk, inicio, errores):
+    """
+    Convierte y valida un chunk con dos consultas (productos y sucursales existentes).
+    Devuelve {(producto, sucursal): cantidad}; si se repite un par gana la ultima fila.
+    """
+    convertidas = []
+    for numero, fila in enumerate(chunk, start=inicio):
+        try:
+            convertidas.append((numero, *_convertir(fila)))
+        except _FilaInvalida as e:
+            errores.append({'fila': numero, 'error': str(e)})
+
+    productos = set(Producto.objects.filter(id__in={f[1] for f in convertidas}, eliminado=False).values_list('id', flat=True))
+    sucursales = set(Sucursal.objects.filter(id__in={f[2] for f in convertidas}, eliminado=False).values_list('id', flat=True))
+
+    validas = {}
+    for numero, producto, sucursal, cantidad in convertidas:
+        if producto not in productos:
+            errores.append({'fila': numero, 'error': f'producto {producto} inexistente'})
+        elif sucursal not in sucursales:
+            errores.append({'fila': numero, 'error': f'sucursal {sucursal} inexistente'})
+        else:
+            validas[(producto, sucursal)] = cantidad
+    return validas
+
+
+def _reservado(validas):
+    """
+    Unidades en reservas activas por (producto, sucursal) del chunk. Bloquea antes las filas
+    de Inventario, en orden de id como reservas, para que nadie reserve ni libere en el medio.
+    """
+    productos = {producto for producto, _ in validas}
+    sucursales = {sucursal for _, sucursal in validas}
+    list(
+        Inventario.all_objects.select_for_update()
+        .filter(producto_id__in=productos, sucursal_id__in=sucursales)
+        .order_by('id').values_list('id', flat=True)
+    )
+    filas = (
+        Reserva.objects.filter(estado='activa', inventario__producto_id__in=productos, inventario__sucursal_id__in=sucursales)
+        .values_list('inventario__producto_id', 'inventario__sucursal_id')
+        .annotate(total=Sum('cantidad'))
+        .order_by()
+    )
+    return {(producto, sucursal): total for producto, sucursal, total in filas}
+
+
+def sincronizar(filas, chunk_size=CHUNK_SIZE):
+    """
+    Aplica (producto, sucursal, cantidad) sobre Inventario por chunks con un
+    INSERT ... ON CONFLICT (producto, sucursal) DO UPDATE por chunk. Las filas con
+    errores se omiten y se informan (numeradas desde 1, sin contar el encabezado).
+    La cantidad del feed es el stock fisico: se guarda descontando las reservas activas,
+    que ya se restaron de Inventario y vuelven a sumarse al liberarse.
+    """
+    errores = []
+    aplicadas = 0
+    inicio = 1
+    for chunk in _en_chunks(filas, chunk_size):
+        validas = _validar_chunk(chunk, inicio, errores)
+        inicio += len(chunk)
+        if not validas:
+            continue
+        with transaction.atomic():
+            reservado = _reservado(validas)
+            Inventario.objects.bulk_create(
+                [
+                    Inventario(
+                        producto_id=producto, sucursal_id=sucursal, eliminado=False,
+                        cantidad=max(cantidad - reservado.get((producto, sucursal), 0), 0),
+                    )
+                    for (producto, sucursal), cantidad in validas.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['producto', 'sucursal'],
+                update_fields=['cantidad', 'eliminado'],
+            )
+        aplicadas += len(validas)
+
+    if aplicadas:
+        incrementar_version(Inventario)
+    return {
+        'filas': inicio - 1,
+        'aplicadas': aplicadas,
+        'con_error': len(errores),
+        'errores': sorted(errores, key=lambda e: e['fila'])[:MAX_ERRORES],
+    }
@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from quickstart import benchmark, pagos
+from quickstart.management.commands.stub_pagos import StubStripeHandler
+from quickstart.models import Producto
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark de punta a punta: siembra un dataset y recorre catálogo, carrito, pago (Stripe simulado) '
+        'y webhook con usuarios concurrentes, en proceso y/o sobre uvicorn. Reporta req/s, p50/p95/p99 y consultas SQL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modo', choices=['inproceso', 'uvicorn', 'ambos'], default='inproceso')
+        parser.add_argument('--productos', type=int, default=1000)
+        parser.add_argument('--usuarios', type=int, default=50)
+        parser.add_argument('--sucursales', type=int, default=3)
+        parser.add_argument('--concurrencia', type=int, default=8, help='Usuarios virtuales en paralelo.')
+        parser.add_argument('--iteraciones', type=int, default=20, help='Recorridos por usuario virtual.')
+        parser.add_argument('--puerto', type=int, default=8765, help='Puerto de uvicorn.')
+        parser.add_argument('--latencia-stripe', type=float, default=50, help='Milisegundos del stub de Stripe.')
+        parser.add_argument('--salida', help='Archivo JSON con los resultados, para comparar corridas.')
+        parser.add_argument(
+            '--permitir-escritura', action='store_true',
+            help='Confirma que se pueden crear (y luego borrar) datos "bench" en la base configurada.',
+        )
+        parser.add_argument('--conservar', action='store_true', help='No borra los datos "bench" al terminar.')
+
+    def handle(self, *args, **options):
+        if not options['permitir_escritura']:
+            raise CommandError(
+                f"El benchmark crea usuarios, productos y pedidos en la base {settings.DATABASES['default']['NAME']!r}. "
+                'Úselo contra una base de prueba y confirme con --permitir-escritura.'
+            )
+        StubStripeHandler.latencia = options['latencia_stripe'] / 1000
+        stub = ThreadingHTTPServer(('127.0.0.1', 0), StubStripeHandler)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+        base_original = settings.STRIPE_API_BASE
+        settings.STRIPE_API_BASE = f'http://127.0.0.1:{stub.server_address[1]}'
+        pagos._cliente = None
+
+        try:
+            usuarios = benchmark.sembrar(options['productos'], options['usuarios'], options['sucursales'])
+            ids_productos = list(Producto.objects.filter(categoria__nombre=benchmark.PREFIJO).values_list('id', flat=True))
+            modos = ['inproceso', 'uvicorn'] if options['modo'] == 'ambos' else [options['modo']]
+            resultados = {}
+            for modo in modos:
+                self.stdout.write(f'== {modo}')
+                if modo == 'inproceso':
+                    resultados[modo] = benchmark.ejecutar(
+                        usuarios, ids_productos, benchmark.ClienteInProceso, options['concurrencia'], options['iteraciones']
+                    )
+                else:
+                    resultados[modo] = self._sobre_uvicorn(usuarios, ids_productos, options)
+                self._imprimir(resultados[modo])
+        finally:
+            stub.shutdown()
+            settings.STRIPE_API_BASE = base_original
+            pagos._cliente = None
+            if not options['conservar']:
+                benchmark.limpiar()
+                self.stdout.write('Datos "bench" eliminados.')
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f"Resultados en {options['salida']}"))
+
+    def _sobre_uvicorn(self, usuarios, ids_productos, options):
+        import uvicorn
+        from django.core.asgi import get_asgi_application
+
+        servidor = uvicorn.Server(uvicorn.Config(
+            get_asgi_application(), host='127.0.0.1', port=options['puerto'], log_level='warning', lifespan='off',
+        ))
+        hilo = threading.Thread(target=servidor.run, daemon=True)
+        hilo.start()
+        while not servidor.started:
+            if not hilo.is_alive():
+                raise RuntimeError('uvicorn no pudo iniciar.')
+            time.sleep(0.05)
+
+        base = f"http://127.0.0.1:{options['puerto']}"
+        try:
+            return benchmark.ejecutar(
+                usuarios, ids_productos, lambda token: benchmark.ClienteHttp(token, base),
+                options['concurrencia'], options['iteraciones'],
+            )
+        finally:
+            servidor.should_exit = True
+            hilo.join()
+
+    def _imprimir(self, resultado):
+        self.stdout.write(f"{resultado['peticiones']} peticiones en {resultado['segundos']} s ({resultado['por_segundo']} req/s)")
+        self.stdout.write(f"{'endpoint':<32}{'n':>7}{'err':>6}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'sql':>7}")
+        for endpoint, datos in resultado['endpoints'].items():
+            sql = '-' if datos['consultas_promedio'] is None else datos['consultas_promedio']
+            self.stdout.write(
+                f"{endpoint:<32}{datos['peticiones']:>7}{datos['errores']:>6}{datos['por_segundo']:>9}"
+                f"{datos['p50_ms']:>9}{datos['p95_ms']:>9}{datos['p99_ms']:>9}{sql:>7}"
+            )
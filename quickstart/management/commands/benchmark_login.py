@@ -0,0 +1,44 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import check_password, get_hasher, make_password
+from django.core.management.base import BaseCommand
+
+
+def _medir(codificado, hilos, segundos):
+    # Verificaciones por segundo con `hilos` hilos verificando en paralelo durante `segundos`
+    fin = time.perf_counter() + segundos
+
+    def trabajar():
+        hechas = 0
+        while time.perf_counter() < fin:
+            check_password('benchmark-password', codificado)
+            hechas += 1
+        return hechas
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        total = sum(pool.map(lambda _: trabajar(), range(hilos)))
+    return total / (time.perf_counter() - inicio)
+
+
+class Command(BaseCommand):
+    help = 'Mide cuántos logins (verificaciones de password) por segundo y por núcleo soporta el hasher configurado.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--segundos', type=float, default=3.0, help='Duración de cada medición.')
+        parser.add_argument('--hilos', type=int, nargs='+', help='Cantidades de hilos a medir (por defecto 1 y la cantidad de núcleos).')
+
+    def handle(self, *args, **options):
+        nucleos = os.cpu_count() or 1
+        hilos = options['hilos'] or sorted({1, nucleos})
+        codificado = make_password('benchmark-password')
+        hasher = get_hasher()
+        self.stdout.write(f'Hasher: {hasher.algorithm}, núcleos: {nucleos}')
+
+        for cantidad in hilos:
+            por_segundo = _medir(codificado, cantidad, options['segundos'])
+            self.stdout.write(
+                f'{cantidad:>3} hilo(s): {por_segundo:8.1f} logins/s, {por_segundo / min(cantidad, nucleos):8.1f} por núcleo'
+            )
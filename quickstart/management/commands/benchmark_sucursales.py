@@ -0,0 +1,68 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from quickstart import geo
+
+
+def _punto(rng):
+    # Puntos repartidos en una region del tamano de un pais
+    return rng.uniform(-55.0, -22.0), rng.uniform(-73.0, -53.0)
+
+
+class Command(BaseCommand):
+    help = 'Compara la búsqueda de la sucursal más cercana con el KD-tree contra el recorrido lineal, en memoria.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sucursales', type=int, default=5000)
+        parser.add_argument('--pedidos', type=int, default=5000)
+        parser.add_argument('--productos', type=int, default=50, help='Productos distintos del stock sintético.')
+        parser.add_argument('--semilla', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['semilla'])
+        sucursales = [(i, *_punto(rng)) for i in range(1, options['sucursales'] + 1)]
+        pedidos = [_punto(rng) for _ in range(options['pedidos'])]
+
+        inicio = time.perf_counter()
+        indice = geo.IndiceSucursales(sucursales)
+        construccion = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        cercanas = [next(indice.cercanas(lat, lon))[1] for lat, lon in pedidos]
+        con_indice = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        lineales = [
+            min(sucursales, key=lambda sucursal: geo.haversine_km(lat, lon, sucursal[1], sucursal[2]))[0]
+            for lat, lon in pedidos
+        ]
+        lineal = time.perf_counter() - inicio
+        distintas = sum(a != b for a, b in zip(cercanas, lineales))
+
+        # Asignacion completa con stock sintetico: cada sucursal tiene un tercio de los productos
+        productos = range(1, options['productos'] + 1)
+        stock = {
+            id_sucursal: {id_producto: rng.randint(1, 5) for id_producto in rng.sample(productos, max(1, len(productos) // 3))}
+            for id_sucursal, _, _ in sucursales
+        }
+        inicio = time.perf_counter()
+        tamanos = []
+        for lat, lon in pedidos:
+            pendientes = {id_producto: rng.randint(1, 3) for id_producto in rng.sample(productos, 3)}
+            elegidas = geo.elegir_sucursales(indice, stock, pendientes, lat, lon)
+            tamanos.append(len(elegidas) if elegidas else 0)
+        asignacion = time.perf_counter() - inicio
+
+        cantidad = len(pedidos)
+        self.stdout.write(f'{len(sucursales)} sucursales, {cantidad} pedidos')
+        self.stdout.write(f'  construcción del KD-tree: {construccion * 1000:8.1f} ms')
+        self.stdout.write(f'  más cercana (KD-tree):    {con_indice / cantidad * 1e6:8.1f} µs/pedido')
+        self.stdout.write(f'  más cercana (lineal):     {lineal / cantidad * 1e6:8.1f} µs/pedido')
+        self.stdout.write(f'  asignación con stock:     {asignacion / cantidad * 1e6:8.1f} µs/pedido, '
+                          f'{sum(tamanos) / cantidad:.2f} sucursales/pedido')
+        if distintas:
+            self.stdout.write(self.style.WARNING(f'{distintas} resultado(s) distintos del recorrido lineal.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('El KD-tree coincide con el recorrido lineal.'))
@@ -0,0 +1,48 @@
+from concurrent.futures import as_completed
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.db.models.fields.json import KT
+
+from quickstart import imagenes
+from quickstart.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Genera en paralelo las miniaturas WebP/AVIF de las fotos de productos que aún no las tienen.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help='Regenera también las que ya existen.')
+        parser.add_argument('--lote', type=int, default=200, help='Imágenes encoladas a la vez.')
+
+    def handle(self, *args, **options):
+        productos = Producto.objects.exclude(foto='').exclude(foto__isnull=True)
+        if not options['todas']:
+            productos = productos.annotate(origen=KT('foto_variantes__origen')).filter(
+                Q(origen__isnull=True) | ~Q(origen=F('foto'))
+            )
+        pendientes = productos.order_by('id').values_list('id', 'foto')
+
+        generadas = errores = 0
+        ultimo = 0
+        while True:
+            lote = list(pendientes.filter(id__gt=ultimo)[:options['lote']])
+            if not lote:
+                break
+            ultimo = lote[-1][0]
+            futuros = {}
+            for id_producto, nombre in lote:
+                try:
+                    futuros[imagenes.enviar(nombre)] = (id_producto, nombre)
+                except OSError as e:
+                    errores += 1
+                    self.stderr.write(f'{nombre}: {e}')
+            for futuro in as_completed(futuros):
+                id_producto, nombre = futuros[futuro]
+                try:
+                    imagenes.guardar_variantes(id_producto, nombre, futuro.result())
+                    generadas += 1
+                except Exception as e:
+                    errores += 1
+                    self.stderr.write(f'{nombre}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'{generadas} foto(s) procesadas, {errores} con error.'))
@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from quickstart import inventario_sync
+
+
+class Command(BaseCommand):
+    help = 'Sincroniza el inventario desde un archivo CSV o JSON con filas (producto, sucursal, cantidad).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo CSV o JSON.')
+        parser.add_argument('--formato', choices=['csv', 'json'], help='Por defecto se deduce de la extensión.')
+        parser.add_argument('--chunk', type=int, default=inventario_sync.CHUNK_SIZE, help='Filas por lote.')
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        formato = options['formato'] or ('json' if ruta.lower().endswith('.json') else 'csv')
+        try:
+            with open(ruta, 'rb') as archivo:
+                filas = inventario_sync.leer_json(archivo) if formato == 'json' else inventario_sync.leer_csv(archivo)
+                resultado = inventario_sync.sincronizar(filas, chunk_size=options['chunk'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in resultado['errores']:
+            self.stderr.write(f"fila {error['fila']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['aplicadas']} de {resultado['filas']} filas aplicadas, {resultado['con_error']} con error."
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from quickstart.reservas import liberar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Libera el stock de las reservas vencidas hace más de RESERVA_GRACIA_MINUTOS y cancela los pedidos pendientes asociados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Pedidos procesados por iteración.')
+
+    def handle(self, *args, **options):
+        pedidos = liberar_vencidas(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'Reservas liberadas de {pedidos} pedido(s).'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from quickstart import despacho
+
+
+class Command(BaseCommand):
+    help = 'Arma los lotes de entrega de los pedidos confirmados por sucursal y, con --despachar, los pasa a enviado.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sucursal', type=int, help='Solo los pedidos de esta sucursal.')
+        parser.add_argument('--capacidad', type=int, help='Pedidos por vehículo (por defecto DESPACHO_CAPACIDAD).')
+        parser.add_argument('--despachar', action='store_true', help='Marca los pedidos planificados como enviados.')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        lotes, sin_ubicacion = despacho.planificar(options['sucursal'], options['capacidad'])
+        segundos = time.perf_counter() - inicio
+
+        for numero, lote in enumerate(lotes, 1):
+            self.stdout.write(
+                f'Lote {numero} (sucursal {lote["sucursal"]}): {len(lote["pedidos"])} pedido(s), '
+                f'{lote["distancia_km"]:.1f} km: {", ".join(map(str, lote["pedidos"]))}'
+            )
+        if sin_ubicacion:
+            self.stdout.write(self.style.WARNING(f'{len(sin_ubicacion)} pedido(s) sin ubicación: {", ".join(map(str, sin_ubicacion))}'))
+
+        planificados = sum(len(lote['pedidos']) for lote in lotes)
+        mensaje = f'{planificados} pedido(s) en {len(lotes)} lote(s), planificados en {segundos:.2f} s.'
+        if options['despachar']:
+            despachados = despacho.despachar([id_pedido for lote in lotes for id_pedido in lote['pedidos']])
+            mensaje += f' {len(despachados)} marcado(s) como enviados.'
+        self.stdout.write(self.style.SUCCESS(mensaje))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from quickstart.eventos_stripe import procesar_lote
+
+
+class Command(BaseCommand):
+    help = 'Procesa los eventos de Stripe encolados por el webhook.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=100, help='Eventos reclamados por transacción.')
+        parser.add_argument('--continuo', action='store_true', help='Sigue esperando eventos nuevos.')
+        parser.add_argument('--intervalo', type=float, default=1.0, help='Segundos de espera cuando no hay eventos.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            # Solo los eventos resueltos cuentan como avance; los fallidos esperan su backoff
+            procesados = procesar_lote(options['lote'])
+            total += procesados
+            if procesados:
+                continue
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+        self.stdout.write(self.style.SUCCESS(f'{total} evento(s) procesados.'))
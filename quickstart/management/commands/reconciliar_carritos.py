@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from quickstart.carrito import carritos_con_diferencias, recalcular_totales
+from quickstart.models import Carrito
+
+
+class Command(BaseCommand):
+    help = 'Corrige los totales desnormalizados (subtotal, cantidad_items) de los carritos que no coinciden con sus lineas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Carritos revisados por consulta.')
+        parser.add_argument('--incluir-eliminados', action='store_true', help='Revisa también carritos eliminados.')
+
+    def handle(self, *args, **options):
+        carritos = Carrito.all_objects.all() if options['incluir_eliminados'] else Carrito.objects.all()
+        corregidos = 0
+        ultimo = 0
+        while True:
+            ids = list(carritos.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:options['lote']])
+            if not ids:
+                break
+            ultimo = ids[-1]
+            con_diferencias = list(carritos_con_diferencias(Carrito.all_objects.filter(id__in=ids)).values_list('id', flat=True))
+            if con_diferencias:
+                corregidos += recalcular_totales(Carrito.all_objects.filter(id__in=con_diferencias))
+        self.stdout.write(self.style.SUCCESS(f'{corregidos} carrito(s) corregidos.'))
@@ -0,0 +1,39 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from quickstart import analitica
+from quickstart.models import Pedido
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los resúmenes de analítica (ventas y pedidos diarios) por tramos de días.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Primer día (AAAA-MM-DD). Por defecto, el del pedido más antiguo.')
+        parser.add_argument('--hasta', help='Último día (AAAA-MM-DD). Por defecto, el del pedido más reciente.')
+        parser.add_argument('--dias', type=int, default=7, help='Días por transacción (los pedidos del tramo quedan bloqueados mientras se recalcula).')
+
+    def handle(self, *args, **options):
+        limites = Pedido.objects.aggregate(primero=Min('fecha_creacion'), ultimo=Max('fecha_creacion'))
+        if limites['primero'] is None and not (options['desde'] and options['hasta']):
+            self.stdout.write(self.style.SUCCESS('No hay pedidos.'))
+            return
+        desde = parse_date(options['desde']) if options['desde'] else timezone.localdate(limites['primero'])
+        hasta = parse_date(options['hasta']) if options['hasta'] else timezone.localdate(limites['ultimo'])
+        if desde is None or hasta is None or desde > hasta:
+            raise CommandError('Rango de fechas inválido.')
+        if options['dias'] < 1:
+            raise CommandError('--dias debe ser al menos 1.')
+
+        tramos = 0
+        inicio = desde
+        while inicio <= hasta:
+            fin = min(inicio + timedelta(days=options['dias'] - 1), hasta)
+            analitica.reconstruir(inicio, fin)
+            tramos += 1
+            inicio = fin + timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'Resúmenes reconstruidos del {desde} al {hasta} en {tramos} tramo(s).'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from quickstart import busqueda
+from quickstart.models import Producto
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de productos por lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000, help='Productos por sentencia.')
+
+    def handle(self, *args, **options):
+        total = 0
+        ultimo = 0
+        while True:
+            ids = list(Producto.objects.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:options['lote']])
+            if not ids:
+                break
+            busqueda.actualizar_productos(ids)
+            total += len(ids)
+            ultimo = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'{total} producto(s) reindexados.'))
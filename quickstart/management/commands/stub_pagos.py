@@ -0,0 +1,63 @@
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from django.core.management.base import BaseCommand
+
+
+class StubStripeHandler(BaseHTTPRequestHandler):
+    latencia = 0.0
+
+    def _responder(self, status, cuerpo):
+        datos = json.dumps(cuerpo).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_POST(self):
+        largo = int(self.headers.get('Content-Length') or 0)
+        params = parse_qs(self.rfile.read(largo).decode('utf-8'))
+        time.sleep(self.latencia)
+
+        if self.path.startswith('/v1/checkout/sessions/') and self.path.endswith('/expire'):
+            id_sesion = self.path[len('/v1/checkout/sessions/'):-len('/expire')]
+            return self._responder(200, {'id': id_sesion, 'object': 'checkout.session', 'status': 'expired'})
+        if self.path != '/v1/checkout/sessions':
+            return self._responder(404, {'error': {'type': 'invalid_request_error', 'message': 'Ruta no soportada por el stub.'}})
+
+        id_sesion = 'cs_test_' + uuid.uuid4().hex
+        self._responder(200, {
+            'id': id_sesion,
+            'object': 'checkout.session',
+            'mode': 'payment',
+            'status': 'open',
+            'expires_at': int(params.get('expires_at', ['0'])[0]),
+            'metadata': {'pedido_id': params.get('metadata[pedido_id]', [None])[0]},
+            'url': f'http://{self.headers.get("Host")}/pay/{id_sesion}',
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Levanta un servidor local que imita la creación y expiración de sesiones de Stripe Checkout (usar con STRIPE_API_BASE).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puerto', type=int, default=12111)
+        parser.add_argument('--latencia', type=float, default=200, help='Milisegundos de espera por respuesta.')
+
+    def handle(self, *args, **options):
+        StubStripeHandler.latencia = options['latencia'] / 1000
+        servidor = ThreadingHTTPServer(('127.0.0.1', options['puerto']), StubStripeHandler)
+        self.stdout.write(f"Stub de pagos en http://127.0.0.1:{options['puerto']} (latencia {options['latencia']} ms)")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.server_close()
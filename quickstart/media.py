@@ -0,0 +1,127 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+BLOQUE = 64 * 1024
+RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Nombres con hash de contenido (p. ej. las variantes de quickstart.imagenes): nunca cambian
+INMUTABLE = re.compile(r'\.[0-9a-f]{12}\.\w+$')
+
+
+def _rango(cabecera, tamano):
+    """
+    (inicio, fin) inclusivo de un Range de un solo tramo, None si no hay Range utilizable
+    (se responde el archivo completo) o 'invalido' si no se puede satisfacer (416).
+    """
+    coincidencia = RANGO.match(cabecera.strip())
+    if not coincidencia:
+        return None  # multiples tramos u otra unidad: se ignora, como permite la RFC
+    inicio, fin = coincidencia.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:
+        # bytes=-N: los ultimos N bytes
+        largo = int(fin)
+        if largo == 0:
+            return 'invalido'
+        return max(tamano - largo, 0), tamano - 1
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        return 'invalido'
+    return inicio, fin
+
+
+def _if_range_vigente(request, etag, modificado):
+    cabecera = request.META.get('HTTP_IF_RANGE')
+    if not cabecera:
+        return True
+    fecha = parse_http_date_safe(cabecera)
+    if fecha is not None:
+        return int(modificado) <= fecha
+    return etag in parse_etags(cabecera)
+
+
+def _leer_tramo(ruta, inicio, largo):
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(inicio)
+        while largo > 0:
+            bloque = archivo.read(min(BLOQUE, largo))
+            if not bloque:
+                break
+            largo -= len(bloque)
+            yield bloque
+
+
+def _descarga_delegada(nombre, ruta):
+    # El servidor web (Apache mod_xsendfile / nginx) envia el archivo y atiende Range por su cuenta
+    response = HttpResponse()
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + nombre
+    else:
+        response['X-Sendfile'] = ruta
+    del response['Content-Type']  # lo decide el servidor web por la extension
+    return response
+
+
+@require_safe
+def servir_media(request, nombre):
+    """
+    Sirve MEDIA_ROOT con validadores (ETag/Last-Modified, 304), Range de un tramo (206) y
+    Cache-Control de larga duracion para los nombres con hash. Con MEDIA_SENDFILE la
+    transferencia se delega al servidor web; si no, FileResponse usa wsgi.file_wrapper
+    (sendfile en gunicorn/uwsgi) para no leer el archivo en Python.
+    """
+    try:
+        ruta = safe_join(settings.MEDIA_ROOT, nombre)
+        estado = os.stat(ruta)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Archivo inexistente.')
+    if not os.path.isfile(ruta):
+        raise Http404('Archivo inexistente.')
+
+    etag = f'"{estado.st_mtime_ns:x}-{estado.st_size:x}"'
+    cabeceras = {
+        'ETag': etag,
+        'Last-Modified': http_date(estado.st_mtime),
+        'Cache-Control': 'public, max-age=31536000, immutable' if INMUTABLE.search(nombre) else 'public, no-cache',
+    }
+
+    condicional = get_conditional_response(request, etag=etag, last_modified=int(estado.st_mtime))
+    if condicional is not None:
+        response = condicional
+    elif settings.MEDIA_SENDFILE:
+        response = _descarga_delegada(nombre, ruta)
+    else:
+        tamano = estado.st_size
+        rango = None
+        if 'HTTP_RANGE' in request.META and _if_range_vigente(request, etag, estado.st_mtime):
+            rango = _rango(request.META['HTTP_RANGE'], tamano)
+        if rango == 'invalido':
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{tamano}'
+        elif rango:
+            inicio, fin = rango
+            tipo = mimetypes.guess_type(ruta)[0]
+            response = StreamingHttpResponse(
+                _leer_tramo(ruta, inicio, fin - inicio + 1),
+                status=206,
+                content_type=tipo or 'application/octet-stream',
+            )
+            response['Content-Length'] = str(fin - inicio + 1)
+            response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+        else:
+            response = FileResponse(open(ruta, 'rb'))
+        response['Accept-Ranges'] = 'bytes'
+
+    for clave, valor in cabeceras.items():
+        response[clave] = valor
+    return response
@@ -0,0 +1,312 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+
+from .autenticacion import CachedJWTAuthentication
+
+logger = logging.getLogger('quickstart.lentos')
+
+# Registro en memoria del proceso. Con varios workers cada uno expone sus propias series
+# y Prometheus las suma al consultar; no hay estado compartido ni dependencias extra.
+_bloqueo = threading.Lock()
+_metricas = {}
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+BUCKETS_CONSULTAS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histograma:
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas, buckets):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.buckets = buckets
+        self.series = {}  # valores de etiquetas -> [conteos por bucket..., suma, total]
+
+    def observar(self, valor, *etiquetas):
+        with _bloqueo:
+            serie = self.series.get(etiquetas)
+            if serie is None:
+                serie = self.series[etiquetas] = [0] * len(self.buckets) + [0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[i] += 1
+                    break
+            serie[-2] += valor
+            serie[-1] += 1
+
+    def lineas(self):
+        for etiquetas, serie in sorted(self.series.items()):
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, serie):
+                acumulado += conteo
+                yield f'{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, le=limite)} {acumulado}'
+            yield f'{self.nombre}_bucket{_etiquetas(self.etiquetas, etiquetas, le="+Inf")} {serie[-1]}'
+            yield f'{self.nombre}_sum{_etiquetas(self.etiquetas, etiquetas)} {serie[-2]}'
+            yield f'{self.nombre}_count{_etiquetas(self.etiquetas, etiquetas)} {serie[-1]}'
+
+
+class Contador:
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiquetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.series = {}
+
+    def incrementar(self, valor, *etiquetas):
+        with _bloqueo:
+            self.series[etiquetas] = self.series.get(etiquetas, 0) + valor
+
+    def lineas(self):
+        for etiquetas, valor in sorted(self.series.items()):
+            yield f'{self.nombre}{_etiquetas(self.etiquetas, etiquetas)} {valor}'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(nombres, valores, **extra):
+    pares = list(zip(nombres, valores)) + list(extra.items())
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{nombre}="{_escapar(valor)}"' for nombre, valor in pares) + '}'
+
+
+def _registrar(metrica):
+    _metricas[metrica.nombre] = metrica
+    return metrica
+
+
+duracion = _registrar(Histograma(
+    'http_request_duration_seconds', 'Duración de la request por ruta.', ('ruta', 'metodo', 'estado'), BUCKETS_SEGUNDOS,
+))
+tamano = _registrar(Histograma('http_response_size_bytes', 'Tamaño de la respuesta por ruta.', ('ruta',), BUCKETS_BYTES))
+consultas = _registrar(Histograma('db_queries_per_request', 'Consultas SQL por request.', ('ruta',), BUCKETS_CONSULTAS))
+tiempo_sql = _registrar(Histograma('db_time_seconds', 'Tiempo en SQL por request.', ('ruta',), BUCKETS_SEGUNDOS))
+tiempo_serializador = _registrar(Histograma(
+    'drf_serializer_seconds', 'Tiempo en serializer.data (to_representation) por request.', ('ruta',), BUCKETS_SEGUNDOS,
+))
+tiempo_render = _registrar(Histograma(
+    'drf_render_seconds', 'Tiempo de render de la respuesta DRF por request.', ('ruta',), BUCKETS_SEGUNDOS,
+))
+tiempo_vista = _registrar(Histograma(
+    'view_seconds', 'Tiempo de la request sin SQL, serializadores ni render.', ('ruta',), BUCKETS_SEGUNDOS,
+))
+proveedor = _registrar(Histograma(
+    'payment_provider_seconds', 'Latencia de las llamadas al proveedor de pagos.', ('operacion', 'resultado'), BUCKETS_SEGUNDOS,
+))
+lentas = _registrar(Contador('http_slow_requests_total', 'Requests sobre METRICAS_UMBRAL_LENTO_MS.', ('ruta',)))
+
+
+class Medicion:
+    __slots__ = ('consultas', 'sql', 'serializador', 'render', 'profundidad', 'sentencias')
+
+    def __init__(self, guardar_sql):
+        self.consultas = 0
+        self.sql = 0.0
+        self.serializador = 0.0
+        self.render = 0.0
+        self.profundidad = 0
+        self.sentencias = [] if guardar_sql else None
+
+    def envolver(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            transcurrido = time.perf_counter() - inicio
+            self.consultas += 1
+            self.sql += transcurrido
+            if self.sentencias is not None:
+                self.sentencias.append((transcurrido, sql))
+
+
+_medicion = contextvars.ContextVar('medicion', default=None)
+
+
+def envolver_sql(execute, sql, params, many, context):
+    # Fijo en cada conexion (signals.medir_conexion). Las conexiones son por hilo y en ASGI
+    # el ORM corre en el hilo de sync_to_async, que recibe la medicion por el ContextVar
+    medicion = _medicion.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    return medicion.envolver(execute, sql, params, many, context)
+
+
+@contextmanager
+def _medir(campo):
+    # Solo cuenta la medicion mas externa: los serializadores anidados corren dentro del
+    # padre y la API navegable renderiza JSON (y serializa sus formularios) dentro del suyo
+    medicion = _medicion.get()
+    if medicion is None or medicion.profundidad:
+        yield
+        return
+    medicion.profundidad += 1
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(medicion, campo, getattr(medicion, campo) + time.perf_counter() - inicio)
+        medicion.profundidad -= 1
+
+
+class SerializadorMedido:
+    """
+    Mixin para los serializers de quickstart.serializers: suma su to_representation a
+    drf_serializer_seconds. Con many=True cada elemento pasa por el del hijo.
+    """
+
+    def to_representation(self, instance):
+        with _medir('serializador'):
+            return super().to_representation(instance)
+
+
+class _RenderMedido:
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with _medir('render'):
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class JSONRendererMedido(_RenderMedido, JSONRenderer):
+    """JSONRenderer que suma su tiempo a drf_render_seconds (DEFAULT_RENDERER_CLASSES)."""
+
+
+class BrowsableAPIRendererMedido(_RenderMedido, BrowsableAPIRenderer):
+    pass
+
+
+@contextmanager
+def medir_proveedor(operacion):
+    """Latencia de una llamada saliente al proveedor de pagos, etiquetada por resultado."""
+    inicio = time.perf_counter()
+    resultado = 'ok'
+    try:
+        yield
+    except Exception:
+        resultado = 'error'
+        raise
+    finally:
+        proveedor.observar(time.perf_counter() - inicio, operacion, resultado)
+
+
+def _ruta(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    return coincidencia.view_name if coincidencia else 'sin_ruta'
+
+
+@contextmanager
+def _instrumentar(medicion):
+    token = _medicion.set(medicion)
+    try:
+        yield
+    finally:
+        _medicion.reset(token)
+
+
+def _bytes(response):
+    if response.streaming:
+        largo = response.get('Content-Length')
+        return int(largo) if largo else None
+    return len(response.content)
+
+
+class MetricasMiddleware:
+    """
+    Por request: duracion, tamano de la respuesta, consultas y tiempo SQL (envolver_sql
+    en todas las conexiones), tiempo en serializadores (SerializadorMedido) y de render
+    (JSONRendererMedido), por nombre de ruta. Con
+    METRICAS_UMBRAL_LENTO_MS registra las requests lentas con sus sentencias mas costosas.
+    Funciona en WSGI y en ASGI sin pasar las vistas async a un hilo.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        medicion = Medicion(guardar_sql=bool(settings.METRICAS_UMBRAL_LENTO_MS))
+        inicio = time.perf_counter()
+        with _instrumentar(medicion):
+            response = self.get_response(request)
+        self._registrar(request, response, medicion, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        medicion = Medicion(guardar_sql=bool(settings.METRICAS_UMBRAL_LENTO_MS))
+        inicio = time.perf_counter()
+        with _instrumentar(medicion):
+            response = await self.get_response(request)
+        self._registrar(request, response, medicion, time.perf_counter() - inicio)
+        return response
+
+    def _registrar(self, request, response, medicion, transcurrido):
+        ruta = _ruta(request)
+        if ruta == 'metricas':
+            return
+        duracion.observar(transcurrido, ruta, request.method, response.status_code)
+        consultas.observar(medicion.consultas, ruta)
+        tiempo_sql.observar(medicion.sql, ruta)
+        tiempo_serializador.observar(medicion.serializador, ruta)
+        tiempo_render.observar(medicion.render, ruta)
+        tiempo_vista.observar(max(transcurrido - medicion.sql - medicion.serializador - medicion.render, 0), ruta)
+        largo = _bytes(response)
+        if largo is not None:
+            tamano.observar(largo, ruta)
+
+        umbral = settings.METRICAS_UMBRAL_LENTO_MS
+        if umbral and transcurrido * 1000 >= umbral:
+            lentas.incrementar(1, ruta)
+            peores = sorted(medicion.sentencias, key=lambda sentencia: sentencia[0], reverse=True)[:settings.METRICAS_SQL_LENTAS]
+            logger.warning(
+                'Request lenta %s %s (%s): %.1f ms, %d consultas, %.1f ms SQL, %.1f ms serializadores, %.1f ms render\n%s',
+                request.method, request.path, ruta, transcurrido * 1000, medicion.consultas,
+                medicion.sql * 1000, medicion.serializador * 1000, medicion.render * 1000,
+                '\n'.join(f'  {segundos * 1000:.1f} ms  {sql}' for segundos, sql in peores),
+            )
+
+
+def _autorizado(request):
+    # Con METRICAS_TOKEN, el scraper manda ese token; si no, hace falta un usuario staff (sesion o JWT)
+    if settings.METRICAS_TOKEN and request.headers.get('Authorization') == f'Bearer {settings.METRICAS_TOKEN}':
+        return True
+    if getattr(request, 'user', None) is not None and request.user.is_staff:
+        return True
+    try:
+        autenticado = CachedJWTAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return autenticado is not None and autenticado[0].is_staff
+
+
+def exponer(request):
+    """Metricas del proceso en formato de texto de Prometheus."""
+    if not _autorizado(request):
+        return HttpResponse(status=401)
+    lineas = []
+    with _bloqueo:
+        for metrica in _metricas.values():
+            lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+            lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+            lineas.extend(metrica.lineas())
+    return HttpResponse('\n'.join(lineas) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 10:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickstart', '0006_pedido_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cantidad', models.PositiveIntegerField()),
+                ('estado', models.CharField(choices=[('activa', 'Activa'), ('consumida', 'Consumida'), ('liberada', 'Liberada')], default='activa', max_length=20)),
+                ('expira', models.DateTimeField()),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('id_pedido', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='quickstart.pedido')),
+                ('inventario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='quickstart.inventario')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'expira'], name='reserva_estado_expira_idx')],
+            },
+        ),
+    ]
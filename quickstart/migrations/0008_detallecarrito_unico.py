@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 10:03
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def unificar_lineas_duplicadas(apps, schema_editor):
+    # Antes de crear el indice unico, se suman las lineas activas repetidas en la primera
+    DetalleCarrito = apps.get_model('quickstart', 'DetalleCarrito')
+    duplicados = (
+        DetalleCarrito.objects.filter(eliminado=False)
+        .values('id_carrito', 'id_producto')
+        .annotate(n=Count('id'), primera=Min('id'), total=Sum('cantidad'))
+        .filter(n__gt=1)
+    )
+    for grupo in duplicados:
+        activas = DetalleCarrito.objects.filter(
+            id_carrito=grupo['id_carrito'], id_producto=grupo['id_producto'], eliminado=False
+        )
+        activas.filter(id=grupo['primera']).update(cantidad=grupo['total'])
+        activas.exclude(id=grupo['primera']).update(eliminado=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickstart', '0007_reserva'),
+    ]
+
+    operations = [
+        migrations.RunPython(unificar_lineas_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='detallecarrito',
+            constraint=models.UniqueConstraint(condition=models.Q(('eliminado', False)), fields=('id_carrito', 'id_producto'), name='uniq_detallecarrito_activo'),
+        ),
+    ]
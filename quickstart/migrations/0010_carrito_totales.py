@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 10:08
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calcular_totales(apps, schema_editor):
+    Carrito = apps.get_model('quickstart', 'Carrito')
+    DetalleCarrito = apps.get_model('quickstart', 'DetalleCarrito')
+    lineas = DetalleCarrito.objects.filter(id_carrito=OuterRef('pk'), eliminado=False).values('id_carrito')
+    subtotal = lineas.annotate(
+        total=Sum(ExpressionWrapper(F('cantidad') * F('id_producto__precio'), output_field=DecimalField(max_digits=12, decimal_places=2)))
+    ).values('total')
+    cantidad = lineas.annotate(total=Sum('cantidad')).values('total')
+    Carrito.objects.update(
+        subtotal=Coalesce(Subquery(subtotal), Value(Decimal('0')), output_field=DecimalField(max_digits=12, decimal_places=2)),
+        cantidad_items=Coalesce(Subquery(cantidad), Value(0), output_field=IntegerField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickstart', '0009_eventostripe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carrito',
+            name='cantidad_items',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='carrito',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(calcular_totales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2 on 2026-10-18 10:09
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Objetos dependientes del motor: Postgres usa tsvector + GIN y pg_trgm; SQLite (desarrollo)
+# una tabla FTS5. Los UPDATE/INSERT iniciales cargan el indice con los productos existentes.
+POSTGRES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX producto_busqueda_gin ON quickstart_producto USING gin (busqueda)',
+    'CREATE INDEX producto_nombre_trgm ON quickstart_producto USING gin (nombre gin_trgm_ops)',
+    """
+    UPDATE quickstart_producto AS p SET busqueda =
+        setweight(to_tsvector('spanish', coalesce(p.nombre, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(p.tipo, '') || ' ' || coalesce(p.medidas, '')), 'B') ||
+        setweight(to_tsvector('spanish', coalesce(c.nombre, '') || ' ' || coalesce(c.descripcion, '')), 'C')
+    FROM quickstart_categoria AS c
+    WHERE c.id = p.categoria_id
+    """,
+]
+POSTGRES_REVERSA = [
+    'DROP INDEX IF EXISTS producto_nombre_trgm',
+    'DROP INDEX IF EXISTS producto_busqueda_gin',
+]
+SQLITE = [
+    'CREATE VIRTUAL TABLE quickstart_producto_fts USING fts5(nombre, tipo, medidas, categoria, descripcion)',
+    """
+    INSERT INTO quickstart_producto_fts (rowid, nombre, tipo, medidas, categoria, descripcion)
+    SELECT p.id, p.nombre, coalesce(p.tipo, ''), coalesce(p.medidas, ''), c.nombre, coalesce(c.descripcion, '')
+    FROM quickstart_producto AS p JOIN quickstart_categoria AS c ON c.id = p.categoria_id
+    """,
+]
+SQLITE_REVERSA = [
+    'DROP TABLE IF EXISTS quickstart_producto_fts',
+]
+
+
+def _ejecutar(schema_editor, sentencias):
+    for sentencia in sentencias.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sentencia)
+
+
+def crear_indice(apps, schema_editor):
+    _ejecutar(schema_editor, {'postgresql': POSTGRES, 'sqlite': SQLITE})
+
+
+def eliminar_indice(apps, schema_editor):
+    _ejecutar(schema_editor, {'postgresql': POSTGRES_REVERSA, 'sqlite': SQLITE_REVERSA})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickstart', '0010_carrito_totales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
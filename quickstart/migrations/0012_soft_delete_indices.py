@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 10:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickstart', '0011_producto_busqueda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='carrito',
+            index=models.Index(condition=models.Q(('eliminado', False)), fields=['id_usuario', 'fecha_creacion'], name='carrito_usuario_activo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventario',
+            index=models.Index(condition=models.Q(('eliminado', False)), fields=['producto'], name='inventario_producto_activo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='producto',
+            index=models.Index(condition=models.Q(('eliminado', False)), fields=['categoria'], name='producto_categoria_activo_idx'),
+        ),
+    ]
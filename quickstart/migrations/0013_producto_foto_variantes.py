@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 10:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickstart', '0012_soft_delete_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='foto_variantes',
+            field=models.JSONField(default=dict, editable=False),
+        ),
+    ]
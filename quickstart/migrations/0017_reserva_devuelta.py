@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickstart', '0016_historial_pedido'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reserva',
+            name='estado',
+            field=models.CharField(choices=[('activa', 'Activa'), ('consumida', 'Consumida'), ('liberada', 'Liberada'), ('devuelta', 'Devuelta')], default='activa', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickstart', '0017_reserva_devuelta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='sesion_stripe',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
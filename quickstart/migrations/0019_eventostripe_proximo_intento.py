@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quickstart', '0018_pedido_sesion_stripe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventostripe',
+            name='proximo_intento',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
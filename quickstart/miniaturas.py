@@ -0,0 +1,32 @@
+import io
+
+from PIL import Image, ImageOps
+
+# Codificacion de miniaturas en el pool de procesos de quickstart.imagenes. No importa Django
+# ni otros modulos de quickstart: con 'spawn' cada proceso del pool carga solo esto y Pillow
+
+# Parametros de codificacion por formato
+CALIDAD = {
+    'webp': {'quality': 80, 'method': 4},
+    'avif': {'quality': 60},
+}
+
+
+def generar_variantes(contenido, anchos, formatos):
+    """
+    Recibe los bytes de la imagen original y devuelve {formato: {ancho: bytes}} con
+    miniaturas que entran en un cuadro ancho x ancho.
+    """
+    with Image.open(io.BytesIO(contenido)) as original:
+        imagen = ImageOps.exif_transpose(original)
+        if imagen.mode not in ('RGB', 'RGBA'):
+            imagen = imagen.convert('RGBA' if 'transparency' in imagen.info else 'RGB')
+        variantes = {formato: {} for formato in formatos}
+        for ancho in anchos:
+            miniatura = imagen.copy()
+            miniatura.thumbnail((ancho, ancho), Image.Resampling.LANCZOS)
+            for formato in formatos:
+                salida = io.BytesIO()
+                miniatura.save(salida, format=formato.upper(), **CALIDAD.get(formato, {}))
+                variantes[formato][ancho] = salida.getvalue()
+    return variantes
@@ -1,12 +1,71 @@
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction
+from django.dispatch import Signal
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+
+# Enviada tras cada UPDATE masivo de SoftDeleteQuerySet.delete con sender=modelo e ids=[pks eliminados].
+# Esos UPDATE no pasan por save(), asi que post_save no se dispara
+eliminacion_masiva = Signal()
+
+
+class SoftDeleteQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Soft delete del queryset completo y de su cascada (SoftDeleteModel.eliminar_en_cascada):
+        un SELECT de ids y un UPDATE por modelo, todo en una transaccion.
+        Devuelve (total, {modelo: cantidad}) como QuerySet.delete de Django.
+        """
+        conteo = Counter()
+        with transaction.atomic(using=self.db):
+            self._eliminar(conteo)
+        return sum(conteo.values()), dict(conteo)
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def _eliminar(self, conteo):
+        ids = list(self.filter(eliminado=False).values_list('pk', flat=True))
+        if not ids:
+            return
+        # Primero los hijos, mientras los padres todavia figuran como vivos
+        for nombre in self.model.eliminar_en_cascada:
+            relacion = self.model._meta.get_field(nombre)
+            relacion.related_model.all_objects.filter(**{f'{relacion.field.name}__in': ids})._eliminar(conteo)
+        self.model.all_objects.filter(pk__in=ids).update(eliminado=True)
+        conteo[self.model._meta.label] += len(ids)
+        eliminacion_masiva.send(sender=self.model, ids=ids)
+
+    def hard_delete(self):
+        return super().delete()
+
+    hard_delete.alters_data = True
+    hard_delete.queryset_only = True
+
+
+class SoftDeleteManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    # Manager por defecto: solo filas vivas. Las relaciones inversas (carrito.detalles, etc.) lo usan tambien
+    def get_queryset(self):
+        return super().get_queryset().filter(eliminado=False)
+
 
 class SoftDeleteModel(models.Model):
     eliminado = models.BooleanField(default=False)
 
+    objects = SoftDeleteManager()
+    all_objects = SoftDeleteQuerySet.as_manager()  # incluye las filas eliminadas
+
+    # Relaciones inversas (nombre de consulta) que se eliminan junto con la instancia
+    eliminar_en_cascada = ()
+
     def delete(self, using=None, keep_parents=False):
-        self.eliminado = True
-        self.save()
+        with transaction.atomic(using=using):
+            self.eliminado = True
+            self.save()
+            for nombre in self.eliminar_en_cascada:
+                relacion = self._meta.get_field(nombre)
+                relacion.related_model.all_objects.filter(**{relacion.field.name: self.pk}).delete()
 
     class Meta:
         abstract = True
@@ -16,6 +75,8 @@ class Categoria(SoftDeleteModel):
     nombre = models.CharField(max_length=50)
     descripcion = models.CharField(max_length=100, null=True)
 
+    eliminar_en_cascada = ('productos',)
+
     def __str__(self):
         return self.nombre
     
@@ -27,9 +88,28 @@ class Producto(SoftDeleteModel):
     medidas = models.CharField(max_length=100, null=True)
     precio = models.DecimalField(max_digits=10, decimal_places=2)
     foto = models.ImageField(upload_to='productos/', null=True, blank=True)
+    # Miniaturas WebP/AVIF de la foto, generadas en segundo plano por quickstart.imagenes
+    foto_variantes = models.JSONField(default=dict, editable=False)
+    # Documento de busqueda (Postgres), mantenido por quickstart.busqueda
+    busqueda = SearchVectorField(null=True, editable=False)
 
     sucursales = models.ManyToManyField('Sucursal', through='Inventario', related_name='productos')
 
+    eliminar_en_cascada = ('inventario', 'detallecarrito')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['categoria'], condition=models.Q(eliminado=False), name='producto_categoria_activo_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Precio leido, para detectar cambios que afectan los subtotales de los carritos
+        instancia._precio_original = instancia.__dict__.get('precio')
+        instancia._foto_original = instancia.__dict__.get('foto')
+        return instancia
+
     def __str__(self):
         return self.nombre
 
@@ -37,6 +117,11 @@ class Producto(SoftDeleteModel):
 class Sucursal(SoftDeleteModel):
     nombre = models.CharField(max_length=50)
     direccion = models.CharField(max_length=100, null=True)
+    # Para asignar pedidos a la sucursal mas cercana (quickstart.geo)
+    latitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+
+    eliminar_en_cascada = ('inventario',)
 
     def __str__(self):
         return self.nombre
@@ -49,6 +134,9 @@ class Inventario(SoftDeleteModel):
 
     class Meta:
         unique_together = ('producto', 'sucursal')
+        indexes = [
+            models.Index(fields=['producto'], condition=models.Q(eliminado=False), name='inventario_producto_activo_idx'),
+        ]
 
     def __str__(self):
         return f"{self.producto.nombre} en {self.sucursal.nombre}: {self.cantidad}"
@@ -58,6 +146,15 @@ class Carrito(SoftDeleteModel):
     id = models.AutoField(primary_key=True)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     id_usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='carritos')
+    # Totales desnormalizados de las lineas activas, mantenidos por DetalleCarrito.save y quickstart.carrito
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    cantidad_items = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Ultimo carrito activo del usuario
+        indexes = [
+            models.Index(fields=['id_usuario', 'fecha_creacion'], condition=models.Q(eliminado=False), name='carrito_usuario_activo_idx'),
+        ]
 
     def __str__(self):
         return f'Carrito {self.id} de {self.id_usuario.username}'
@@ -69,6 +166,35 @@ class DetalleCarrito(SoftDeleteModel):
     id_producto = models.ForeignKey(Producto, on_delete=models.CASCADE)
     cantidad = models.PositiveIntegerField()
 
+    class Meta:
+        # Una sola linea activa por producto en cada carrito (destino del upsert en quickstart.carrito).
+        # Su indice parcial (id_carrito, id_producto) WHERE NOT eliminado sirve tambien a las busquedas por carrito
+        constraints = [
+            models.UniqueConstraint(
+                fields=['id_carrito', 'id_producto'],
+                condition=models.Q(eliminado=False),
+                name='uniq_detallecarrito_activo',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._estado_original = instancia._estado_totales()
+        return instancia
+
+    def _estado_totales(self):
+        return (self.__dict__.get('id_carrito_id'), self.__dict__.get('id_producto_id'), self.__dict__.get('cantidad'), self.__dict__.get('eliminado'))
+
+    def save(self, *args, **kwargs):
+        from .carrito import ajustar_totales_por_cambio
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            nuevo = self._estado_totales()
+            ajustar_totales_por_cambio(getattr(self, '_estado_original', None), nuevo, self)
+            self._estado_original = nuevo
+
     def __str__(self):
         return f'{self.cantidad}x {self.id_producto.nombre} en carrito {self.id_carrito.id}'
     
@@ -88,10 +214,21 @@ class Pedido(models.Model):
     direccion_entrega = models.CharField(max_length=255)
     latitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitud = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Sucursal principal que despacha el pedido; el reparto exacto por sucursal esta en sus Reservas
+    sucursal = models.ForeignKey(Sucursal, on_delete=models.SET_NULL, null=True, blank=True, related_name='pedidos')
     estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    # Checkout Session de Stripe abierta para el pedido; se expira antes de cancelarlo
+    sesion_stripe = models.CharField(max_length=255, blank=True, default='')
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_modificacion = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Indices para la paginacion por cursor (fecha_creacion, id)
+        indexes = [
+            models.Index(fields=['-fecha_creacion', '-id'], name='pedido_fecha_id_idx'),
+            models.Index(fields=['id_usuario', '-fecha_creacion', '-id'], name='pedido_usuario_fecha_id_idx'),
+        ]
+
     def __str__(self):
         return f"Pedido #{self.pk} - {self.estado}"
     
@@ -106,6 +243,107 @@ class DetallePedido(models.Model):
 
     def __str__(self):
         return f"Detalle del Pedido {self.id_pedido_id} - Producto {self.id_producto_id}"
-    
 
-    
+
+class Reserva(models.Model):
+    ESTADOS = (
+        ('activa', 'Activa'),
+        ('consumida', 'Consumida'),
+        ('liberada', 'Liberada'),
+        ('devuelta', 'Devuelta'),
+    )
+
+    id_pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='reservas')
+    inventario = models.ForeignKey(Inventario, on_delete=models.CASCADE, related_name='reservas')
+    cantidad = models.PositiveIntegerField()
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='activa')
+    expira = models.DateTimeField()
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'expira'], name='reserva_estado_expira_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reserva {self.cantidad}x inventario {self.inventario_id} - Pedido {self.id_pedido_id}"
+
+
+class EventoStripe(models.Model):
+    ESTADOS = (
+        ('pendiente', 'Pendiente'),
+        ('procesado', 'Procesado'),
+        ('error', 'Error'),
+    )
+
+    id_evento = models.CharField(max_length=255, unique=True)  # id del evento en Stripe
+    tipo = models.CharField(max_length=100)
+    payload = models.JSONField()
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    proximo_intento = models.DateTimeField(null=True, blank=True)  # backoff tras un fallo; None = ya
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_procesado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'id'], name='eventostripe_estado_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Evento {self.id_evento} ({self.tipo}) - {self.estado}"
+
+
+class HistorialPedido(models.Model):
+    # Auditoria de cambios de estado, escrita por quickstart.transiciones (desde=None al crear el pedido)
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='historial')
+    desde = models.CharField(max_length=20, choices=Pedido.ESTADOS, null=True, blank=True)
+    hacia = models.CharField(max_length=20, choices=Pedido.ESTADOS)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pedido', 'fecha'], name='historialpedido_pedido_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pedido {self.pedido_id}: {self.desde} -> {self.hacia}"
+
+
+class VentaDiaria(models.Model):
+    # Resumen dia x producto x estado del pedido, mantenido por quickstart.analitica
+    fecha = models.DateField()
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='+')
+    estado = models.CharField(max_length=20, choices=Pedido.ESTADOS)
+    cantidad = models.IntegerField(default=0)
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'producto', 'estado'], name='uniq_ventadiaria'),
+        ]
+        indexes = [
+            models.Index(fields=['estado', 'fecha'], name='ventadiaria_estado_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} producto {self.producto_id} ({self.estado}): {self.cantidad}"
+
+
+class PedidosDiarios(models.Model):
+    # Cantidad y monto de pedidos por dia y estado (ticket promedio), mantenido por quickstart.analitica
+    fecha = models.DateField()
+    estado = models.CharField(max_length=20, choices=Pedido.ESTADOS)
+    pedidos = models.IntegerField(default=0)
+    monto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'estado'], name='uniq_pedidosdiarios'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} ({self.estado}): {self.pedidos} pedidos"
+
@@ -0,0 +1,199 @@
+import base64
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder corta los datetime a milisegundos; el cursor necesita el valor exacto
+    # o el WHERE (fecha < x OR (fecha = x AND id < y)) salta filas en el borde de la pagina
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _count_desactivado(request, param):
+    return request.query_params.get(param, '').lower() in ('0', 'false', 'no')
+
+
+class OptionalCountPageNumberPagination(pagination.PageNumberPagination):
+    """
+    PageNumberPagination con opcion de omitir el COUNT(*): con ?count=false se lee
+    una fila extra para saber si hay pagina siguiente y la respuesta no trae 'count'.
+    """
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.sin_count = _count_desactivado(request, self.count_query_param)
+        if not self.sin_count:
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        try:
+            self.numero = int(request.query_params.get(self.page_query_param, 1))
+            if self.numero < 1:
+                raise ValueError
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+
+        self.request = request
+        offset = (self.numero - 1) * page_size
+        filas = list(queryset[offset:offset + page_size + 1])
+        self.hay_siguiente = len(filas) > page_size
+        return filas[:page_size]
+
+    def get_paginated_response(self, data):
+        if not self.sin_count:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self._link_sin_count(self.numero + 1) if self.hay_siguiente else None,
+            'previous': self._link_sin_count(self.numero - 1) if self.numero > 1 else None,
+            'results': data,
+        })
+
+    def _link_sin_count(self, numero):
+        url = self.request.build_absolute_uri()
+        if numero == 1:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, numero)
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Paginacion por clave (keyset): el cursor guarda los valores de `ordering` de la
+    ultima fila y la pagina siguiente se pide con un WHERE sobre esos valores, por lo
+    que una pagina profunda cuesta lo mismo que la primera. No ejecuta COUNT(*).
+    `ordering` debe terminar en un campo unico (normalmente el id).
+    """
+    ordering = ('-id',)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.model = queryset.model
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        posicion = self.decode_cursor(request)
+        if posicion is not None:
+            queryset = queryset.filter(self._filtro_despues(posicion))
+
+        filas = list(queryset[:page_size + 1])
+        self.hay_siguiente = len(filas) > page_size
+        filas = filas[:page_size]
+        self.ultima = filas[-1] if filas else None
+        return filas
+
+    def _campos(self):
+        return [(campo.lstrip('-'), campo.startswith('-')) for campo in self.ordering]
+
+    def _filtro_despues(self, valores):
+        # (a, b) > (x, y)  =>  a > x OR (a = x AND b > y), respetando el sentido de cada campo
+        filtro = Q()
+        iguales = {}
+        for (campo, desc), valor in zip(self._campos(), valores):
+            lookup = '%s__%s' % (campo, 'lt' if desc else 'gt')
+            filtro |= Q(**iguales, **{lookup: valor})
+            iguales[campo] = valor
+        return filtro
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            crudo = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            campos = self._campos()
+            if not isinstance(crudo, list) or len(crudo) != len(campos):
+                raise ValueError
+            return [self._convertir(campo, valor) for (campo, _), valor in zip(campos, crudo)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _convertir(self, campo, valor):
+        # Los campos del modelo se convierten a su tipo; las anotaciones (ej. rango) quedan tal cual
+        try:
+            return self.model._meta.get_field(campo).to_python(valor)
+        except FieldDoesNotExist:
+            return valor
+
+    def encode_cursor(self, instancia):
+        valores = [getattr(instancia, campo) for campo, _ in self._campos()]
+        crudo = json.dumps(valores, cls=_CursorEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(crudo.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.hay_siguiente or self.ultima is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.ultima))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class PedidoPagination(KeysetPagination):
+    ordering = ('-fecha_creacion', '-id')
+
+
+class BusquedaPagination(KeysetPagination):
+    ordering = ('-rango', '-id')
+
+
+class CatalogoPagination(KeysetPagination):
+    """
+    Keyset por id para el catalogo. Se activa cuando llega el parametro `cursor`
+    (vacio para la primera pagina); sin el, se mantiene la paginacion por numero
+    de pagina para no romper a los clientes existentes.
+    """
+    ordering = ('id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.por_numero = None
+        if self.cursor_query_param in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.por_numero = OptionalCountPageNumberPagination()
+        return self.por_numero.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.por_numero is not None:
+            return self.por_numero.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.utils import timezone
+
+_cliente = None
+
+# Stripe rechaza expires_at a menos de 30 minutos de la creacion; el margen cubre la latencia
+VENCIMIENTO_MINIMO = timedelta(minutes=30, seconds=60)
+
+
+def cliente_stripe():
+    """
+    Cliente de Stripe compartido por todo el proceso. Usa httpx con pool de conexiones
+    (sync y async), timeout y reintentos de red configurables en settings.
+    STRIPE_API_BASE permite apuntarlo al servidor de prueba (manage.py stub_pagos).
+    """
+    global _cliente
+    if _cliente is None:
+        _cliente = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            http_client=stripe.HTTPXClient(timeout=settings.STRIPE_TIMEOUT, allow_sync_methods=True),
+            max_network_retries=settings.STRIPE_MAX_REINTENTOS,
+            base_addresses={'api': settings.STRIPE_API_BASE},
+        )
+    return _cliente
+
+
+def parametros_sesion(pedido, total, url_front_base, expira):
+    return {
+        'payment_method_types': ['card'],
+        'mode': 'payment',
+        'line_items': [{
+            'price_data': {
+                'currency': 'bob',
+                'product_data': {
+                    'name': 'Pedido #{}'.format(pedido.id),
+                },
+                'unit_amount': int(total * 100),
+            },
+            'quantity': 1,
+        }],
+        'metadata': {
+            'pedido_id': pedido.id
+        },
+        # La sesion vence junto con la reserva de stock, nunca antes del minimo de Stripe
+        'expires_at': int(max(expira, timezone.now() + VENCIMIENTO_MINIMO).timestamp()) + 1,
+        'success_url': url_front_base + '/success',
+        'cancel_url': url_front_base + '/cancel',
+    }
@@ -0,0 +1,151 @@
+import sys
+from functools import lru_cache
+
+from django.db.models import Prefetch
+from rest_framework.serializers import (
+    BaseSerializer, ListSerializer, ManyRelatedField, RelatedField, SerializerMethodField
+)
+
+
+def queryset_activo(model):
+    # Queryset base de un modelo relacionado, sin las filas eliminadas (soft delete)
+    from .models import SoftDeleteModel
+
+    queryset = model._default_manager.all()
+    if issubclass(model, SoftDeleteModel):
+        queryset = queryset.filter(eliminado=False)
+    return queryset
+
+
+def _relacion(model, nombre):
+    # Busca una relacion por nombre de campo o por nombre de accessor inverso (ej. inventario_set)
+    for field in model._meta.get_fields():
+        if not field.is_relation:
+            continue
+        if field.auto_created and not field.concrete:
+            if field.get_accessor_name() == nombre:
+                return field
+        elif field.name == nombre:
+            return field
+    return None
+
+
+class _Plan:
+    def __init__(self):
+        self.select = set()
+        self.prefetch = {}
+
+    def agregar_prefetch(self, prefetch):
+        # Un mismo lookup solo puede registrarse una vez
+        self.prefetch.setdefault(prefetch.prefetch_to, prefetch)
+
+    def aplicar(self, queryset):
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch.values())
+        return queryset
+
+
+def _agregar_ruta(plan, model, prefijo, attrs, hijo=None, to_attr=None):
+    """
+    Recorre una cadena de atributos (source de DRF). Las relaciones de un solo valor
+    van a select_related; la primera relacion multiple corta la cadena y se resuelve
+    con un Prefetch filtrado, planificando el resto sobre el queryset relacionado.
+    """
+    ruta = []
+    actual = model
+    for i, attr in enumerate(attrs):
+        rel = _relacion(actual, attr)
+        if rel is None:
+            break
+        ruta.append(attr)
+        if rel.many_to_many or rel.one_to_many:
+            queryset = queryset_activo(rel.related_model)
+            resto = attrs[i + 1:]
+            if resto:
+                subplan = _Plan()
+                _agregar_ruta(subplan, rel.related_model, '', resto, hijo)
+                queryset = subplan.aplicar(queryset)
+            elif hijo is not None:
+                queryset = plan_queryset(queryset, hijo)
+            plan.agregar_prefetch(Prefetch(prefijo + '__'.join(ruta), queryset=queryset, to_attr=to_attr))
+            return
+        actual = rel.related_model
+    if ruta:
+        plan.select.add(prefijo + '__'.join(ruta))
+    if hijo is not None and ruta and len(ruta) == len(attrs):
+        _planificar(plan, actual, hijo, prefijo + '__'.join(ruta) + '__')
+
+
+def _planificar(plan, model, serializer, prefijo=''):
+    meta = getattr(serializer, 'Meta', None)
+    metodos = getattr(meta, 'prefetch_method_fields', {})
+
+    for nombre, field in serializer.fields.items():
+        if field.write_only:
+            continue
+
+        if isinstance(field, SerializerMethodField):
+            # Solo los SerializerMethodField declarados en Meta.prefetch_method_fields
+            if nombre in metodos:
+                lookup, hijo = metodos[nombre]
+                if isinstance(hijo, str):
+                    # Permite referenciar serializers declarados mas abajo en el modulo
+                    hijo = getattr(sys.modules[type(serializer).__module__], hijo)
+                _agregar_ruta(plan, model, prefijo, lookup.split('__'), hijo, to_attr='prefetched_' + nombre)
+            continue
+
+        if field.source == '*':
+            if isinstance(field, BaseSerializer):
+                _planificar(plan, model, field, prefijo)
+            continue
+
+        attrs = field.source_attrs
+        if isinstance(field, ListSerializer):
+            _agregar_ruta(plan, model, prefijo, attrs, field.child)
+        elif isinstance(field, BaseSerializer):
+            _agregar_ruta(plan, model, prefijo, attrs, field)
+        elif isinstance(field, ManyRelatedField):
+            _agregar_ruta(plan, model, prefijo, attrs)
+        elif isinstance(field, RelatedField):
+            # PrimaryKeyRelatedField e Hyperlinked usan el <campo>_id sin tocar la relacion
+            if len(attrs) == 1 and field.use_pk_only_optimization():
+                continue
+            _agregar_ruta(plan, model, prefijo, attrs)
+        elif len(attrs) > 1:
+            _agregar_ruta(plan, model, prefijo, attrs[:-1])
+
+
+@lru_cache(maxsize=None)
+def _plan_para(serializer_class):
+    plan = _Plan()
+    serializer = serializer_class()
+    _planificar(plan, serializer_class.Meta.model, serializer)
+    return plan
+
+
+def plan_queryset(queryset, serializer):
+    """
+    Aplica al queryset los select_related/Prefetch que necesita el serializer
+    (clase o instancia) para serializar sin consultas por fila.
+    """
+    if isinstance(serializer, BaseSerializer):
+        if isinstance(serializer, ListSerializer):
+            serializer = serializer.child
+        plan = _Plan()
+        _planificar(plan, queryset.model, serializer)
+    else:
+        plan = _plan_para(serializer)
+    return plan.aplicar(queryset)
+
+
+class QueryPlannerMixin:
+    """
+    Mixin para ViewSets: planifica el queryset segun el serializer de la accion.
+    Se engancha en filter_queryset para cubrir tambien los get_queryset sobrescritos.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return plan_queryset(queryset, self.get_serializer_class())
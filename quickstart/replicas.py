@@ -0,0 +1,177 @@
+import contextvars
+import itertools
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+CACHE_ALIAS = 'auth'  # compartido entre workers, como las revocaciones de quickstart.autenticacion
+
+# Alias de la replica asignada a la request en curso; None lee del primario
+_replica = contextvars.ContextVar('replica', default=None)
+_turno = itertools.count()
+
+
+def replicas():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def primario():
+    """Dentro del bloque las lecturas de la request van al primario aunque tenga replica asignada."""
+    token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def _clave_escritura(id_usuario):
+    return f'replica:escritura:{id_usuario}'
+
+
+def _usuario_del_token(request):
+    # Solo valida firma y vencimiento del JWT, sin tocar la base; la autenticacion real la hace DRF
+    encabezado = request.headers.get('Authorization', '')
+    if not encabezado.startswith('Bearer '):
+        return None
+    try:
+        return AccessToken(encabezado[len('Bearer '):]).get(api_settings.USER_ID_CLAIM)
+    except TokenError:
+        return None
+
+
+def _en_replica(alias, contenido):
+    # El contenido de una StreamingHttpResponse se consume despues del middleware: cada
+    # trozo se genera con la replica asignada, en el contexto de quien lo consuma
+    iterador = iter(contenido)
+    while True:
+        token = _replica.set(alias)
+        try:
+            trozo = next(iterador)
+        except StopIteration:
+            return
+        finally:
+            _replica.reset(token)
+        yield trozo
+
+
+async def _en_replica_async(alias, contenido):
+    iterador = aiter(contenido)
+    while True:
+        token = _replica.set(alias)
+        try:
+            trozo = await anext(iterador)
+        except StopAsyncIteration:
+            return
+        finally:
+            _replica.reset(token)
+        yield trozo
+
+
+class ReplicaMiddleware:
+    """
+    Asigna una replica (por turnos) a las lecturas de DB_REPLICA_RUTAS. Despues de una
+    escritura exitosa el usuario queda pegado al primario DB_REPLICA_STICKY_SEGUNDOS, asi
+    ve su carrito o su pedido recien creado aunque la replica venga atrasada.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _lee_de_replica(self, request):
+        return request.method in METODOS_SEGUROS and request.path.startswith(tuple(settings.DB_REPLICA_RUTAS))
+
+    def _alias(self, disponibles):
+        return disponibles[next(_turno) % len(disponibles)]
+
+    def _responder(self, alias, response):
+        if alias is not None and response.streaming:
+            if response.is_async:
+                response.streaming_content = _en_replica_async(alias, response.streaming_content)
+            else:
+                response.streaming_content = _en_replica(alias, response.streaming_content)
+        return response
+
+    def _marcar_escritura(self, request, id_usuario, response):
+        return request.method not in METODOS_SEGUROS and id_usuario is not None and response.status_code < 400
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        disponibles = replicas()
+        if not disponibles:
+            return self.get_response(request)
+
+        id_usuario = _usuario_del_token(request)
+        alias = None
+        if self._lee_de_replica(request):
+            if id_usuario is None or not caches[CACHE_ALIAS].get(_clave_escritura(id_usuario)):
+                alias = self._alias(disponibles)
+
+        token = _replica.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica.reset(token)
+
+        if self._marcar_escritura(request, id_usuario, response):
+            caches[CACHE_ALIAS].set(_clave_escritura(id_usuario), True, settings.DB_REPLICA_STICKY_SEGUNDOS)
+        return self._responder(alias, response)
+
+    async def __acall__(self, request):
+        disponibles = replicas()
+        if not disponibles:
+            return await self.get_response(request)
+
+        id_usuario = _usuario_del_token(request)
+        alias = None
+        if self._lee_de_replica(request):
+            if id_usuario is None or not await caches[CACHE_ALIAS].aget(_clave_escritura(id_usuario)):
+                alias = self._alias(disponibles)
+
+        token = _replica.set(alias)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica.reset(token)
+
+        if self._marcar_escritura(request, id_usuario, response):
+            await caches[CACHE_ALIAS].aset(_clave_escritura(id_usuario), True, settings.DB_REPLICA_STICKY_SEGUNDOS)
+        return self._responder(alias, response)
+
+
+class ReplicaRouter:
+    """
+    Lecturas a la replica que el middleware asigno a la request; todo lo demas (escrituras,
+    lecturas dentro de una transaccion, comandos y workers) al primario. Las migraciones
+    solo corren en el primario: las replicas las reciben por replicacion.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primario y replicas tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,155 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import incrementar_version
+from .models import Inventario, Reserva
+
+INTENTOS = 3
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, id_producto):
+        self.id_producto = id_producto
+        super().__init__(f'Stock insuficiente para el producto {id_producto}')
+
+
+class _Conflicto(Exception):
+    pass
+
+
+def _asignar(inventarios, cantidad, preferidas=()):
+    # Primero las sucursales preferidas (las mas cercanas a la entrega), en su orden; despues
+    # las de mas stock, para partir el pedido en la menor cantidad de sucursales
+    orden = {id_sucursal: i for i, id_sucursal in enumerate(preferidas)}
+    asignacion = []
+    for inventario in sorted(inventarios, key=lambda i: (orden.get(i.sucursal_id, len(orden)), -i.cantidad, i.pk)):
+        if cantidad == 0:
+            break
+        toma = min(inventario.cantidad, cantidad)
+        asignacion.append((inventario.pk, toma))
+        cantidad -= toma
+    return asignacion if cantidad == 0 else None
+
+
+def _reservar_producto(id_producto, cantidad, preferidas):
+    for _ in range(INTENTOS):
+        inventarios = Inventario.objects.filter(
+            producto_id=id_producto, eliminado=False, cantidad__gt=0
+        ).only('id', 'sucursal_id', 'cantidad')
+        asignacion = _asignar(inventarios, cantidad, preferidas)
+        if asignacion is None:
+            raise StockInsuficiente(id_producto)
+
+        try:
+            # Savepoint por intento: si otro checkout se adelanta, se deshace solo este producto
+            with transaction.atomic():
+                # Orden de bloqueo determinista (id de inventario) para evitar deadlocks
+                for id_inventario, toma in sorted(asignacion):
+                    actualizados = Inventario.objects.filter(
+                        pk=id_inventario, eliminado=False, cantidad__gte=toma
+                    ).update(cantidad=F('cantidad') - toma)
+                    if not actualizados:
+                        raise _Conflicto
+            return asignacion
+        except _Conflicto:
+            continue
+    raise StockInsuficiente(id_producto)
+
+
+def reservar_stock(pedido, lineas, preferidas=()):
+    """
+    Descuenta del Inventario las cantidades de `lineas` ((id_producto, cantidad))
+    con UPDATE condicionales (cantidad >= n), repartiendo entre sucursales (primero las
+    de `preferidas`), y registra las Reservas del pedido. Debe llamarse dentro de
+    transaction.atomic.
+    """
+    totales = defaultdict(int)
+    for id_producto, cantidad in lineas:
+        totales[id_producto] += cantidad
+
+    expira = timezone.now() + timedelta(minutes=settings.RESERVA_TTL_MINUTOS)
+    reservas = []
+    for id_producto in sorted(totales):
+        for id_inventario, toma in _reservar_producto(id_producto, totales[id_producto], preferidas):
+            reservas.append(Reserva(id_pedido=pedido, inventario_id=id_inventario, cantidad=toma, expira=expira))
+
+    Reserva.objects.bulk_create(reservas)
+    transaction.on_commit(lambda: incrementar_version(Inventario))
+    return reservas
+
+
+def confirmar_reservas(ids_pedidos):
+    # El stock ya fue descontado al reservar, solo se marcan como consumidas
+    return Reserva.objects.filter(id_pedido__in=ids_pedidos, estado='activa').update(estado='consumida')
+
+
+def liberar_reservas(pedido):
+    """
+    Devuelve al Inventario el stock de las reservas activas del pedido. Es idempotente:
+    cada reserva se reclama con un UPDATE condicional antes de devolver su cantidad.
+    """
+    devolver = defaultdict(int)
+    with transaction.atomic():
+        activas = Reserva.objects.filter(id_pedido=pedido, estado='activa').order_by('inventario_id')
+        for reserva in activas:
+            if Reserva.objects.filter(pk=reserva.pk, estado='activa').update(estado='liberada'):
+                devolver[reserva.inventario_id] += reserva.cantidad
+
+        for id_inventario in sorted(devolver):
+            Inventario.all_objects.filter(pk=id_inventario).update(cantidad=F('cantidad') + devolver[id_inventario])
+
+        if devolver:
+            transaction.on_commit(lambda: incrementar_version(Inventario))
+    return sum(devolver.values())
+
+
+def devolver_consumidas(ids_pedidos):
+    """
+    Devuelve al Inventario el stock ya consumido de pedidos confirmados que se cancelan.
+    Igual que liberar_reservas, cada reserva se reclama con un UPDATE condicional para no
+    devolverla dos veces.
+    """
+    devolver = defaultdict(int)
+    with transaction.atomic():
+        consumidas = Reserva.objects.filter(id_pedido__in=ids_pedidos, estado='consumida').order_by('inventario_id')
+        for reserva in consumidas:
+            if Reserva.objects.filter(pk=reserva.pk, estado='consumida').update(estado='devuelta'):
+                devolver[reserva.inventario_id] += reserva.cantidad
+
+        for id_inventario in sorted(devolver):
+            Inventario.all_objects.filter(pk=id_inventario).update(cantidad=F('cantidad') + devolver[id_inventario])
+
+        if devolver:
+            transaction.on_commit(lambda: incrementar_version(Inventario))
+    return sum(devolver.values())
+
+
+def liberar_vencidas(ahora=None, lote=500, gracia=None):
+    """
+    Libera las reservas vencidas hace mas de `gracia` (RESERVA_GRACIA_MINUTOS) y cancela
+    sus pedidos si siguen pendientes. La cancelacion normal llega con el evento
+    checkout.session.expired; esto solo cubre los eventos que nunca llegaron.
+    """
+    from . import transiciones  # import diferido: transiciones importa reservas
+
+    ahora = ahora or timezone.now()
+    if gracia is None:
+        gracia = timedelta(minutes=settings.RESERVA_GRACIA_MINUTOS)
+    pedidos = 0
+    while True:
+        ids = list(
+            Reserva.objects.filter(estado='activa', expira__lt=ahora - gracia)
+            .values_list('id_pedido_id', flat=True).distinct()[:lote]
+        )
+        if not ids:
+            return pedidos
+        # Los pendientes se cancelan y la transicion devuelve su stock; el resto solo libera
+        _, rechazados = transiciones.transicionar(ids, 'cancelado', desde=('pendiente',))
+        for id_pedido, _ in rechazados:
+            liberar_reservas(id_pedido)
+        pedidos += len(ids)
@@ -1,6 +1,10 @@
 from django.contrib.auth.models import Group, User, Permission
-from rest_framework.serializers import ModelSerializer, HyperlinkedModelSerializer, SlugRelatedField, PrimaryKeyRelatedField, SerializerMethodField, CharField, DecimalField, IntegerField
+from rest_framework.serializers import ModelSerializer, HyperlinkedModelSerializer, SlugRelatedField, PrimaryKeyRelatedField, SerializerMethodField, CharField, DecimalField, IntegerField, Serializer, BooleanField, ValidationError
 from .models import *
+from .carrito import agregar_items
+from . import imagenes
+from .metricas import SerializadorMedido
+from rest_framework.validators import UniqueTogetherValidator
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -9,9 +13,19 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         # Agrega datos del usuario
         data['user'] = UserSerializer(self.user, context=self.context).data
         return data
+
+    @classmethod
+    def tokens_para(cls, user, context):
+        # Misma respuesta que validate() para un usuario ya autenticado, sin volver a hashear
+        refresh = cls.get_token(user)
+        return {
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+            'user': UserSerializer(user, context=context).data,
+        }
     
 
-class RegisterSerializer(ModelSerializer):
+class RegisterSerializer(SerializadorMedido, ModelSerializer):
     groups = SlugRelatedField(
         many=True,
         slug_field='name',
@@ -26,20 +40,29 @@ class RegisterSerializer(ModelSerializer):
         }
 
     def create(self, validated_data):
-        print('Datos validados:', validated_data)
         groups_data = validated_data.pop('groups', [])
-        user = User.objects.create_user(**validated_data)
+        hasheado = validated_data.pop('password_hasheado', None)
+        if hasheado is None:
+            user = User.objects.create_user(**validated_data)
+        else:
+            # La vista async ya hasheo la password en el pool de quickstart.hashing
+            validated_data.pop('password')
+            user = User(**validated_data)
+            user.username = User.normalize_username(user.username)
+            user.email = User.objects.normalize_email(user.email)
+            user.password = hasheado
+            user.save()
         user.groups.set(groups_data) 
         return user
     
 
-class PermissionSerializer(ModelSerializer):
+class PermissionSerializer(SerializadorMedido, ModelSerializer):
     class Meta:
         model = Permission
         fields = ['id', 'codename', 'name', 'content_type']
 
 
-class GroupSerializer(ModelSerializer):
+class GroupSerializer(SerializadorMedido, ModelSerializer):
     permissions = PermissionSerializer(many=True, read_only=True)
     permission_ids = PrimaryKeyRelatedField(
         queryset= Permission.objects.all(), many=True, write_only=True, source='permissions'
@@ -50,7 +73,7 @@ class GroupSerializer(ModelSerializer):
         fields = ['id', 'name', 'permissions', 'permission_ids']
     
     
-class UserSerializer(HyperlinkedModelSerializer):
+class UserSerializer(SerializadorMedido, HyperlinkedModelSerializer):
     groups = SlugRelatedField(
         many=True,
         slug_field='name',
@@ -62,35 +85,49 @@ class UserSerializer(HyperlinkedModelSerializer):
         fields = ['url', 'username', 'email', 'groups']
 
 
-class CategoriaSerializer(ModelSerializer):
+class CategoriaSerializer(SerializadorMedido, ModelSerializer):
     class Meta:
         model = Categoria
         fields = ['id', 'nombre', 'descripcion']
 
 
-class ProductoListSerializer(ModelSerializer):
+class ProductoListSerializer(SerializadorMedido, ModelSerializer):
     categoria = CharField(source='categoria.nombre', read_only=True)
     categoria_id = IntegerField(source='categoria.id', read_only=True)
+    srcset = SerializerMethodField()
     class Meta:
         model = Producto
-        fields = ['id', 'categoria', 'categoria_id', 'nombre', 'tipo', 'medidas', 'precio', 'foto']
+        fields = ['id', 'categoria', 'categoria_id', 'nombre', 'tipo', 'medidas', 'precio', 'foto', 'srcset']
 
+    def get_srcset(self, obj):
+        return imagenes.srcset(obj, self.context.get('request'))
 
-class ProductoDetailSerializer(ModelSerializer):
+
+class ProductoDetailSerializer(SerializadorMedido, ModelSerializer):
     categoria = CharField(source='categoria.nombre', read_only=True)
     categoria_id = IntegerField(source='categoria.id', read_only=True)
     inventario = SerializerMethodField()
+    srcset = SerializerMethodField()
 
     class Meta:
         model = Producto
-        fields = ['id', 'categoria', 'categoria_id', 'nombre', 'tipo', 'medidas', 'precio', 'foto', 'inventario']
+        fields = ['id', 'categoria', 'categoria_id', 'nombre', 'tipo', 'medidas', 'precio', 'foto', 'srcset', 'inventario']
+        prefetch_method_fields = {
+            'inventario': ('inventario_set', 'InventarioSerializer'),
+        }
 
     def get_inventario(self, obj):
-        inventarios = Inventario.objects.filter(producto=obj, eliminado=False)
+        # Usa el Prefetch del QueryPlannerMixin si esta disponible
+        inventarios = getattr(obj, 'prefetched_inventario', None)
+        if inventarios is None:
+            inventarios = Inventario.objects.filter(producto=obj, eliminado=False).select_related('sucursal')
         return InventarioSerializer(inventarios, many=True).data
+
+    def get_srcset(self, obj):
+        return imagenes.srcset(obj, self.context.get('request'))
     
 
-class ProductoCreateUpdateSerializer(ModelSerializer):
+class ProductoCreateUpdateSerializer(SerializadorMedido, ModelSerializer):
     categoria = PrimaryKeyRelatedField(queryset=Categoria.objects.all())
 
     class Meta:
@@ -110,28 +147,30 @@ class ProductoCreateUpdateSerializer(ModelSerializer):
         return InventarioSerializer(inventarios, many=True).data'''
 
 
-class SucursalSerializer(ModelSerializer):
+class SucursalSerializer(SerializadorMedido, ModelSerializer):
     class Meta:
         model = Sucursal
-        fields = ['id', 'nombre', 'direccion']
+        fields = ['id', 'nombre', 'direccion', 'latitud', 'longitud']
 
 
-class InventarioSerializer(ModelSerializer):
+class InventarioSerializer(SerializadorMedido, ModelSerializer):
     sucursal = PrimaryKeyRelatedField(queryset=Sucursal.objects.all())
     producto = PrimaryKeyRelatedField(queryset=Producto.objects.all())
     sucursal_detalle = SucursalSerializer(source='sucursal', read_only=True)
     class Meta:
         model = Inventario
         fields = ['id', 'producto', 'sucursal', 'sucursal_detalle', 'cantidad']
+        # La restriccion unica de la tabla incluye las filas eliminadas
+        validators = [UniqueTogetherValidator(queryset=Inventario.all_objects.all(), fields=['producto', 'sucursal'])]
 
 
-class ProductoSimpleSerializer(ModelSerializer):
+class ProductoSimpleSerializer(SerializadorMedido, ModelSerializer):
     class Meta:
         model = Producto
         fields = ['id', 'nombre', 'precio'] 
 
 
-class DetalleCarritoSerializer(ModelSerializer):
+class DetalleCarritoSerializer(SerializadorMedido, ModelSerializer):
     id_producto = PrimaryKeyRelatedField(queryset=Producto.objects.all())
     producto_nombre = CharField(source='id_producto.nombre', read_only=True)
     producto_precio = DecimalField(source='id_producto.precio', max_digits=10, decimal_places=2, read_only=True)
@@ -141,50 +180,78 @@ class DetalleCarritoSerializer(ModelSerializer):
         fields = ['id', 'id_carrito', 'id_producto', 'producto_nombre', 'producto_precio', 'cantidad']
 
     def create(self, validated_data):
-        carrito = validated_data['id_carrito']
         producto = validated_data['id_producto']
-        cantidad_nueva = validated_data['cantidad']
 
-        # Verificamos si ya existe un detalle para el mismo carrito y producto
-        detalle_existente = DetalleCarrito.objects.filter(
-            id_carrito=carrito,
-            id_producto=producto,
-            eliminado=False
-        ).first()
+        # Inserta la linea o suma la cantidad a la existente en una sola sentencia
+        detalle = agregar_items(
+            validated_data['id_carrito'], [(producto.pk, validated_data['cantidad'])], precios={producto.pk: producto.precio}
+        )[0]
+        detalle.id_producto = producto
+        return detalle
+
+
+class ItemCarritoSerializer(Serializer):
+    id_producto = IntegerField()
+    cantidad = IntegerField(min_value=1)
+
 
-        if detalle_existente:
-            detalle_existente.cantidad += cantidad_nueva
-            detalle_existente.save()
-            return detalle_existente
+class AgregarItemsSerializer(Serializer):
+    items = ItemCarritoSerializer(many=True, allow_empty=False)
+    reemplazar = BooleanField(default=False)
 
-        # Si no existe, se crea como nuevo
-        return super().create(validated_data)
+    def validate_items(self, items):
+        # Valida todos los productos con una sola consulta
+        ids = {item['id_producto'] for item in items}
+        productos = Producto.objects.filter(id__in=ids, eliminado=False).in_bulk()
+        faltantes = sorted(ids - productos.keys())
+        if faltantes:
+            raise ValidationError(f'Productos inexistentes: {faltantes}')
+        self.productos = productos
+        return items
 
 
 
-class CarritoSerializer(ModelSerializer):
+class CarritoSerializer(SerializadorMedido, ModelSerializer):
     detalles = SerializerMethodField()
 
     class Meta:
         model = Carrito
-        fields = ['id', 'fecha_creacion', 'id_usuario', 'detalles']
+        fields = ['id', 'fecha_creacion', 'id_usuario', 'subtotal', 'cantidad_items', 'detalles']
+        read_only_fields = ['subtotal', 'cantidad_items']
+        prefetch_method_fields = {
+            'detalles': ('detalles', 'DetalleCarritoSerializer'),
+        }
     
     def get_detalles(self, obj):
-        detalles_activos = obj.detalles.filter(eliminado=False)
+        detalles_activos = getattr(obj, 'prefetched_detalles', None)
+        if detalles_activos is None:
+            detalles_activos = obj.detalles.filter(eliminado=False).select_related('id_producto')
         return DetalleCarritoSerializer(detalles_activos, many=True).data
 
 
-class DetallePedidoSerializer(ModelSerializer):
+class CarritoResumenSerializer(SerializadorMedido, ModelSerializer):
+    class Meta:
+        model = Carrito
+        fields = ['id', 'subtotal', 'cantidad_items']
+
+
+class DetallePedidoSerializer(SerializadorMedido, ModelSerializer):
     class Meta:
         model = DetallePedido
         fields = ['id', 'id_producto', 'cantidad', 'precio', 'precio_total', 'fecha_creacion']
 
 
-class PedidoSerializer(ModelSerializer):
+class HistorialPedidoSerializer(SerializadorMedido, ModelSerializer):
+    class Meta:
+        model = HistorialPedido
+        fields = ['id', 'desde', 'hacia', 'usuario', 'fecha']
+
+
+class PedidoSerializer(SerializadorMedido, ModelSerializer):
     detalles = DetallePedidoSerializer(many=True, read_only=True)
 
     class Meta:
         model = Pedido
         fields = ['id', 'id_carrito', 'id_usuario', 'monto_total', 'direccion_entrega',
-                  'latitud', 'longitud', 'estado', 'fecha_creacion', 'fecha_modificacion', 'detalles']
+                  'latitud', 'longitud', 'sucursal', 'estado', 'fecha_creacion', 'fecha_modificacion', 'detalles']
         read_only_fields = ['id_usuario', 'fecha_creacion', 'fecha_modificacion', 'detalles']
\ No newline at end of file
@@ -0,0 +1,97 @@
+from django.db import transaction
+from django.contrib.auth.models import Group, User
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import autenticacion, busqueda, imagenes, metricas
+from .cache import incrementar_version
+from .carrito import recalcular_totales
+from .models import Carrito, Categoria, DetalleCarrito, Inventario, Producto, Sucursal, eliminacion_masiva
+
+
+# SoftDeleteModel.delete hace save(), por lo que post_save cubre tambien el soft delete
+@receiver(post_save, sender=Producto)
+@receiver(post_save, sender=Categoria)
+@receiver(post_save, sender=Inventario)
+@receiver(post_save, sender=Sucursal)
+@receiver(post_delete, sender=Producto)
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Inventario)
+@receiver(post_delete, sender=Sucursal)
+@receiver(eliminacion_masiva, sender=Producto)
+@receiver(eliminacion_masiva, sender=Categoria)
+@receiver(eliminacion_masiva, sender=Inventario)
+@receiver(eliminacion_masiva, sender=Sucursal)
+def invalidar_catalogo(sender, **kwargs):
+    # Despues del commit, como en reservas: si no, un lector concurrente podria guardar
+    # las filas previas bajo la version nueva y nada las invalidaria
+    transaction.on_commit(lambda: incrementar_version(sender))
+
+
+@receiver(post_save, sender=Producto)
+def recalcular_carritos_por_precio(sender, instance, created, **kwargs):
+    # Si cambia el precio, los subtotales de los carritos activos que lo contienen se recalculan
+    if getattr(instance, '_precio_original', instance.precio) == instance.precio:
+        instance._precio_original = instance.precio
+        return
+    lineas = DetalleCarrito.objects.filter(id_producto=instance, eliminado=False).values('id_carrito')
+    recalcular_totales(Carrito.objects.filter(eliminado=False, id__in=lineas))
+    instance._precio_original = instance.precio
+
+
+@receiver(eliminacion_masiva, sender=DetalleCarrito)
+def recalcular_carritos_por_eliminacion(sender, ids, **kwargs):
+    lineas = DetalleCarrito.all_objects.filter(id__in=ids).values('id_carrito')
+    recalcular_totales(Carrito.all_objects.filter(id__in=lineas))
+
+
+@receiver(post_save, sender=Producto)
+def indexar_producto(sender, instance, **kwargs):
+    busqueda.actualizar_productos([instance.pk])
+
+
+@receiver(post_save, sender=Producto)
+def generar_variantes_foto(sender, instance, **kwargs):
+    # Una foto nueva o reemplazada dispara las miniaturas despues del commit, fuera del request
+    nombre = instance.foto.name if instance.foto else ''
+    if nombre and nombre != getattr(instance, '_foto_original', None):
+        id_producto = instance.pk
+        transaction.on_commit(lambda: imagenes.programar(id_producto, nombre))
+    instance._foto_original = nombre
+
+
+@receiver(post_save, sender=Categoria)
+def indexar_categoria(sender, instance, created, **kwargs):
+    if not created:
+        busqueda.actualizar_categorias([instance.pk])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidar_usuario_autenticado(sender, instance, **kwargs):
+    autenticacion.invalidar_usuario(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidar_grupos_de_usuario(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # Cambio hecho desde el grupo: puede afectar a muchos usuarios
+        autenticacion.invalidar_grupos()
+    else:
+        autenticacion.invalidar_usuario(instance.pk)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidar_grupos_autenticados(sender, **kwargs):
+    autenticacion.invalidar_grupos()
+
+
+@receiver(connection_created)
+def medir_conexion(sender, connection, **kwargs):
+    # execute_wrappers sobrevive a las reconexiones del mismo DatabaseWrapper
+    if metricas.envolver_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metricas.envolver_sql)
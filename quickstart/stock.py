@@ -0,0 +1,31 @@
+from .models import Inventario, Sucursal
+
+MAX_PRODUCTOS = 500
+
+
+def matriz(ids_productos=None, id_categoria=None):
+    """
+    Stock producto x sucursal en formato columnar: ids de productos (filas), ids de
+    sucursales (columnas) y las cantidades en un arreglo denso por filas, de modo que
+    la cantidad del producto i en la sucursal j es cantidades[i * len(sucursales) + j].
+    Una consulta sobre Inventario (indice parcial por producto) y otra por las sucursales
+    activas; los productos sin filas de inventario no aparecen, es decir, sin stock.
+    """
+    filas = Inventario.objects.filter(producto__eliminado=False, sucursal__eliminado=False)
+    if ids_productos is not None:
+        filas = filas.filter(producto_id__in=ids_productos)
+    if id_categoria is not None:
+        filas = filas.filter(producto__categoria_id=id_categoria)
+    filas = list(filas.order_by().values_list('producto_id', 'sucursal_id', 'cantidad'))
+
+    sucursales = list(Sucursal.objects.order_by('id').values_list('id', flat=True))
+    productos = sorted({id_producto for id_producto, _, _ in filas})
+    columna = {id_sucursal: j for j, id_sucursal in enumerate(sucursales)}
+    fila = {id_producto: i for i, id_producto in enumerate(productos)}
+
+    cantidades = [0] * (len(productos) * len(sucursales))
+    for id_producto, id_sucursal, cantidad in filas:
+        # Una sucursal creada o eliminada entre ambas consultas se ignora hasta la proxima version
+        if id_sucursal in columna:
+            cantidades[fila[id_producto] * len(sucursales) + columna[id_sucursal]] = cantidad
+    return {'productos': productos, 'sucursales': sucursales, 'cantidades': cantidades}
@@ -1,3 +1,346 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import analitica, autenticacion, cache, carrito, checkout, eventos_stripe, reservas, transiciones
+from .models import (
+    Carrito, Categoria, DetalleCarrito, EventoStripe, Inventario, Pedido, PedidosDiarios, Producto, Reserva, Sucursal, VentaDiaria,
+)
+
+
+class CatalogoMixin:
+    """Una categoria, dos productos y una sucursal con stock, y un pedido pendiente por llamada."""
+
+    def crear_catalogo(self):
+        self.usuario = User.objects.create_user(username='cliente', password='x')
+        self.categoria = Categoria.objects.create(nombre='Mesas')
+        self.sucursal = Sucursal.objects.create(nombre='Centro')
+        self.mesa = Producto.objects.create(categoria=self.categoria, nombre='Mesa', precio=Decimal('100.00'))
+        self.silla = Producto.objects.create(categoria=self.categoria, nombre='Silla', precio=Decimal('25.50'))
+        self.inv_mesa = Inventario.objects.create(producto=self.mesa, sucursal=self.sucursal, cantidad=10)
+        self.inv_silla = Inventario.objects.create(producto=self.silla, sucursal=self.sucursal, cantidad=10)
+
+    def crear_pedido(self, mesas=1, sillas=0):
+        carro = Carrito.objects.create(id_usuario=self.usuario)
+        carrito.agregar_items(carro, [(self.mesa.id, mesas)] + ([(self.silla.id, sillas)] if sillas else []))
+        pedido, _ = checkout.crear_pedido(self.usuario, carro, {'direccion': 'Calle 1'})
+        return pedido
+
+    def stock(self, inventario):
+        inventario.refresh_from_db()
+        return inventario.cantidad
+
+
+class PaginacionKeysetTests(TestCase):
+    def setUp(self):
+        self.usuario = User.objects.create_user(username='cliente', password='x')
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+
+    def _recorrer(self, url):
+        ids = []
+        while url:
+            respuesta = self.cliente.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            ids += [pedido['id'] for pedido in respuesta.json()['results']]
+            url = respuesta.json()['next']
+        return ids
+
+    def test_pedidos_en_el_mismo_milisegundo_no_se_saltan(self):
+        base = timezone.now().replace(microsecond=123000)
+        pedidos = [
+            Pedido.objects.create(id_usuario=self.usuario, monto_total=10, direccion_entrega='x')
+            for _ in range(5)
+        ]
+        # Mismo milisegundo, distinto microsegundo: el orden por fecha no coincide con el de id
+        for microsegundos, pedido in zip((400, 100, 300, 200, 100), pedidos):
+            Pedido.objects.filter(id=pedido.id).update(fecha_creacion=base + timedelta(microseconds=microsegundos))
+
+        esperado = list(Pedido.objects.order_by('-fecha_creacion', '-id').values_list('id', flat=True))
+        self.assertEqual(self._recorrer('/api/pedidos/?page_size=1'), esperado)
+        self.assertEqual(self._recorrer('/api/pedidos/?page_size=2'), esperado)
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.cliente.get('/api/pedidos/?cursor=no-es-un-cursor').status_code, 404)
+
+
+class TransicionesTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+        self.admin = User.objects.create_user(username='admin', password='x', is_staff=True)
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.usuario)
+        self.staff = APIClient()
+        self.staff.force_authenticate(self.admin)
+
+    def test_grafo(self):
+        pedido = self.crear_pedido()
+        self.assertEqual(transiciones.transicionar([pedido.id], 'enviado'), ([], [(pedido.id, 'pendiente')]))
+        self.assertEqual(transiciones.transicionar([pedido.id], 'confirmado'), ([pedido.id], []))
+        self.assertEqual(transiciones.transicionar([pedido.id], 'enviado'), ([pedido.id], []))
+        self.assertEqual(transiciones.transicionar([pedido.id], 'cancelado'), ([], [(pedido.id, 'enviado')]))
+        self.assertEqual(transiciones.transicionar([pedido.id], 'entregado'), ([pedido.id], []))
+        self.assertEqual(
+            list(pedido.historial.order_by('id').values_list('desde', 'hacia')),
+            [(None, 'pendiente'), ('pendiente', 'confirmado'), ('confirmado', 'enviado'), ('enviado', 'entregado')],
+        )
+        with self.assertRaises(ValueError):
+            transiciones.transicionar([pedido.id], 'perdido')
+
+    def test_cliente_solo_cancela_pendientes(self):
+        pedido = self.crear_pedido()
+        url = f'/api/pedidos/{pedido.id}/'
+        self.assertEqual(self.cliente.put(url, {'estado': 'confirmado'}, format='json').status_code, 403)
+        transiciones.transicionar([pedido.id], 'confirmado')
+        respuesta = self.cliente.put(url, {'estado': 'cancelado'}, format='json')
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(Pedido.objects.get(id=pedido.id).estado, 'confirmado')
+
+    def test_cancelar_pendiente_devuelve_stock(self):
+        pedido = self.crear_pedido(mesas=3)
+        self.assertEqual(self.stock(self.inv_mesa), 7)
+        respuesta = self.cliente.put(f'/api/pedidos/{pedido.id}/', {'estado': 'cancelado'}, format='json')
+        self.assertEqual(respuesta.json()['estado'], 'cancelado')
+        self.assertEqual(self.stock(self.inv_mesa), 10)
+
+    def test_cancelar_confirmado_devuelve_stock_consumido(self):
+        pedido = self.crear_pedido(mesas=3)
+        transiciones.transicionar([pedido.id], 'confirmado')
+        self.assertEqual(self.stock(self.inv_mesa), 7)
+        self.assertEqual(transiciones.transicionar([pedido.id], 'cancelado'), ([pedido.id], []))
+        self.assertEqual(self.stock(self.inv_mesa), 10)
+        self.assertEqual(list(pedido.reservas.values_list('estado', flat=True)), ['devuelta'])
+        # Cancelar de nuevo no devuelve dos veces
+        transiciones.transicionar([pedido.id], 'cancelado')
+        self.assertEqual(self.stock(self.inv_mesa), 10)
+
+    def test_transicion_en_lote(self):
+        pendiente, confirmado = self.crear_pedido(), self.crear_pedido()
+        transiciones.transicionar([confirmado.id], 'confirmado')
+        url = '/api/pedidos/transicion/'
+        self.assertEqual(self.cliente.post(url, {'ids': [confirmado.id], 'estado': 'enviado'}, format='json').status_code, 403)
+        respuesta = self.staff.post(url, {'ids': [pendiente.id, confirmado.id, 999], 'estado': 'enviado'}, format='json')
+        self.assertEqual(respuesta.json(), {
+            'movidos': [confirmado.id],
+            'rechazados': [{'id': pendiente.id, 'estado': 'pendiente'}, {'id': 999, 'estado': None}],
+        })
+        self.assertEqual(self.staff.post(url, {'ids': 'x', 'estado': 'enviado'}, format='json').status_code, 400)
+        self.assertEqual(self.staff.post(url, {'ids': [1], 'estado': 'perdido'}, format='json').status_code, 400)
+
+    def test_cancelar_en_lote_cierra_la_sesion_de_pago(self):
+        abierto, pagado = self.crear_pedido(), self.crear_pedido()
+        Pedido.objects.filter(id=abierto.id).update(sesion_stripe='cs_abierta')
+        Pedido.objects.filter(id=pagado.id).update(sesion_stripe='cs_pagada')
+        pagada = Response({'error': 'Pagado.'}, status=409)
+        with mock.patch('quickstart.views._expirar_sesion', side_effect=lambda sesion: pagada if sesion == 'cs_pagada' else None) as expirar:
+            respuesta = self.staff.post('/api/pedidos/transicion/', {'ids': [abierto.id, pagado.id], 'estado': 'cancelado'}, format='json')
+        self.assertEqual(sorted(llamada.args[0] for llamada in expirar.call_args_list), ['cs_abierta', 'cs_pagada'])
+        self.assertEqual(respuesta.json(), {
+            'movidos': [abierto.id],
+            'rechazados': [{'id': pagado.id, 'estado': 'pendiente', 'error': 'Pagado.'}],
+        })
+        self.assertEqual(Pedido.objects.get(id=pagado.id).estado, 'pendiente')
+
+    def test_pago_de_pedido_cancelado_queda_en_error(self):
+        pedido = self.crear_pedido()
+        transiciones.transicionar([pedido.id], 'cancelado')
+        evento = EventoStripe.objects.create(
+            id_evento='evt_1', tipo='checkout.session.completed',
+            payload={'metadata': {'pedido_id': str(pedido.id)}, 'payment_intent': 'pi_1'},
+        )
+        eventos_stripe.procesar_lote()
+        evento.refresh_from_db()
+        self.assertEqual(evento.estado, 'error')
+        self.assertIn('pi_1', evento.error)
+        self.assertEqual(Pedido.objects.get(id=pedido.id).estado, 'cancelado')
+
+    def test_evento_fallido_espera_su_backoff(self):
+        pedido = self.crear_pedido()
+        evento = EventoStripe.objects.create(
+            id_evento='evt_2', tipo='checkout.session.completed', payload={'metadata': {'pedido_id': str(pedido.id)}},
+        )
+        with mock.patch('quickstart.eventos_stripe.procesar_evento', side_effect=RuntimeError('caido')):
+            self.assertEqual(eventos_stripe.procesar_lote(), 0)
+            # Sigue pendiente pero no se reclama de nuevo hasta proximo_intento
+            self.assertEqual(eventos_stripe.procesar_lote(), 0)
+        evento.refresh_from_db()
+        self.assertEqual((evento.estado, evento.intentos), ('pendiente', 1))
+        self.assertGreater(evento.proximo_intento, timezone.now())
+
+        EventoStripe.objects.filter(id=evento.id).update(proximo_intento=timezone.now())
+        self.assertEqual(eventos_stripe.procesar_lote(), 1)
+        self.assertEqual(Pedido.objects.get(id=pedido.id).estado, 'confirmado')
+
+
+class ReservasTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+
+    def test_reservar_descuenta_y_liberar_devuelve(self):
+        pedido = self.crear_pedido(mesas=4, sillas=2)
+        self.assertEqual((self.stock(self.inv_mesa), self.stock(self.inv_silla)), (6, 8))
+        self.assertEqual(reservas.liberar_reservas(pedido), 6)
+        self.assertEqual((self.stock(self.inv_mesa), self.stock(self.inv_silla)), (10, 10))
+        # Idempotente: las reservas ya liberadas no se devuelven otra vez
+        self.assertEqual(reservas.liberar_reservas(pedido), 0)
+        self.assertEqual(self.stock(self.inv_mesa), 10)
+
+    def test_stock_insuficiente(self):
+        with self.assertRaises(checkout.CheckoutError) as error:
+            self.crear_pedido(mesas=11)
+        self.assertEqual(error.exception.status, 409)
+        self.assertEqual(self.stock(self.inv_mesa), 10)
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_confirmar_consume(self):
+        pedido = self.crear_pedido(mesas=2)
+        transiciones.transicionar([pedido.id], 'confirmado')
+        self.assertEqual(list(pedido.reservas.values_list('estado', flat=True)), ['consumida'])
+        self.assertEqual(reservas.liberar_reservas(pedido), 0)
+        self.assertEqual(self.stock(self.inv_mesa), 8)
+
+    def test_vencidas_esperan_la_gracia(self):
+        pedido = self.crear_pedido(mesas=2)
+        ahora = timezone.now()
+        Reserva.objects.filter(id_pedido=pedido).update(expira=ahora - timedelta(minutes=1))
+        # Dentro de la gracia se espera el evento checkout.session.expired
+        self.assertEqual(reservas.liberar_vencidas(ahora, gracia=timedelta(minutes=10)), 0)
+        self.assertEqual(Pedido.objects.get(id=pedido.id).estado, 'pendiente')
+        self.assertEqual(self.stock(self.inv_mesa), 8)
+
+        self.assertEqual(reservas.liberar_vencidas(ahora + timedelta(minutes=10), gracia=timedelta(minutes=10)), 1)
+        self.assertEqual(Pedido.objects.get(id=pedido.id).estado, 'cancelado')
+        self.assertEqual(self.stock(self.inv_mesa), 10)
+
+
+class CarritoTotalesTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+        self.carrito = Carrito.objects.create(id_usuario=self.usuario)
+
+    def totales(self):
+        self.carrito.refresh_from_db()
+        return self.carrito.subtotal, self.carrito.cantidad_items
+
+    def test_agregar_suma_y_reemplazar_pisa(self):
+        carrito.agregar_items(self.carrito, [(self.mesa.id, 1), (self.silla.id, 2), (self.mesa.id, 1)])
+        self.assertEqual(self.totales(), (Decimal('251.00'), 4))
+        carrito.agregar_items(self.carrito, [(self.silla.id, 1)])
+        self.assertEqual(self.totales(), (Decimal('276.50'), 5))
+        carrito.agregar_items(self.carrito, [(self.mesa.id, 1)], reemplazar=True)
+        self.assertEqual(self.totales(), (Decimal('176.50'), 4))
+        self.assertEqual(DetalleCarrito.objects.filter(id_carrito=self.carrito).count(), 2)
+        self.assertFalse(carrito.carritos_con_diferencias(Carrito.objects.all()).exists())
+
+    def test_cambio_de_precio_recalcula(self):
+        carrito.agregar_items(self.carrito, [(self.mesa.id, 2)])
+        self.mesa.precio = Decimal('80.00')
+        self.mesa.save()
+        self.assertEqual(self.totales(), (Decimal('160.00'), 2))
+
+    def test_checkout_usa_el_subtotal(self):
+        carrito.agregar_items(self.carrito, [(self.mesa.id, 1), (self.silla.id, 2)])
+        pedido, _ = checkout.crear_pedido(self.usuario, self.carrito, {'direccion': 'Calle 1'})
+        self.assertEqual(pedido.monto_total, Decimal('151.00'))
+        self.assertEqual(sum(detalle.precio_total for detalle in pedido.detalles.all()), Decimal('151.00'))
+
+
+class SoftDeleteTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+
+    def test_cascada_de_categoria(self):
+        carro = Carrito.objects.create(id_usuario=self.usuario)
+        carrito.agregar_items(carro, [(self.mesa.id, 1), (self.silla.id, 1)])
+        total, conteo = Categoria.objects.filter(id=self.categoria.id).delete()
+        self.assertEqual(conteo, {
+            'quickstart.Categoria': 1, 'quickstart.Producto': 2,
+            'quickstart.Inventario': 2, 'quickstart.DetalleCarrito': 2,
+        })
+        self.assertEqual(total, 7)
+        self.assertFalse(Producto.objects.exists())
+        self.assertEqual(Producto.all_objects.filter(eliminado=True).count(), 2)
+        self.assertFalse(Inventario.objects.exists())
+        carro.refresh_from_db()
+        self.assertEqual((carro.subtotal, carro.cantidad_items), (Decimal('0'), 0))
+
+    def test_instancia_elimina_hijos(self):
+        self.mesa.delete()
+        self.assertTrue(Producto.all_objects.get(id=self.mesa.id).eliminado)
+        self.assertTrue(Inventario.all_objects.get(id=self.inv_mesa.id).eliminado)
+        self.assertFalse(Inventario.all_objects.get(id=self.inv_silla.id).eliminado)
+
+    def test_version_del_cache_cambia_al_confirmar(self):
+        antes = cache.versiones([Producto])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mesa.delete()
+            self.assertEqual(cache.versiones([Producto]), antes)
+        self.assertNotEqual(cache.versiones([Producto]), antes)
+
+
+class AnaliticaTests(CatalogoMixin, TestCase):
+    def setUp(self):
+        self.crear_catalogo()
+
+    def resumenes(self):
+        ventas = sorted(VentaDiaria.objects.filter(cantidad__gt=0).values_list('fecha', 'producto_id', 'estado', 'cantidad', 'monto'))
+        pedidos = sorted(PedidosDiarios.objects.filter(pedidos__gt=0).values_list('fecha', 'estado', 'pedidos', 'monto'))
+        return ventas, pedidos
+
+    def test_deltas_coinciden_con_reconstruir(self):
+        pedidos = [self.crear_pedido(mesas=1, sillas=i) for i in range(1, 5)]
+        transiciones.transicionar([pedidos[0].id, pedidos[1].id, pedidos[2].id], 'confirmado')
+        transiciones.transicionar([pedidos[0].id], 'enviado')
+        # Un lote con pedidos de distintos estados de origen aplica un solo upsert por tabla
+        transiciones.transicionar([pedidos[1].id, pedidos[3].id], 'cancelado')
+
+        incrementales = self.resumenes()
+        hoy = timezone.localdate()
+        analitica.reconstruir(hoy, hoy)
+        self.assertEqual(self.resumenes(), incrementales)
+
+        vendidos = analitica.pedidos_por_dia(hoy, hoy, analitica.VENDIDOS)
+        self.assertEqual(vendidos['pedidos'], 2)
+        self.assertEqual(vendidos['monto'], pedidos[0].monto_total + pedidos[2].monto_total)
+        por_producto = {fila['producto_id']: fila['unidades'] for fila in analitica.ventas(hoy, hoy, analitica.VENDIDOS, 'producto')}
+        self.assertEqual(por_producto, {self.mesa.id: 2, self.silla.id: 4})
+
+
+class RevocacionTokenTests(TestCase):
+    def setUp(self):
+        caches[autenticacion.CACHE_ALIAS].clear()
+        autenticacion._revocados.clear()
+        self.usuario = User.objects.create_user(username='cliente', password='secreta')
+        self.cliente = APIClient()
+        self.tokens = self.cliente.post('/api/token', {'username': 'cliente', 'password': 'secreta'}, format='json').json()
+        self.cliente.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+
+    def test_logout_revoca_access_y_refresh(self):
+        self.assertEqual(self.cliente.get('/api/ultimo_carrito/').status_code, 200)
+        self.assertEqual(self.cliente.post('/api/token/logout', {'refresh': self.tokens['refresh']}, format='json').status_code, 200)
+        self.assertEqual(self.cliente.get('/api/ultimo_carrito/').status_code, 401)
+        # Otro proceso solo tiene el cache compartido
+        autenticacion._revocados.clear()
+        self.assertEqual(self.cliente.get('/api/ultimo_carrito/').status_code, 401)
+        self.assertEqual(APIClient().post('/api/token/refresh', {'refresh': self.tokens['refresh']}, format='json').status_code, 401)
+
+    def test_desactivar(self):
+        self.assertEqual(self.cliente.get('/api/ultimo_carrito/').status_code, 200)
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertEqual(self.cliente.get('/api/ultimo_carrito/').status_code, 401)
 
-# Create your tests here.
+    def test_usuario_del_cache_no_se_guarda(self):
+        self.cliente.get('/api/ultimo_carrito/')
+        usuario = autenticacion.usuario_para_token(AccessToken(self.tokens['access']))
+        self.assertEqual(usuario.pk, self.usuario.pk)
+        with self.assertRaises(RuntimeError):
+            usuario.save()
@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.utils import timezone
+
+from . import analitica, reservas
+from .models import HistorialPedido, Pedido
+
+# Grafo de estados del pedido: estado -> estados a los que puede pasar
+TRANSICIONES = {
+    'pendiente': ('confirmado', 'cancelado'),
+    'confirmado': ('enviado', 'cancelado'),
+    'enviado': ('entregado',),
+    'entregado': (),
+    'cancelado': (),
+}
+
+
+def predecesores(hacia):
+    return [desde for desde, siguientes in TRANSICIONES.items() if hacia in siguientes]
+
+
+def _registrar(movidos, hacia, usuario):
+    # movidos: [(id_pedido, estado anterior)]; el historial va en la misma transaccion
+    HistorialPedido.objects.bulk_create([
+        HistorialPedido(pedido_id=id_pedido, desde=desde, hacia=hacia, usuario=usuario)
+        for id_pedido, desde in movidos
+    ])
+
+
+def registrar_creacion(pedido, usuario=None):
+    """
+    Historial y analitica del pedido recien creado. Debe llamarse al final de su
+    transaccion: la fila de resumen del dia la comparten todos los checkouts.
+    """
+    _registrar([(pedido.id, None)], pedido.estado, usuario)
+    analitica.registrar_transicion([(pedido.id, None)], pedido.estado)
+
+
+def transicionar(ids_pedidos, hacia, usuario=None, desde=None):
+    """
+    Pasa a `hacia` los pedidos de `ids_pedidos` cuyo estado actual lo permite (o, con
+    `desde`, solo los que esten en alguno de esos estados), con un UPDATE condicional
+    sobre las filas bloqueadas. Escribe el historial con bulk_create, actualiza la
+    analitica y resuelve las reservas: al confirmar se consumen y al cancelar se devuelve
+    su stock (las activas si estaba pendiente, las consumidas si estaba confirmado).
+    Devuelve (ids movidos, [(id, estado actual o None si no existe)] rechazados).
+    """
+    if hacia not in TRANSICIONES:
+        raise ValueError(f'Estado inválido: {hacia}.')
+    permitidos = [estado for estado in predecesores(hacia) if desde is None or estado in desde]
+    ids = sorted(set(ids_pedidos))
+
+    with transaction.atomic():
+        # Se bloquea en orden de id, como en reservas, para que dos lotes no se crucen
+        actuales = dict(
+            Pedido.objects.select_for_update().filter(id__in=ids).order_by('id').values_list('id', 'estado')
+        )
+        movidos = [(id_pedido, actuales[id_pedido]) for id_pedido in ids if actuales.get(id_pedido) in permitidos]
+        rechazados = [(id_pedido, actuales.get(id_pedido)) for id_pedido in ids if actuales.get(id_pedido) not in permitidos]
+        if movidos:
+            Pedido.objects.filter(id__in=[id_pedido for id_pedido, _ in movidos], estado__in=permitidos).update(
+                estado=hacia, fecha_modificacion=timezone.now(),
+            )
+            _registrar(movidos, hacia, usuario)
+            if hacia == 'confirmado':
+                reservas.confirmar_reservas([id_pedido for id_pedido, _ in movidos])
+            elif hacia == 'cancelado':
+                for id_pedido, anterior in movidos:
+                    if anterior == 'pendiente':
+                        reservas.liberar_reservas(id_pedido)
+                confirmados = [id_pedido for id_pedido, anterior in movidos if anterior == 'confirmado']
+                if confirmados:
+                    reservas.devolver_consumidas(confirmados)
+            # Los resumenes al final, para retener lo menos posible sus filas compartidas
+            analitica.registrar_transicion(movidos, hacia)
+    return [id_pedido for id_pedido, _ in movidos], rechazados
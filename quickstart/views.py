@@ -1,16 +1,42 @@
 from django.contrib.auth.models import Group, User
 from rest_framework import  viewsets, status, generics
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes, action
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.serializers import TokenObtainSerializer
+from rest_framework_simplejwt.views import TokenBlacklistView, TokenObtainPairView
+from rest_framework.exceptions import AuthenticationFailed
+from asgiref.sync import sync_to_async
+import itertools
+import json
 from .models import *
 from quickstart.serializers import *
+from quickstart.query_plan import QueryPlannerMixin, plan_queryset
+from quickstart.pagination import BusquedaPagination, CatalogoPagination, PedidoPagination
+from quickstart import busqueda
+from quickstart import exports
+from quickstart.cache import CatalogoCacheMixin
+from quickstart import autenticacion
+from quickstart import hashing
+from quickstart import metricas
+from quickstart.carrito import agregar_items
+from quickstart import inventario_sync
+from quickstart import eventos_stripe
+from quickstart import checkout
+from quickstart import analitica
+from quickstart import stock
+from quickstart import geo
+from quickstart import despacho
+from quickstart import transiciones
+from quickstart.pagos import cliente_stripe, parametros_sesion
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.db.models import F, Sum, DecimalField, ExpressionWrapper, Prefetch
 from decimal import Decimal, ROUND_HALF_UP
+from datetime import timedelta
 
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 import stripe
@@ -27,16 +53,11 @@ class RegisterView(generics.CreateAPIView):
         if serializer.is_valid():
             user = serializer.save()
 
-            # Ahora usamos el CustomTokenObtainPairSerializer para generar misma respuesta que login
-            token_serializer = CustomTokenObtainPairSerializer(data={
-                'username': request.data['username'],
-                'password': request.data['password']
-            }, context={'request': request} )
-
-            if token_serializer.is_valid():
-                return Response(token_serializer.validated_data, status=status.HTTP_201_CREATED)
-            else:
-                return Response(token_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            # Mismo formato que el login, pero los tokens se emiten directo: la password ya se hasheo al crear el usuario
+            return Response(
+                CustomTokenObtainPairSerializer.tokens_para(user, {'request': request}),
+                status=status.HTTP_201_CREATED,
+            )
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -45,12 +66,26 @@ class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
 
-class PermissionViewSet(viewsets.ReadOnlyModelViewSet): 
+class LogoutView(TokenBlacklistView):
+    def post(self, request, *args, **kwargs):
+        response = super().post(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            # Ademas del refresh token, revoca el access token con el que se llamo
+            try:
+                autenticado = autenticacion.CachedJWTAuthentication().authenticate(request)
+            except AuthenticationFailed:
+                autenticado = None
+            if autenticado:
+                autenticacion.revocar(autenticado[1])
+        return response
+
+
+class PermissionViewSet(QueryPlannerMixin, viewsets.ReadOnlyModelViewSet): 
     queryset = Permission.objects.all()
     serializer_class = PermissionSerializer
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = User.objects.filter(is_active=True).order_by('-date_joined')
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated]
@@ -61,30 +96,49 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class GroupViewSet(viewsets.ModelViewSet):
+class GroupViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = Group.objects.all().order_by('name')
     serializer_class = GroupSerializer
     permission_classes = [IsAuthenticated]
 
 
-class SoftDeleteModelViewSet(viewsets.ModelViewSet):
+class SoftDeleteModelViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
+    pagination_class = CatalogoPagination
+
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         instance.delete()  # hace soft delete
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=False, methods=['post'], url_path='eliminar')
+    def eliminar(self, request):
+        # Soft delete en lote: {"ids": [1, 2, 3]}, con la cascada declarada en el modelo
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            return Response({'error': 'Se espera "ids": una lista de enteros.'}, status=400)
+        total, eliminados = self.get_queryset().filter(pk__in=ids).delete()
+        return Response({'total': total, 'eliminados': eliminados})
     
 
-class CategoriaViewSet(SoftDeleteModelViewSet):
+class CategoriaViewSet(CatalogoCacheMixin, SoftDeleteModelViewSet):
+    cache_modelos = (Categoria,)
     queryset = Categoria.objects.filter(eliminado=False)
     serializer_class = CategoriaSerializer
     permission_classes = [IsAuthenticated]
 
 
-class ProductoViewSet(SoftDeleteModelViewSet):
+class ProductoViewSet(CatalogoCacheMixin, SoftDeleteModelViewSet):
+    cache_modelos = (Producto, Categoria)
     queryset = Producto.objects.filter(eliminado=False)
-    
+
+    def get_cache_modelos(self):
+        # Cada reserva cambia Inventario: solo el detalle y la matriz de stock dependen de el
+        if self.action in ('retrieve', 'stock'):
+            return self.cache_modelos + (Inventario, Sucursal)
+        return self.cache_modelos
+
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'buscar', 'stock']:
             return [AllowAny()]
         return [IsAuthenticated()]
 
@@ -95,31 +149,147 @@ class ProductoViewSet(SoftDeleteModelViewSet):
             return ProductoCreateUpdateSerializer
         return ProductoListSerializer
 
-
-class SucursalViewSet(SoftDeleteModelViewSet):
+    @action(detail=False, methods=['get'], url_path='buscar')
+    def buscar(self, request):
+        return self._respuesta_cacheada(request, lambda: self._buscar(request))
+
+    def _buscar(self, request):
+        texto = request.query_params.get('q', '').strip()
+        if not texto:
+            return Response({'error': 'El parámetro q es obligatorio.'}, status=400)
+
+        productos = busqueda.buscar(texto)
+        filtros = {}
+        try:
+            if request.query_params.get('categoria'):
+                filtros['categoria_id'] = int(request.query_params['categoria'])
+            if request.query_params.get('precio_min'):
+                filtros['precio__gte'] = Decimal(request.query_params['precio_min'])
+            if request.query_params.get('precio_max'):
+                filtros['precio__lte'] = Decimal(request.query_params['precio_max'])
+        except (ValueError, ArithmeticError):
+            return Response({'error': 'Filtros inválidos.'}, status=400)
+
+        paginador = BusquedaPagination()
+        page = paginador.paginate_queryset(plan_queryset(productos.filter(**filtros), ProductoListSerializer), request, view=self)
+        response = paginador.get_paginated_response(ProductoListSerializer(page, many=True, context=self.get_serializer_context()).data)
+        # Las facetas (sobre todas las coincidencias, sin los filtros) solo en la primera pagina
+        if not request.query_params.get(paginador.cursor_query_param):
+            response.data['facetas'] = busqueda.facetas(productos)
+        return response
+
+
+    @action(detail=False, methods=['get'], url_path='stock')
+    def stock(self, request):
+        # Matriz de stock de ?ids=1,2,3 o ?categoria=5 en todas las sucursales, en una sola request
+        return self._respuesta_cacheada(request, lambda: self._stock(request))
+
+    def _stock(self, request):
+        try:
+            ids = [int(i) for i in request.query_params['ids'].split(',') if i] if request.query_params.get('ids') else None
+            categoria = int(request.query_params['categoria']) if request.query_params.get('categoria') else None
+        except ValueError:
+            return Response({'error': 'Filtros inválidos.'}, status=400)
+        if ids is None and categoria is None:
+            return Response({'error': 'Indique ids o categoria.'}, status=400)
+        if ids is not None and len(ids) > stock.MAX_PRODUCTOS:
+            return Response({'error': f'Como máximo {stock.MAX_PRODUCTOS} productos por consulta.'}, status=400)
+        return Response(stock.matriz(ids, categoria))
+
+
+class SucursalViewSet(CatalogoCacheMixin, SoftDeleteModelViewSet):
+    cache_modelos = (Sucursal,)
     queryset = Sucursal.objects.filter(eliminado=False)
     serializer_class = SucursalSerializer
     permission_classes = [IsAuthenticated]
 
+    @action(detail=False, methods=['post'], url_path='cercanas')
+    def cercanas(self, request):
+        # {"latitud", "longitud"} y opcionalmente "id_carrito" o "items": [{"id_producto", "cantidad"}]
+        try:
+            latitud = Decimal(str(request.data.get('latitud')))
+            longitud = Decimal(str(request.data.get('longitud')))
+            if not (-90 <= latitud <= 90 and -180 <= longitud <= 180):
+                raise ValueError
+            if request.data.get('id_carrito') is not None:
+                lineas = list(DetalleCarrito.objects.filter(
+                    id_carrito_id=int(request.data['id_carrito']), id_carrito__id_usuario=request.user,
+                ).values_list('id_producto_id', 'cantidad'))
+            else:
+                lineas = [(int(item['id_producto']), int(item['cantidad'])) for item in request.data.get('items') or []]
+            limite = max(1, min(int(request.data.get('limite', 5)), 50))
+        except (ArithmeticError, AttributeError, KeyError, TypeError, ValueError):
+            return Response({'error': 'Datos inválidos.'}, status=400)
+
+        if not lineas:
+            # Sin carrito: solo las sucursales mas cercanas
+            cercanas = itertools.islice(geo.indice().cercanas(latitud, longitud), limite)
+            return Response({'sucursales': [{'id': id_sucursal, 'distancia_km': round(distancia, 3)} for distancia, id_sucursal in cercanas]})
+
+        elegidas = geo.asignar_sucursales(latitud, longitud, lineas)
+        if elegidas is None:
+            return Response({'error': 'Stock insuficiente en las sucursales con ubicación.'}, status=409)
+        return Response({'sucursales': [{'id': id_sucursal, 'distancia_km': round(distancia, 3)} for id_sucursal, distancia in elegidas]})
+
 
 class InventariosViewSet(SoftDeleteModelViewSet):
     queryset = Inventario.objects.filter(eliminado=False)
     serializer_class = InventarioSerializer
     permission_classes = [IsAuthenticated]
 
+    @action(detail=False, methods=['post'], url_path='importar')
+    def importar(self, request):
+        # Acepta un archivo CSV/JSON en 'archivo' o una lista JSON de filas en el cuerpo
+        archivo = request.FILES.get('archivo')
+        try:
+            if archivo is None:
+                filas = request.data if isinstance(request.data, list) else request.data.get('filas')
+                if not isinstance(filas, list):
+                    raise ValueError('Se espera una lista de filas o un archivo.')
+            elif archivo.name.lower().endswith('.json'):
+                filas = inventario_sync.leer_json(archivo)
+            else:
+                filas = inventario_sync.leer_csv(archivo)
+            resultado = inventario_sync.sincronizar(filas)
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({'error': str(e)}, status=400)
+        return Response(resultado)
 
-class CarritoViewSet(viewsets.ModelViewSet):
-    queryset = Carrito.objects.filter(eliminado=False).prefetch_related(
-        Prefetch('detalles', queryset=DetalleCarrito.objects.filter(eliminado=False))
-    )
+
+class CarritoViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
+    queryset = Carrito.objects.filter(eliminado=False)
     serializer_class = CarritoSerializer
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
         serializer.save(id_usuario=self.request.user)
 
+    @action(detail=True, methods=['post'], url_path='items')
+    def agregar_items(self, request, pk=None):
+        carrito = get_object_or_404(Carrito, pk=pk, id_usuario=request.user, eliminado=False)
+        serializer = AgregarItemsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        detalles = agregar_items(
+            carrito,
+            [(item['id_producto'], item['cantidad']) for item in serializer.validated_data['items']],
+            reemplazar=serializer.validated_data['reemplazar'],
+            precios={producto.id: producto.precio for producto in serializer.productos.values()},
+        )
+        for detalle in detalles:
+            detalle.id_producto = serializer.productos[detalle.id_producto_id]
+        return Response(DetalleCarritoSerializer(detalles, many=True).data)
+
+    @action(detail=True, methods=['get'], url_path='resumen')
+    def resumen(self, request, pk=None):
+        # Para el badge del carrito: lee solo la fila del carrito, sin agregar lineas
+        carrito = Carrito.objects.filter(pk=pk, id_usuario=request.user, eliminado=False).only('id', 'subtotal', 'cantidad_items').first()
+        if carrito is None:
+            return Response({'detail': 'No encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(CarritoResumenSerializer(carrito).data)
 
-class DetalleCarritoViewSet(viewsets.ModelViewSet):
+
+class DetalleCarritoViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = DetalleCarrito.objects.filter(eliminado=False)
     serializer_class = DetalleCarritoSerializer
     permission_classes = [IsAuthenticated]
@@ -128,7 +298,8 @@ class DetalleCarritoViewSet(viewsets.ModelViewSet):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def ultimo_carrito_usuario(request):
-    carrito = Carrito.objects.filter(id_usuario=request.user, eliminado=False).order_by('-fecha_creacion').first()
+    carritos = Carrito.objects.filter(id_usuario=request.user, eliminado=False).order_by('-fecha_creacion')
+    carrito = plan_queryset(carritos, CarritoSerializer).first()
 
     if not carrito:
         carrito = Carrito.objects.create(
@@ -140,16 +311,48 @@ def ultimo_carrito_usuario(request):
     return Response(serializer.data)
 
 
-class PedidoViewSet(viewsets.ModelViewSet):
+MAX_TRANSICION_LOTE = 1000
+
+
+def _expirar_sesion(id_sesion):
+    """
+    Cierra la Checkout Session antes de cancelar el pedido, asi el cliente ya no puede
+    pagarla. Si Stripe no la deja expirar (ya fue pagada) no se cancela.
+    """
+    try:
+        with metricas.medir_proveedor('checkout.sessions.expire'):
+            cliente_stripe().checkout.sessions.expire(id_sesion)
+        return None
+    except stripe.error.InvalidRequestError:
+        pass
+    except stripe.error.StripeError:
+        return Response({'error': 'No se pudo cerrar la sesión de pago, intente de nuevo.'}, status=502)
+
+    # Solo se pueden expirar sesiones abiertas: si ya vencio se puede cancelar igual
+    try:
+        with metricas.medir_proveedor('checkout.sessions.retrieve'):
+            sesion = cliente_stripe().checkout.sessions.retrieve(id_sesion)
+    except stripe.error.StripeError:
+        return Response({'error': 'No se pudo cerrar la sesión de pago, intente de nuevo.'}, status=502)
+    if sesion.status == 'expired':
+        return None
+    return Response({'error': 'El pedido ya fue pagado o se está pagando, no se puede cancelar.'}, status=status.HTTP_409_CONFLICT)
+
+
+class PedidoViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = Pedido.objects.all()
     serializer_class = PedidoSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = PedidoPagination
 
     def get_queryset(self):
+        # El personal ve todos los pedidos; el resto, solo los propios
+        if self.request.user.is_staff:
+            return Pedido.objects.all()
         return Pedido.objects.filter(id_usuario=self.request.user)
 
     def get_object(self):
-        return Pedido.objects.get(pk=self.kwargs['pk'])
+        return get_object_or_404(plan_queryset(self.get_queryset(), self.get_serializer_class()), pk=self.kwargs['pk'])
 
     def create(self, request, *args, **kwargs):
         return Response({'detail': 'Creación de pedidos no permitida por este endpoint.'}, status=status.HTTP_403_FORBIDDEN)
@@ -160,20 +363,177 @@ class PedidoViewSet(viewsets.ModelViewSet):
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         nuevo_estado = request.data.get('estado')
-        if nuevo_estado and nuevo_estado in dict(instance.ESTADOS):
-            instance.estado = nuevo_estado
-            instance.save()
-            serializer = self.get_serializer(instance)
-            return Response(serializer.data)
-        return Response({'detail': 'Solo se permite modificar el estado.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not nuevo_estado or nuevo_estado not in dict(instance.ESTADOS):
+            return Response({'detail': 'Solo se permite modificar el estado.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not request.user.is_staff and nuevo_estado != 'cancelado':
+            return Response({'detail': 'Solo puede cancelar sus pedidos.'}, status=status.HTTP_403_FORBIDDEN)
+
+        if nuevo_estado == 'cancelado' and instance.estado == 'pendiente' and instance.sesion_stripe:
+            error = _expirar_sesion(instance.sesion_stripe)
+            if error:
+                return error
+
+        # Los clientes solo cancelan pedidos pendientes; el personal sigue el grafo completo
+        desde = None if request.user.is_staff else ('pendiente',)
+        movidos, rechazados = transiciones.transicionar([instance.id], nuevo_estado, request.user, desde)
+        if not movidos:
+            return Response(
+                {'error': f'Transición no permitida de {rechazados[0][1]} a {nuevo_estado}.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response(self.get_serializer(self.get_object()).data)
+
+    @action(detail=False, methods=['post'], url_path='transicion', permission_classes=[IsAdminUser])
+    def transicion(self, request):
+        # En lote: {"ids": [1, 2, 3], "estado": "enviado"}
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+            return Response({'error': 'Se espera "ids": una lista de enteros.'}, status=400)
+        if len(ids) > MAX_TRANSICION_LOTE:
+            return Response({'error': f'Como máximo {MAX_TRANSICION_LOTE} pedidos por lote.'}, status=400)
+        estado = request.data.get('estado')
+        if estado not in transiciones.TRANSICIONES:
+            return Response({'error': 'Estado inválido.'}, status=400)
+
+        # Como en update(): antes de cancelar un pendiente se cierra su sesion de pago
+        no_cerrados = []
+        if estado == 'cancelado':
+            sesiones = Pedido.objects.filter(id__in=ids, estado='pendiente').exclude(sesion_stripe='').values_list('id', 'sesion_stripe')
+            for id_pedido, id_sesion in sesiones:
+                error = _expirar_sesion(id_sesion)
+                if error:
+                    no_cerrados.append({'id': id_pedido, 'estado': 'pendiente', 'error': error.data['error']})
+            abiertos = {fila['id'] for fila in no_cerrados}
+            ids = [id_pedido for id_pedido in ids if id_pedido not in abiertos]
+
+        movidos, rechazados = transiciones.transicionar(ids, estado, request.user)
+        return Response({
+            'movidos': movidos,
+            'rechazados': [{'id': id_pedido, 'estado': actual} for id_pedido, actual in rechazados] + no_cerrados,
+        })
+
+    @action(detail=True, methods=['get'], url_path='historial')
+    def historial(self, request, pk=None):
+        pedido = self.get_object()
+        return Response(HistorialPedidoSerializer(pedido.historial.order_by('fecha', 'id'), many=True).data)
 
     @action(detail=False, methods=['get'], url_path='todos')
     def listar_todos(self, request):
-        pedidos = Pedido.objects.all()
-        serializer = self.get_serializer(pedidos, many=True)
-        return Response(serializer.data)
+        # Paginado por (fecha_creacion, id) para no serializar todo el historial de una vez
+        pedidos = plan_queryset(Pedido.objects.all(), self.get_serializer_class())
+        page = self.paginate_queryset(pedidos)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
     
 
+def _parametros_exportacion(request):
+    formato = request.query_params.get('formato', 'ndjson')
+    if formato not in exports.FORMATOS:
+        raise ValueError('Formato no soportado, use ndjson o csv.')
+    comprimir = request.query_params.get('gzip', '').lower() in ('1', 'true', 'si')
+    return formato, comprimir
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def exportar_pedidos(request):
+    try:
+        formato, comprimir = _parametros_exportacion(request)
+        pedidos = exports.pedidos_para_exportar(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    if formato == 'csv':
+        lineas = exports.lineas_csv(pedidos, exports.COLUMNAS_PEDIDO + exports.COLUMNAS_DETALLE, exports.pedido_a_filas)
+    else:
+        lineas = exports.lineas_ndjson(pedidos, exports.pedido_a_dict)
+    return exports.respuesta_exportacion(lineas, 'pedidos', formato, comprimir)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def exportar_productos(request):
+    try:
+        formato, comprimir = _parametros_exportacion(request)
+        productos = exports.productos_para_exportar(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    if formato == 'csv':
+        lineas = exports.lineas_csv(productos, exports.COLUMNAS_PRODUCTO + exports.COLUMNAS_INVENTARIO, exports.producto_a_filas)
+    else:
+        lineas = exports.lineas_ndjson(productos, exports.producto_a_dict)
+    return exports.respuesta_exportacion(lineas, 'productos', formato, comprimir)
+
+
+def _periodo_analitica(request):
+    # Por defecto los ultimos 30 dias y los pedidos vendidos (confirmados, enviados y entregados)
+    try:
+        hasta = parse_date(request.query_params['hasta']) if request.query_params.get('hasta') else timezone.localdate()
+        desde = parse_date(request.query_params['desde']) if request.query_params.get('desde') else hasta - timedelta(days=29)
+    except (TypeError, ValueError):
+        desde = hasta = None
+    if desde is None or hasta is None:
+        raise ValueError('Fechas inválidas, use el formato AAAA-MM-DD.')
+    if desde > hasta:
+        raise ValueError('La fecha desde no puede ser posterior a hasta.')
+    # ?estado=vendido (por defecto) o una lista separada por comas: ?estado=enviado,entregado
+    estado = request.query_params.get('estado') or 'vendido'
+    estados = list(analitica.VENDIDOS) if estado == 'vendido' else estado.split(',')
+    if not all(estado in dict(Pedido.ESTADOS) for estado in estados):
+        raise ValueError('Estado inválido.')
+    return desde, hasta, estados
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def analitica_ventas(request):
+    # Se lee de los resumenes diarios: el costo depende del rango pedido, no del historial
+    try:
+        desde, hasta, estados = _periodo_analitica(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    agrupar = request.query_params.get('agrupar', 'dia')
+    if agrupar not in analitica.AGRUPACIONES:
+        return Response({'error': 'Agrupación inválida, use dia, producto o categoria.'}, status=400)
+    return Response({
+        'desde': desde,
+        'hasta': hasta,
+        'estados': estados,
+        'agrupar': agrupar,
+        'resultados': analitica.ventas(desde, hasta, estados, agrupar),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def analitica_pedidos(request):
+    try:
+        desde, hasta, estados = _periodo_analitica(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+    return Response({'desde': desde, 'hasta': hasta, 'estados': estados, **analitica.pedidos_por_dia(desde, hasta, estados)})
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def planificar_despacho(request):
+    # {"sucursal": id, "capacidad": n, "despachar": true}; sin despachar solo devuelve el plan
+    try:
+        sucursal = int(request.data['sucursal']) if request.data.get('sucursal') is not None else None
+        capacidad = int(request.data['capacidad']) if request.data.get('capacidad') is not None else None
+    except (TypeError, ValueError):
+        return Response({'error': 'Datos inválidos.'}, status=400)
+    if capacidad is not None and capacidad < 1:
+        return Response({'error': 'La capacidad debe ser mayor a cero.'}, status=400)
+
+    lotes, sin_ubicacion = despacho.planificar(sucursal, capacidad)
+    respuesta = {'lotes': lotes, 'sin_ubicacion': sin_ubicacion}
+    if request.data.get('despachar') is True:
+        respuesta['despachados'] = despacho.despachar([id_pedido for lote in lotes for id_pedido in lote['pedidos']], request.user)
+    return Response(respuesta)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def iniciar_pago(request):
@@ -182,48 +542,14 @@ def iniciar_pago(request):
     
     if not carrito:
         return Response({'error': 'Carrito no válido'}, status=400)
-
-    # Crear pedido pendiente
-    items_carrito = DetalleCarrito.objects.filter(id_carrito=id_carrito, eliminado=False).select_related('id_producto')
-    if not items_carrito.exists():
+    if carrito.cantidad_items == 0:
         return Response({'error': 'El carrito está vacío, no se puede crear el pedido.'}, status=400)
 
-    total_carrito = sum(item.cantidad * item.id_producto.precio for item in items_carrito)
-    total_carrito = Decimal(total_carrito).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-
-    if total_carrito == 0:
-        return Response({'error': 'El carrito está vacío o con items que no tienen valor.'}, status=400);
-
-    # crear pedido y detalles
-    pedido = Pedido.objects.create(
-        id_usuario=request.user,
-        id_carrito=carrito,
-        monto_total=total_carrito,
-        direccion_entrega=request.data.get('direccion'),
-        estado="pendiente",
-        latitud=request.data.get('latitud'),
-        longitud=request.data.get('longitud')
-    )
-
-    detalles_pedido = [
-        DetallePedido(
-            id_pedido=pedido,
-            id_producto=item.id_producto,
-            cantidad=item.cantidad,
-            precio=item.id_producto.precio,
-            precio_total=item.id_producto.precio * item.cantidad
-        )
-        for item in items_carrito
-    ]
-    DetallePedido.objects.bulk_create(detalles_pedido)
-    '''for item in DetalleCarrito.objects.filter(id_carrito=id_carrito): 
-        DetallePedido.objects.create(
-            id_pedido=pedido,
-            id_producto=item.id_producto,
-            cantidad=item.cantidad,
-            precio=item.id_producto.precio,
-            precio_total=item.id_producto.precio * item.cantidad
-        )'''
+    # Crear pedido pendiente
+    try:
+        pedido, expira = checkout.crear_pedido(request.user, carrito, request.data)
+    except checkout.CheckoutError as e:
+        return Response(e.data, status=e.status)
 
     # Crear Stripe Checkout Session
     #tasa_cambio = Decimal('6.97')
@@ -231,27 +557,121 @@ def iniciar_pago(request):
     
     urlFrontBase = request.data.get('url_front_base')
 
-    session = stripe.checkout.Session.create(
-        payment_method_types=['card'],
-        mode='payment',
-        line_items=[{
-            'price_data': {
-                'currency': 'bob',
-                'product_data': {
-                    'name': 'Pedido #{}'.format(pedido.id),
-                },
-                'unit_amount': int(total_carrito * 100),
-            },
-            'quantity': 1,
-        }],
-        metadata={
-            'pedido_id': pedido.id
-        },
-        success_url=urlFrontBase + '/success',
-        cancel_url=urlFrontBase + '/cancel',
+    try:
+        with metricas.medir_proveedor('checkout.sessions.create'):
+            session = cliente_stripe().checkout.sessions.create(
+                params=parametros_sesion(pedido, pedido.monto_total, urlFrontBase, expira)
+            )
+    except stripe.error.StripeError:
+        checkout.cancelar_pedido(pedido)
+        return Response({'error': 'No se pudo iniciar el pago.'}, status=502)
+
+    Pedido.objects.filter(id=pedido.id).update(sesion_stripe=session.id)
+    return Response({'sessionId': session.id})
+
+
+async def _usuario_jwt(request):
+    try:
+        autenticado = await sync_to_async(autenticacion.CachedJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return autenticado[0] if autenticado else None
+
+
+@csrf_exempt
+async def iniciar_pago_async(request):
+    # Version async de iniciar_pago para ASGI: no ocupa un worker mientras espera a Stripe
+    if request.method != 'POST':
+        return JsonResponse({'detail': 'Método no permitido.'}, status=405)
+
+    usuario = await _usuario_jwt(request)
+    if usuario is None:
+        return JsonResponse({'detail': 'Las credenciales de autenticación no se proveyeron.'}, status=401)
+
+    try:
+        datos = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+
+    id_carrito = datos.get('id_carrito')
+    carrito = await Carrito.objects.filter(id=id_carrito, id_usuario=usuario, eliminado=False).afirst()
+    if not carrito:
+        return JsonResponse({'error': 'Carrito no válido'}, status=400)
+    if carrito.cantidad_items == 0:
+        return JsonResponse({'error': 'El carrito está vacío, no se puede crear el pedido.'}, status=400)
+
+    try:
+        pedido, expira = await sync_to_async(checkout.crear_pedido)(usuario, carrito, datos)
+    except checkout.CheckoutError as e:
+        return JsonResponse(e.data, status=e.status)
+
+    try:
+        with metricas.medir_proveedor('checkout.sessions.create'):
+            session = await cliente_stripe().checkout.sessions.create_async(
+                params=parametros_sesion(pedido, pedido.monto_total, datos.get('url_front_base'), expira)
+            )
+    except stripe.error.StripeError:
+        await sync_to_async(checkout.cancelar_pedido)(pedido)
+        return JsonResponse({'error': 'No se pudo iniciar el pago.'}, status=502)
+
+    await Pedido.objects.filter(id=pedido.id).aupdate(sesion_stripe=session.id)
+    return JsonResponse({'sessionId': session.id})
+
+
+def _json_o_none(request):
+    try:
+        datos = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return datos if isinstance(datos, dict) else None
+
+
+@csrf_exempt
+async def login_async(request):
+    # Login para ASGI: el hash de la password corre en el pool de quickstart.hashing, no en el event loop
+    if request.method != 'POST':
+        return JsonResponse({'detail': 'Método no permitido.'}, status=405)
+    datos = _json_o_none(request)
+    if datos is None:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+    username, password = datos.get('username'), datos.get('password')
+    if not username or not password:
+        return JsonResponse({'error': 'Se requieren username y password.'}, status=400)
+
+    credenciales_invalidas = JsonResponse(
+        {'detail': str(TokenObtainSerializer.default_error_messages['no_active_account'])}, status=401
     )
+    usuario = await User.objects.filter(**{User.USERNAME_FIELD: username}).afirst()
+    if usuario is None:
+        # Igual que ModelBackend: se hashea igual para no revelar por tiempo que el usuario no existe
+        await hashing.hashear(password)
+        return credenciales_invalidas
+    valida, rehash = await hashing.verificar(password, usuario.password)
+    if not valida or not usuario.is_active:
+        return credenciales_invalidas
+    if rehash:
+        usuario.password = await hashing.hashear(password)
+        await usuario.asave(update_fields=['password'])
+
+    respuesta = await sync_to_async(CustomTokenObtainPairSerializer.tokens_para)(usuario, {'request': request})
+    return JsonResponse(respuesta)
 
-    return Response({'sessionId': session.id})
+
+@csrf_exempt
+async def registro_async(request):
+    if request.method != 'POST':
+        return JsonResponse({'detail': 'Método no permitido.'}, status=405)
+    datos = _json_o_none(request)
+    if datos is None:
+        return JsonResponse({'error': 'JSON inválido'}, status=400)
+
+    serializer = RegisterSerializer(data=datos)
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, status=400)
+    hasheado = await hashing.hashear(serializer.validated_data['password'])
+    usuario = await sync_to_async(serializer.save)(password_hasheado=hasheado)
+    respuesta = await sync_to_async(CustomTokenObtainPairSerializer.tokens_para)(usuario, {'request': request})
+    return JsonResponse(respuesta, status=201)
 
 
 @csrf_exempt
@@ -267,29 +687,9 @@ def stripe_webhook(request):
     except (ValueError, stripe.error.SignatureVerificationError) as e:
         return HttpResponse(status=400)
 
-    if event['type'] not in ['checkout.session.completed', 'checkout.session.expired']:
+    if event['type'] not in eventos_stripe.TIPOS_PROCESADOS:
         return HttpResponse(status=200)
 
-    session = event['data']['object']
-    pedido_id = session['metadata']['pedido_id']
-
-    try:
-        pedido = Pedido.objects.get(id=pedido_id)
-    except Pedido.DoesNotExist:
-        return HttpResponse(status=404)
-
-    if event['type'] == 'checkout.session.completed':
-        pedido.estado = 'confirmado'
-        pedido.save()
-
-        if pedido.id_carrito:
-            carrito = pedido.id_carrito
-            if not carrito.eliminado:
-                carrito.delete()
-                nuevo_carrito = Carrito.objects.create(id_usuario=pedido.id_usuario, fecha_creacion=timezone.now())
-
-    elif event['type'] == 'checkout.session.expired':
-        pedido.estado = 'cancelado'
-        pedido.save()
-
-    return HttpResponse(status=200)
\ No newline at end of file
+    # Solo se encola; el comando procesar_eventos_stripe aplica los cambios
+    eventos_stripe.registrar_evento(event)
+    return HttpResponse(status=200)